@@ -0,0 +1,104 @@
+"""Password hashing off the request thread, and token-bucket rate limiting for sign-ins.
+
+PasswordHasher runs werkzeug's KDFs (scrypt or pbkdf2; the cost is part of the method string,
+e.g. 'scrypt:32768:8:1') on a small thread pool. hashlib releases the GIL while it works, so the
+pool size is how many cores sign-ins may take at once. At most max_workers + max_queued hashes
+are in flight; past that a call fails fast with HasherBusy instead of queueing without bound.
+
+RateLimiter keeps one token bucket per key (client IP, username). Buckets live in process
+memory, so with several workers each enforces the limit on its own share of the traffic.
+"""
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+HASH_METHODS = ('scrypt:', 'pbkdf2:')
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def is_password_hash(value):
+    """True for a werkzeug hash; anything else is a plaintext password from before hashing."""
+    return value.startswith(HASH_METHODS) and value.count('$') >= 2
+
+
+class PasswordHasher:
+    def __init__(self, method='scrypt:32768:8:1', max_workers=2, max_queued=16, timeout=10.0):
+        self.method = method
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='kdf')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+        self._dummy_hash = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('Too many sign-ins in progress; please try again in a moment.')
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy('Signing in is taking too long; please try again in a moment.')
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        """Checks a password against a stored hash, a legacy plaintext value, or None (no such user)."""
+        if stored is None:
+            # Pay for a hash anyway so unknown usernames can't be told apart by timing
+            self._run(self._check_dummy, password)
+            return False
+        if not is_password_hash(stored):
+            return hmac.compare_digest(stored.encode(), password.encode())
+        return self._run(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        """True for plaintext rows and hashes made with another method or cost."""
+        return not stored.startswith(self.method + '$')
+
+    def _check_dummy(self, password):
+        if self._dummy_hash is None:
+            self._dummy_hash = generate_password_hash('', self.method)
+        return check_password_hash(self._dummy_hash, password)
+
+
+class RateLimiter:
+    """Token buckets holding up to `burst` tokens each, refilled at `per_minute` tokens a minute."""
+    def __init__(self, burst, per_minute, max_keys=100_000):
+        self.burst = burst
+        self.rate = per_minute / 60
+        self.max_keys = max_keys
+        self._buckets = OrderedDict() # key -> (tokens, last update)
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """Takes a token for one attempt. Returns 0 if allowed, else the seconds until a token is back."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            # Least recently seen keys go first; a full bucket forgotten early is no loss
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
@@ -0,0 +1,12 @@
+"""Benchmarks and load tests. Each module is a standalone script; see its docstring for usage.
+
+  datagen.py                  Deterministic synthetic users, expenses, tags, receivables and budgets.
+  bench_routes.py             Latency, queries per request and peak RSS of the main routes.
+  bench_import.py             CSV import throughput.
+  bench_concurrent_writes.py  Write throughput with concurrent writer processes.
+  bench_login.py              Sign-in throughput at the configured password hashing cost.
+  bench_scheduler.py          Recurring expenses and budget rollover for many users in one run.
+  bench_currency.py           Mixed-currency imports and base currency changes.
+  bench_shards.py             Write throughput and per-user read latency against the number of shards.
+  bench_startup.py            Import time and first-request latency of a freshly started worker.
+"""
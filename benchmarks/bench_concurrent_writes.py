@@ -0,0 +1,107 @@
+"""Load test: write throughput with many concurrent writer processes.
+
+Each writer is a separate process (like a gunicorn worker) with its own user, POSTing /add
+through Flask's test client against one shared database.
+
+Usage: python benchmarks/bench_concurrent_writes.py [--writers 8] [--writes 200] [--compare-untuned]
+       EXPENSES_DATABASE_URI=postgresql://... python benchmarks/bench_concurrent_writes.py
+
+Without EXPENSES_DATABASE_URI a throwaway SQLite file is used. --compare-untuned repeats the
+run with EXPENSES_SQLITE_TUNING=0 (SQLite's default pragmas) to show what the tuning buys.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def writer(index, writes, start_event, results):
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    app = create_app()  # built in the child so each process gets its own engine and pool
+
+    client = app.test_client()
+    username = f'writer_{index}_{os.getpid()}'
+    client.post('/signup', data={'username': username, 'password': 'bench'})
+    client.post('/login', data={'username': username, 'password': 'bench'})
+
+    start_event.wait()
+    ok = failed = 0
+    latencies = []
+    for i in range(writes):
+        started = time.perf_counter()
+        response = client.post('/add', data={
+            'date': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}', 'description': f'load test {i}',
+            'amount': '125.50', 'tag': 'food'
+        })
+        latencies.append(time.perf_counter() - started)
+        if response.status_code == 302:
+            ok += 1
+        else:
+            failed += 1
+    results.put((ok, failed, latencies))
+
+
+def run(writers, writes):
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from models import db
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context('spawn')
+    start_event, results = ctx.Event(), ctx.Queue()
+    processes = [ctx.Process(target=writer, args=(i, writes, start_event, results)) for i in range(writers)]
+    for process in processes:
+        process.start()
+    time.sleep(1.0) # let every writer import the app and log in before the clock starts
+    started = time.perf_counter()
+    start_event.set()
+    collected = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    ok = sum(c[0] for c in collected)
+    failed = sum(c[1] for c in collected)
+    latencies = sorted(latency for c in collected for latency in c[2])
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    return ok, failed, elapsed, p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200, help='Writes per writer.')
+    parser.add_argument('--compare-untuned', action='store_true')
+    parser.add_argument('--tuning', choices=['on', 'off'], default='on', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare_untuned:
+        for tuning in ('off', 'on'):
+            subprocess_args = [sys.executable, __file__, '--writers', str(args.writers), '--writes', str(args.writes), '--tuning', tuning]
+            import subprocess
+            subprocess.run(subprocess_args, check=True)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if not os.environ.get('EXPENSES_DATABASE_URI'):
+            os.environ['EXPENSES_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'load.db')
+        os.environ['EXPENSES_SQLITE_TUNING'] = '1' if args.tuning == 'on' else '0'
+        ok, failed, elapsed, p95 = run(args.writers, args.writes)
+
+    label = os.environ['EXPENSES_DATABASE_URI'].split(':', 1)[0]
+    if label == 'sqlite':
+        label += ' (tuned)' if args.tuning == 'on' else ' (default pragmas)'
+    print(f"{label:<26} writers={args.writers:<3} ok={ok:<6} failed={failed:<5} "
+          f"{elapsed:7.2f}s  {ok / elapsed:8.1f} writes/sec  p95={p95 * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Multi-currency cost: rate loading, importing mixed-currency CSVs and switching base currency.
+
+Usage: python benchmarks/bench_currency.py [--rows 100000] [--currencies 6] [--days 365]
+
+A throwaway SQLite database gets a year of synthetic weekday rates (wide, ECB-style file) for
+--currencies currencies. One user then imports --rows expenses spread over those currencies and
+days, and switches base currency twice. Each step reports its time and the number of distinct
+rate lookups the memoized RateTable actually made, which stays at currencies x days however
+many rows there are. The aggregates are verified against the raw rows at the end.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CURRENCIES = ['USD', 'INR', 'GBP', 'JPY', 'AUD', 'CAD', 'CHF', 'SGD']
+TAGS = ["food", "college", "utilities", "transport", "other"]
+
+
+def write_rates(path, currencies, days, today, rng):
+    with open(path, 'w', newline='') as f:
+        f.write('Date,' + ','.join(currencies) + '\n')
+        levels = {currency: rng.uniform(0.5, 150) for currency in currencies}
+        for offset in range(days + 7):
+            day = today - timedelta(days=offset)
+            if day.weekday() >= 5: # no fixing at weekends, as in the ECB file
+                continue
+            f.write(day.isoformat() + ',' + ','.join(f'{levels[c] * rng.uniform(0.98, 1.02):.4f}' for c in currencies) + '\n')
+
+
+def write_expenses(path, rows, currencies, days, today, rng):
+    with open(path, 'w', newline='') as f:
+        f.write('Date,Description,Amount,Tag,Currency\n')
+        for i in range(rows):
+            day = today - timedelta(days=rng.randrange(days))
+            f.write(f'{day.isoformat()},Purchase #{i},{rng.uniform(1, 5000):.2f},{rng.choice(TAGS)},{rng.choice(currencies)}\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--currencies', type=int, default=6, help=f'How many of {", ".join(CURRENCIES)}.')
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    today = date.today()
+    currencies = CURRENCIES[:args.currencies]
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.setdefault('EXPENSES_DATABASE_URI', 'sqlite:///' + os.path.join(workdir, 'currency.db'))
+        os.environ['EXPENSES_CACHE_ENABLED'] = '0'
+        rates_path, csv_path = os.path.join(workdir, 'rates.csv'), os.path.join(workdir, 'expenses.csv')
+        write_rates(rates_path, currencies, args.days, today, rng)
+        write_expenses(csv_path, args.rows, currencies, args.days, today, rng)
+        sys.path.insert(0, ROOT)
+        from app import create_app
+        from csv_io import import_expenses_csv
+        from extensions import exchange_rates
+        from models import db, User, Tag
+        from services import load_rates, change_base_currency, rebuild_aggregates
+        app = create_app()
+
+        with app.app_context():
+            db.create_all()
+            user = User(username='currency_bench', password='x', base_currency='INR')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add_all([Tag(name=name, user_id=user.id) for name in TAGS])
+            db.session.commit()
+
+            started = time.perf_counter()
+            loaded = load_rates(rates_path)
+            print(f"load-rates      {time.perf_counter() - started:7.2f}s  {loaded} rates")
+
+            started = time.perf_counter()
+            with open(csv_path, 'rb') as f:
+                report = import_expenses_csv(user.id, f)
+            elapsed = time.perf_counter() - started
+            print(f"import          {elapsed:7.2f}s  {report['imported']} rows ({report['imported'] / elapsed:,.0f}/s), "
+                  f"{len(exchange_rates._lookups)} rate lookups")
+
+            for currency in ('EUR', currencies[0]):
+                exchange_rates.clear()
+                started = time.perf_counter()
+                change_base_currency(db.session.get(User, user.id), currency)
+                print(f"base -> {currency}      {time.perf_counter() - started:7.2f}s  "
+                      f"{len(exchange_rates._lookups)} rate lookups")
+
+            print(f"aggregates verified: {len(rebuild_aggregates(verify_only=True))} mismatches")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Measures CSV import throughput (rows/sec) of the streaming importer.
+
+Usage: python benchmarks/bench_import.py [--rows 10000 100000 1000000] [--batch-size 5000]
+
+Each run imports into a fresh temporary SQLite database, so expenses.db is never touched.
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+TAGS = ["food", "college", "utilities", "transport", "other"]
+
+
+def write_csv(path, rows, bad_ratio=0.01, seed=42):
+    """Writes a bank-export style CSV with a small share of invalid rows."""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        f.write("Date,Description,Amount,Tag\n")
+        for i in range(rows):
+            date = f"20{20 + i % 5}-{1 + i % 12:02d}-{1 + i % 28:02d}"
+            amount = f"{rng.uniform(1, 5000):.2f}"
+            tag = TAGS[i % len(TAGS)]
+            if rng.random() < bad_ratio:
+                amount = "n/a"
+            f.write(f'{date},"Purchase #{i}, card",{amount},{tag}\n')
+
+
+def run(rows, batch_size, workdir):
+    db_path = os.path.join(workdir, f"bench_{rows}.db")
+    csv_path = os.path.join(workdir, f"bench_{rows}.csv")
+    write_csv(csv_path, rows)
+
+    os.environ['EXPENSES_DATABASE_URI'] = 'sqlite:///' + db_path
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import create_app  # imported late so the URI above is picked up
+    from csv_io import import_expenses_csv
+    from models import db, User, Tag
+    app = create_app()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username=f"bench_{rows}", password="bench")
+        db.session.add(user)
+        db.session.flush()
+        for name in TAGS:
+            db.session.add(Tag(name=name, user_id=user.id))
+        db.session.commit()
+
+        start = time.perf_counter()
+        with open(csv_path, 'rb') as f:
+            report = import_expenses_csv(user.id, f, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        db.session.remove()
+        db.engine.dispose()
+
+    return report, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    # The app binds its engine at import time, so each size runs in a fresh interpreter
+    if len(args.rows) > 1:
+        for rows in args.rows:
+            subprocess.run([sys.executable, __file__, '--rows', str(rows), '--batch-size', str(args.batch_size)], check=True)
+        return
+
+    rows = args.rows[0]
+    with tempfile.TemporaryDirectory() as workdir:
+        report, elapsed = run(rows, args.batch_size, workdir)
+    print(f"{rows:>9} rows  imported={report['imported']:<9} rejected={report['rejected']:<7} "
+          f"{elapsed:8.2f}s  {report['imported'] / elapsed:10.0f} rows/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Sign-in throughput at the configured password hashing cost.
+
+Usage: python benchmarks/bench_login.py [--threads 8] [--seconds 10] [--methods scrypt:16384:8:1 ...]
+       EXPENSES_PASSWORD_HASH_METHOD=pbkdf2:sha256:600000 python benchmarks/bench_login.py
+
+First the raw KDF is timed for each --methods entry (default: the configured method and a few
+common alternatives), single-threaded, to show what each cost means per hash on this machine.
+Then --threads clients log in as their own users through Flask's test client for --seconds
+against a throwaway SQLite database, and logins per second, p50/p95 latency and the number of
+503s (hash pool full) are reported. Rate limiting is switched off for the run, since every
+client shares one address.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KDF_SAMPLES = 5
+DEFAULT_METHODS = ['scrypt:16384:8:1', 'scrypt:32768:8:1', 'pbkdf2:sha256:600000']
+
+
+def cpu_count():
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+
+
+def time_kdf(method, samples=KDF_SAMPLES):
+    from werkzeug.security import generate_password_hash
+    started = time.perf_counter()
+    for _ in range(samples):
+        generate_password_hash('benchmark password', method)
+    return (time.perf_counter() - started) / samples * 1000
+
+
+def run_logins(threads, seconds):
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from extensions import password_hasher
+    from models import db, User
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        password_hash = password_hasher.hash('bench')
+        db.session.execute(User.__table__.insert(),
+                           [{'username': f'login_{i}', 'password': password_hash} for i in range(threads)])
+        db.session.commit()
+
+    start_event = threading.Event()
+    deadline = [0.0]
+    results = []
+
+    def client_loop(index):
+        client = app.test_client()
+        latencies, busy, failed = [], 0, 0
+        start_event.wait()
+        while time.perf_counter() < deadline[0]:
+            started = time.perf_counter()
+            response = client.post('/login', data={'username': f'login_{index}', 'password': 'bench'})
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code == 503:
+                busy += 1
+            elif response.status_code != 302:
+                failed += 1
+        results.append((latencies, busy, failed))
+
+    workers = [threading.Thread(target=client_loop, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    started = time.perf_counter()
+    deadline[0] = started + seconds
+    start_event.set()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for r in results for latency in r[0])
+    busy = sum(r[1] for r in results)
+    failed = sum(r[2] for r in results)
+    ok = len(latencies) - busy - failed
+    return {
+        'method': password_hasher.method,
+        'pool': app.config['PASSWORD_HASH_WORKERS'],
+        'logins_per_second': ok / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] if latencies else 0.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+        'busy': busy,
+        'failed': failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent clients.')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--methods', nargs='+', help='KDF methods to time (default: configured plus common ones).')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.setdefault('EXPENSES_DATABASE_URI', 'sqlite:///' + os.path.join(workdir, 'login.db'))
+        os.environ['EXPENSES_RATE_LIMIT'] = '0'
+        sys.path.insert(0, ROOT)
+        from config import Config
+
+        methods = args.methods or list(dict.fromkeys([Config.PASSWORD_HASH_METHOD] + DEFAULT_METHODS))
+        print(f"{cpu_count()} CPUs\n\n  {'method':<26} {'ms/hash':>8} {'hashes/s/core':>14}")
+        for method in methods:
+            ms = time_kdf(method)
+            print(f"  {method:<26} {ms:8.1f} {1000 / ms:14.1f}")
+
+        result = run_logins(args.threads, args.seconds)
+    print(f"\n{args.threads} clients logging in for {args.seconds:g}s with {result['method']} "
+          f"on a pool of {result['pool']}:")
+    print(f"  {result['logins_per_second']:.1f} logins/s, p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+          f"{result['busy']} refused as busy, {result['failed']} failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""Latency, queries per request and peak RSS of the main routes at several data sizes.
+
+Usage: python benchmarks/bench_routes.py [--sizes 1000 100000 1000000] [--users 10] [--requests 50]
+                                         [--output results.json] [--baseline old.json] [--cache]
+
+For every size a throwaway SQLite database is seeded with that many expenses in total (spread
+over --users users, see datagen.py) and the routes are driven through Flask's test client as
+the first user. Each route reports p50/p95/p99 latency, SQL statements per request and the
+process' peak RSS once the route has run (a high-water mark, so it only ever grows).
+
+Results are written as JSON (by default to benchmarks/results/). With --baseline the run is
+compared route by route against an earlier results file and the script exits with status 1 if
+any p95 grew by more than --threshold percent or any route now runs more queries.
+
+The response cache is off unless --cache is given, so the numbers measure the real work.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WARMUP_REQUESTS = 3
+UPLOAD_ROWS = 100
+SEARCH_QUERIES = ['groc', 'din', 'elec bill', 'meera', 'co']
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def upload_csv_bytes(rng, tags):
+    lines = ["Date,Description,Amount,Tag"]
+    for i in range(UPLOAD_ROWS):
+        day = date.today() - timedelta(days=rng.randrange(365))
+        lines.append(f'{day.isoformat()},"Imported #{i}",{rng.uniform(1, 5000):.2f},{rng.choice(tags)}')
+    return ("\n".join(lines) + "\n").encode()
+
+
+def build_scenarios(expense_ids, rng):
+    """(name, expected status, request factory) for every benchmarked route."""
+    today = date.today()
+    month_start = today.replace(day=1)
+    previous_end = month_start - timedelta(days=1)
+    comparison_params = {
+        'p1_start': previous_end.replace(day=1).isoformat(), 'p1_end': previous_end.isoformat(),
+        'p2_start': month_start.isoformat(), 'p2_end': today.isoformat(),
+    }
+    csv_bytes = upload_csv_bytes(rng, ["food", "college", "utilities", "transport", "other"])
+
+    def add_expense_data():
+        return {'date': today.isoformat(), 'description': 'bench add', 'amount': f'{rng.uniform(1, 5000):.2f}', 'tag': 'food'}
+
+    etags = {}
+
+    def revalidate(path):
+        # Sends back the ETag of a first fetch, as a browser revalidating its copy does
+        def send(client):
+            if path not in etags:
+                etags[path] = client.get(path).headers['ETag']
+            return client.get(path, headers={'If-None-Match': etags[path]})
+        return send
+
+    # Read-only routes first so the write scenarios don't change what they measure
+    return [
+        ('dashboard', 200, lambda client: client.get('/dashboard')),
+        ('reports', 200, lambda client: client.get('/reports')),
+        ('api_expenses', 200, lambda client: client.get('/api/v1/expenses')),
+        ('api_expenses_304', 304, revalidate('/api/v1/expenses')),
+        ('api_chart', 200, lambda client: client.get('/api/v1/chart')),
+        ('api_chart_304', 304, revalidate('/api/v1/chart')),
+        ('get_comparison_data', 200, lambda client: client.get('/get_comparison_data', query_string=comparison_params)),
+        ('get_expense', 200, lambda client: client.get(f'/expense/get/{rng.choice(expense_ids)}')),
+        ('expense_search', 200, lambda client: client.get('/expenses/search', query_string={'q': rng.choice(SEARCH_QUERIES)})),
+        ('add_expense', 302, lambda client: client.post('/add', data=add_expense_data())),
+        # Measures the enqueue; the import itself runs on the job workers
+        ('upload_csv', 202, lambda client: client.post(
+            '/upload', data={'csv_file': (io.BytesIO(csv_bytes), 'bench.csv')},
+            headers={'Accept': 'application/json'}, content_type='multipart/form-data')),
+    ]
+
+
+def run_size(total_expenses, users, requests, seed):
+    """Seeds a fresh database and benchmarks every route against it. Runs in its own interpreter."""
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from models import db
+    from benchmarks.datagen import seed_database, bench_username, BENCH_PASSWORD
+    from instrumentation import query_budget
+    app = create_app()
+
+    expenses_per_user = max(1, total_expenses // users)
+    started = time.perf_counter()
+    with app.app_context():
+        summary = seed_database(users, expenses_per_user, seed=seed)
+        engine = db.engine
+    seed_seconds = time.perf_counter() - started
+    result = {
+        'expenses': summary['expenses'], 'users': users, 'receivables': summary['receivables'],
+        'seed_seconds': round(seed_seconds, 2), 'peak_rss_mb_after_seed': peak_rss_mb(), 'routes': {},
+    }
+
+    client = app.test_client()
+    client.post('/login', data={'username': bench_username(1), 'password': BENCH_PASSWORD})
+    rng = random.Random(seed)
+    expense_ids = list(range(1, expenses_per_user + 1))
+
+    for name, expected_status, send in build_scenarios(expense_ids, rng):
+        for _ in range(WARMUP_REQUESTS):
+            send(client)
+        latencies, queries, errors = [], [], 0
+        for _ in range(requests):
+            with query_budget(engine) as counter:
+                request_started = time.perf_counter()
+                response = send(client)
+                latencies.append((time.perf_counter() - request_started) * 1000)
+            queries.append(counter.count)
+            if response.status_code != expected_status:
+                errors += 1
+        latencies.sort()
+        result['routes'][name] = {
+            'requests': requests,
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'queries_per_request': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+    return result
+
+
+def compare(baseline, current, threshold):
+    """Prints p95 and query-count changes per (size, route); returns the regressions found."""
+    old_runs = {run['expenses']: run for run in baseline['runs']}
+    regressions = []
+    for run in current['runs']:
+        old = old_runs.get(run['expenses'])
+        if old is None:
+            continue
+        print(f"\n{run['expenses']} expenses vs baseline")
+        for name, stats in run['routes'].items():
+            old_stats = old['routes'].get(name)
+            if old_stats is None:
+                continue
+            change = (stats['p95_ms'] - old_stats['p95_ms']) / old_stats['p95_ms'] * 100 if old_stats['p95_ms'] else 0.0
+            flags = []
+            if change > threshold:
+                flags.append('SLOWER')
+            if stats['max_queries'] > old_stats['max_queries']:
+                flags.append('MORE QUERIES')
+            if flags:
+                regressions.append((run['expenses'], name, flags))
+            print(f"  {name:<22} p95 {old_stats['p95_ms']:9.2f} -> {stats['p95_ms']:9.2f} ms ({change:+6.1f}%)  "
+                  f"queries {old_stats['max_queries']:>3} -> {stats['max_queries']:<3} {' '.join(flags)}")
+    return regressions
+
+
+def print_run(run):
+    print(f"\n{run['expenses']} expenses, {run['users']} users (seeded in {run['seed_seconds']}s, "
+          f"peak RSS {run['peak_rss_mb_after_seed']} MB)")
+    print(f"  {'route':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'RSS MB':>8} {'errors':>7}")
+    for name, stats in run['routes'].items():
+        print(f"  {name:<22} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f} "
+              f"{stats['queries_per_request']:8.1f} {stats['peak_rss_mb'] or 0:8.1f} {stats['errors']:7}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000], help='Total expenses per run.')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=50, help='Timed requests per route.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cache', action='store_true', help='Leave the response cache on.')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/routes-<timestamp>.json).')
+    parser.add_argument('--baseline', help='Earlier results file to compare against.')
+    parser.add_argument('--threshold', type=float, default=20.0, help='p95 growth (%%) reported as a regression.')
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_output:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.environ['EXPENSES_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+            os.environ['EXPENSES_CACHE_ENABLED'] = '1' if args.cache else '0'
+            os.environ['EXPENSES_JOBS_PATH'] = os.path.join(workdir, 'jobs.db')
+            os.environ['EXPENSES_JOBS_SPOOL'] = os.path.join(workdir, 'job_files')
+            # Every timed upload queues a job; don't let the per-user limit turn them into 429s
+            os.environ['EXPENSES_JOBS_MAX_PENDING_PER_USER'] = str(args.requests + WARMUP_REQUESTS)
+            result = run_size(args.sizes[0], args.users, args.requests, args.seed)
+        with open(args.child_output, 'w') as f:
+            json.dump(result, f)
+        return 0
+
+    # The app binds its engine at import time, so each size runs in a fresh interpreter
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            child_output = os.path.join(workdir, f'{size}.json')
+            command = [sys.executable, __file__, '--sizes', str(size), '--users', str(args.users),
+                       '--requests', str(args.requests), '--seed', str(args.seed), '--child-output', child_output]
+            if args.cache:
+                command.append('--cache')
+            subprocess.run(command, check=True)
+            with open(child_output) as f:
+                runs.append(json.load(f))
+            print_run(runs[-1])
+
+    results = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'requests_per_route': args.requests,
+            'cache': args.cache,
+            'seed': args.seed,
+        },
+        'runs': runs,
+    }
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"routes-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found.")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Scheduler throughput: budget rollover plus recurring expenses for many users in one run.
+
+Usage: python benchmarks/bench_scheduler.py [--users 100000] [--catch-up-months 1] [--batch-size 1000]
+
+Every user gets the default tags, a monthly budget and one monthly recurring expense that
+started --catch-up-months months ago and has never run, as after that much downtime. A
+throwaway SQLite database is seeded directly, then the scheduler runs once as of today (each
+user catches up on every missed month and their budget periods are opened), and once more to
+show that a repeat run finds nothing to do.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TAGS = ["food", "college", "utilities", "transport", "other"]
+
+
+def seed(users, catch_up_months, today):
+    from models import db, User, Tag, Budget, RecurringExpense
+
+    month_index = today.year * 12 + today.month - 1 - catch_up_months
+    start = date(month_index // 12, month_index % 12 + 1, 1)
+    db.create_all()
+    for first in range(1, users + 1, 10000):
+        ids = range(first, min(first + 10000, users + 1))
+        db.session.execute(User.__table__.insert(), [{'id': i, 'username': f'sched_{i}', 'password': 'x'} for i in ids])
+        db.session.execute(Tag.__table__.insert(), [{'user_id': i, 'name': name, 'expense_count': 0}
+                                                    for i in ids for name in DEFAULT_TAGS])
+        db.session.execute(Budget.__table__.insert(), [{'user_id': i, 'amount_minor': 2_000_000, 'period': 'monthly'}
+                                                       for i in ids])
+        db.session.execute(RecurringExpense.__table__.insert(), [
+            {'user_id': i, 'description': 'Rent', 'amount_minor': 1_500_000, 'tag': 'utilities', 'frequency': 'monthly',
+             'start_date': start.replace(day=1 + i % 28), 'occurrences': 0, 'next_date': start.replace(day=1 + i % 28)}
+            for i in ids
+        ])
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--catch-up-months', type=int, default=1, help='Months of missed runs to catch up on.')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.setdefault('EXPENSES_DATABASE_URI', 'sqlite:///' + os.path.join(workdir, 'scheduler.db'))
+        os.environ['EXPENSES_CACHE_ENABLED'] = '0'
+        sys.path.insert(0, ROOT)
+        from app import create_app
+        from services import run_scheduled_tasks, rebuild_aggregates
+        app = create_app()
+
+        app.config['RECURRING_BATCH_SIZE'] = args.batch_size
+        today = date.today()
+        with app.app_context():
+            started = time.perf_counter()
+            seed(args.users, args.catch_up_months, today)
+            print(f"Seeded {args.users} users in {time.perf_counter() - started:.1f}s")
+
+            for label in ('first run', 'repeat run'):
+                started = time.perf_counter()
+                summary = run_scheduled_tasks(today)
+                elapsed = time.perf_counter() - started
+                created = summary['recurring_expenses_created']
+                print(f"{label:<11} {elapsed:7.2f}s  {created} expenses created ({created / elapsed:,.0f}/s), "
+                      f"{summary['budget_periods_opened']} budget periods opened")
+
+            if args.users <= 10_000:
+                mismatches = rebuild_aggregates(verify_only=True)
+                print(f"aggregates verified: {len(mismatches)} mismatches")
+
+
+if __name__ == '__main__':
+    main()
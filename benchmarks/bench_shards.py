@@ -0,0 +1,133 @@
+"""Load test: write throughput and per-user read latency against the number of shards.
+
+Usage: python benchmarks/bench_shards.py [--shards 0,1,2,4,8] [--writers 8] [--writes 200] [--reads 100]
+
+For each shard count (0 is the unsharded single database) a throwaway SQLite deployment is
+created and --writers processes (like gunicorn workers), each with its own user, first POST
+--writes expenses to /add at the same time. Then every process alternates one more write with a
+GET of its own /api/v1/expenses page --reads times, so each user's reads run alongside everyone
+else's writes. Reported per shard count: writes/sec and p95 write latency for the first phase,
+p50/p95 read latency for the second. Users are spread over the shards by the bucket map, as in
+production.
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, int(len(values) * fraction) - 1)] if values else 0.0
+
+
+def worker(index, writes, reads, start_event, results):
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    app = create_app()  # built in the child so each process gets its own engines and pools
+
+    client = app.test_client()
+    username = f'shard_writer_{index}'
+    client.post('/signup', data={'username': username, 'password': 'bench'})
+    client.post('/login', data={'username': username, 'password': 'bench'})
+
+    def add(i):
+        started = time.perf_counter()
+        response = client.post('/add', data={
+            'date': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}', 'description': f'load test {i}',
+            'amount': '125.50', 'tag': 'food'
+        })
+        return time.perf_counter() - started, response.status_code == 302
+
+    start_event.wait()
+    write_latencies, failed = [], 0
+    for i in range(writes):
+        latency, ok = add(i)
+        write_latencies.append(latency)
+        failed += not ok
+    write_done = time.perf_counter()
+
+    read_latencies = []
+    for i in range(reads):
+        failed += not add(writes + i)[1]
+        started = time.perf_counter()
+        response = client.get('/api/v1/expenses?limit=50')
+        read_latencies.append(time.perf_counter() - started)
+        failed += response.status_code != 200
+    results.put((write_latencies, write_done, read_latencies, failed))
+
+
+def run(shards, writers, writes, reads):
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from extensions import get_shard_router
+    from models import db
+    app = create_app()
+    with app.app_context():
+        shard_router = get_shard_router()
+        db.create_all()
+        if shard_router:
+            for shard in shard_router.shards(): # create every shard's tables before the workers race to
+                shard_router.engine(shard)
+            shard_router.dispose()
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context('spawn')
+    start_event, results = ctx.Event(), ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(i, writes, reads, start_event, results)) for i in range(writers)]
+    for process in processes:
+        process.start()
+    time.sleep(2.0) # let every worker import the app and log in before the clock starts
+    started = time.perf_counter()
+    start_event.set()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    write_latencies = [latency for c in collected for latency in c[0]]
+    write_elapsed = max(c[1] for c in collected) - started
+    read_latencies = [latency for c in collected for latency in c[2]]
+    failed = sum(c[3] for c in collected)
+    label = 'unsharded' if not shards else f'{shards} shard' + ('s' if shards > 1 else '')
+    print(f"{label:<11} writers={writers:<3} {len(write_latencies) / write_elapsed:8.1f} writes/sec  "
+          f"write p95={percentile(write_latencies, 0.95) * 1000:7.1f} ms  "
+          f"read p50={percentile(read_latencies, 0.5) * 1000:6.1f} ms  p95={percentile(read_latencies, 0.95) * 1000:6.1f} ms  "
+          f"failed={failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', default='0,1,2,4,8', help='Comma-separated shard counts; 0 is unsharded.')
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200, help='Writes per writer in the write phase.')
+    parser.add_argument('--reads', type=int, default=100, help='Read/write pairs per writer in the mixed phase.')
+    parser.add_argument('--run', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is None:
+        # One fresh process per shard count, since the app reads its configuration at import
+        for shards in (int(value) for value in args.shards.split(',')):
+            subprocess.run([sys.executable, __file__, '--run', str(shards), '--writers', str(args.writers),
+                            '--writes', str(args.writes), '--reads', str(args.reads)], check=True)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.update({
+            'EXPENSES_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'main.db'),
+            'EXPENSES_SHARDS': str(args.run),
+            'EXPENSES_SHARD_URI': 'sqlite:///' + os.path.join(workdir, 'shard-{shard}.db'),
+            'EXPENSES_JOBS_PATH': os.path.join(workdir, 'jobs.db'),
+            'EXPENSES_JOBS_IN_PROCESS': '0',
+            'EXPENSES_CACHE_ENABLED': '0',
+            'EXPENSES_RATE_LIMIT': '0',
+        })
+        run(args.run, args.writers, args.writes, args.reads)
+
+
+if __name__ == '__main__':
+    main()
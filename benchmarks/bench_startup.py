@@ -0,0 +1,204 @@
+"""Cold start: time to import the app and latency of the first requests a new worker serves.
+
+Usage: python benchmarks/bench_startup.py [--runs 10] [--output results.json] [--baseline old.json]
+                                          [--threshold 20]
+
+Every run is a fresh interpreter, like a gunicorn worker booting: it times importing app and
+building it with create_app() (which creates missing tables and precompiles templates), then the
+first GET of /dashboard and /reports and a second, warm /dashboard; cold start is the import
+plus the first /dashboard, the wait of a user whose request lands on the new worker. Three
+template setups are compared, taking turns so that drift in machine load hits all three alike:
+  lazy         nothing precompiled; each template is compiled by the first request that renders it;
+  precompiled  index.html and reports.html compiled while the app starts;
+  bytecode     precompiled, loading the compiled code another worker already left in the template cache.
+The database (one user with some expenses) is set up once beforehand, so no run pays for
+creating tables. Reported per setup: the median over --runs of each timing, and which of the
+lazily imported modules (csv_io, the PostgreSQL dialect) were loaded by the import.
+
+Results are written as JSON (by default to benchmarks/results/). With --baseline the script
+exits with status 1 if any setup's median cold start or first /dashboard grew by more than
+--threshold percent.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERNAME = 'startup_bench'
+EXPENSES = 200
+LAZY_MODULES = ('csv_io', 'sqlalchemy.dialects.postgresql')
+TIMINGS = ('cold_start_ms', 'import_ms', 'first_dashboard_ms', 'first_reports_ms', 'warm_dashboard_ms')
+
+
+def setups(workdir):
+    """Environment of each template setup."""
+    return {
+        'lazy': {'EXPENSES_PRECOMPILED_TEMPLATES': '', 'EXPENSES_TEMPLATE_CACHE': ''},
+        'precompiled': {'EXPENSES_TEMPLATE_CACHE': ''},
+        'bytecode': {'EXPENSES_TEMPLATE_CACHE': os.path.join(workdir, 'template_cache')},
+    }
+
+
+def prepare():
+    """Creates the tables and the benchmark user; returns the user's id."""
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from models import db, User, Tag, Expense
+    from services import rebuild_aggregates
+    app = create_app()
+
+    with app.app_context():
+        user = User(username=USERNAME, password='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Tag(name='food', user_id=user.id))
+        start = date.today() - timedelta(days=EXPENSES)
+        db.session.add_all([
+            Expense(date=start + timedelta(days=i), description=f'startup {i}', total_amount_minor=1000 + i,
+                    own_amount_minor=1000 + i, tag='food', user_id=user.id)
+            for i in range(EXPENSES)
+        ])
+        db.session.commit()
+        rebuild_aggregates(user.id)
+        return user.id
+
+
+def measure(user_id):
+    """One cold start, timed from the import of the app to create_app() returning."""
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    from app import create_app
+    app = create_app()
+    result = {'import_ms': (time.perf_counter() - started) * 1000,
+              'lazy_modules_loaded': [name for name in LAZY_MODULES if name in sys.modules]}
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    for name, url in (('first_dashboard_ms', '/dashboard'), ('first_reports_ms', '/reports'),
+                      ('warm_dashboard_ms', '/dashboard')):
+        started = time.perf_counter()
+        response = client.get(url)
+        result[name] = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            raise SystemExit(f'GET {url} returned {response.status_code}')
+    result['cold_start_ms'] = result['import_ms'] + result['first_dashboard_ms']
+    return result
+
+
+def run_child(args, env):
+    """Runs this script in a fresh interpreter with env added; returns what the child wrote."""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        child_output = f.name
+    try:
+        command = [sys.executable, __file__, '--child', args, '--child-output', child_output]
+        subprocess.run(command, check=True, env=dict(os.environ, **env))
+        with open(child_output) as f:
+            return json.load(f)
+    finally:
+        os.remove(child_output)
+
+
+def summarize(samples):
+    summary = {name: round(statistics.median(sample[name] for sample in samples), 2) for name in TIMINGS}
+    summary['lazy_modules_loaded'] = samples[-1]['lazy_modules_loaded']
+    return summary
+
+
+def compare(baseline, current, threshold):
+    """Prints the change of every timing per setup; returns the regressions found."""
+    regressions = []
+    for name, stats in current['setups'].items():
+        old = baseline['setups'].get(name)
+        if old is None:
+            continue
+        print(f"\n{name} vs baseline")
+        for timing in TIMINGS:
+            change = (stats[timing] - old[timing]) / old[timing] * 100 if old[timing] else 0.0
+            flag = 'SLOWER' if change > threshold and timing in ('cold_start_ms', 'first_dashboard_ms') else ''
+            if flag:
+                regressions.append((name, timing))
+            print(f"  {timing:<20} {old[timing]:9.2f} -> {stats[timing]:9.2f} ms ({change:+6.1f}%) {flag}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='Cold starts per setup.')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/startup-<timestamp>.json).')
+    parser.add_argument('--baseline', help='Earlier results file to compare against.')
+    parser.add_argument('--threshold', type=float, default=20.0, help='Growth (%%) reported as a regression.')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = prepare() if args.child == 'prepare' else measure(int(args.child))
+        with open(args.child_output, 'w') as f:
+            json.dump(result, f)
+        return 0
+
+    results = {'setups': {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {
+            'EXPENSES_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'startup.db'),
+            'EXPENSES_JOBS_PATH': os.path.join(workdir, 'jobs.db'),
+            'EXPENSES_JOBS_SPOOL': os.path.join(workdir, 'job_files'),
+            'EXPENSES_JOBS_IN_PROCESS': '0',
+            'EXPENSES_CACHE_ENABLED': '0',
+        }
+        user_id = run_child('prepare', dict(env, EXPENSES_TEMPLATE_CACHE=''))
+        setup_envs = {name: dict(env, **setup_env) for name, setup_env in setups(workdir).items()}
+        run_child(str(user_id), setup_envs['bytecode']) # the worker that fills the template cache
+        samples = {name: [] for name in setup_envs}
+        for _ in range(args.runs):
+            for name, setup_env in setup_envs.items():
+                samples[name].append(run_child(str(user_id), setup_env))
+
+    print(f"{'setup':<12} {'cold start ms':>14} {'import ms':>10} {'1st /dashboard':>15} {'1st /reports':>13} "
+          f"{'warm /dashboard':>16}  lazy modules loaded")
+    for name, setup_samples in samples.items():
+        stats = results['setups'][name] = summarize(setup_samples)
+        print(f"{name:<12} {stats['cold_start_ms']:14.1f} {stats['import_ms']:10.1f} {stats['first_dashboard_ms']:15.1f} "
+              f"{stats['first_reports_ms']:13.1f} {stats['warm_dashboard_ms']:16.1f}  "
+              f"{', '.join(stats['lazy_modules_loaded']) or 'none'}")
+
+    results['meta'] = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': args.runs,
+    }
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"startup-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found.")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""Deterministic synthetic data for benchmarks.
+
+seed_database() fills an empty database with N users, each owning M expenses spread over the
+last three years, the default tags plus a few custom ones, a budget, and receivables on a share
+of the expenses. Rows go straight in through bulk INSERTs and the aggregate tables are rebuilt
+at the end, so the result looks exactly like a database the app wrote itself. The same seed
+always produces the same rows.
+
+Usage: EXPENSES_DATABASE_URI=sqlite:////tmp/bench.db python benchmarks/datagen.py --users 10 --expenses 10000 [--reset]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TAGS = ["food", "college", "utilities", "transport", "other"]
+EXTRA_TAGS = ["rent", "health", "travel", "gifts", "subscriptions"]
+DESCRIPTIONS = ["Groceries", "Lunch", "Dinner out", "Bus pass", "Cab ride", "Electricity bill", "Internet",
+                "Textbooks", "Course fee", "Movie night", "Pharmacy", "Coffee", "Gym", "Phone recharge"]
+PEOPLE = ["Aarav", "Diya", "Kabir", "Meera", "Rohan", "Sara", "Vihaan", "Zoya"]
+SPAN_DAYS = 3 * 365
+SHARED_RATIO = 0.2 # share of expenses split with other people
+PAID_RATIO = 0.5 # share of receivables already settled
+
+BENCH_PASSWORD = 'bench'
+
+
+def bench_username(index):
+    return f'bench_user_{index}'
+
+
+def seed_database(users, expenses_per_user, seed=42, batch_size=10000, end_date=None, reset=False):
+    """Seeds users x expenses_per_user expenses and returns a summary of what was written.
+
+    Must run inside an app context. Expense ids are assigned per user in order, so user i owns
+    ids (i - 1) * expenses_per_user + 1 .. i * expenses_per_user.
+    """
+    from extensions import password_hasher
+    from models import db, User, Tag, Budget, Expense, Receivable
+    from services import rebuild_aggregates
+
+    if reset:
+        db.drop_all()
+    db.create_all()
+    if db.session.query(User.id).first() is not None:
+        raise ValueError("The database already has users; pass reset=True to start from scratch")
+
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    user_rows, tag_rows, budget_rows = [], [], []
+    # One hash shared by every user; hashing per user would dominate seeding at real KDF costs
+    password_hash = password_hasher.hash(BENCH_PASSWORD)
+    for index in range(1, users + 1):
+        user_rows.append({'id': index, 'username': bench_username(index), 'password': password_hash})
+        for name in DEFAULT_TAGS + rng.sample(EXTRA_TAGS, 2):
+            tag_rows.append({'name': name, 'user_id': index})
+        budget_rows.append({'amount_minor': rng.randrange(20_000, 80_000) * 100,
+                            'period': rng.choice(['monthly', 'weekly']), 'user_id': index})
+    db.session.execute(User.__table__.insert(), user_rows)
+    db.session.execute(Tag.__table__.insert(), tag_rows)
+    db.session.execute(Budget.__table__.insert(), budget_rows)
+    db.session.commit()
+
+    user_tags = {}
+    for row in tag_rows:
+        user_tags.setdefault(row['user_id'], []).append(row['name'])
+
+    expense_id = receivable_id = 0
+    expense_batch, receivable_batch = [], []
+
+    def flush():
+        if expense_batch:
+            db.session.execute(Expense.__table__.insert(), expense_batch)
+        if receivable_batch:
+            db.session.execute(Receivable.__table__.insert(), receivable_batch)
+        db.session.commit()
+        expense_batch.clear()
+        receivable_batch.clear()
+
+    for user_id in range(1, users + 1):
+        tags = user_tags[user_id]
+        for _ in range(expenses_per_user):
+            expense_id += 1
+            total = rng.randrange(50, 500_000)
+            own = total
+            if rng.random() < SHARED_RATIO:
+                people = rng.sample(PEOPLE, rng.randint(1, 3))
+                share = total // (len(people) + 1)
+                own = total - share * len(people)
+                for person in people:
+                    receivable_id += 1
+                    receivable_batch.append({'id': receivable_id, 'person_name': person, 'amount_minor': share,
+                                             'is_paid': rng.random() < PAID_RATIO, 'expense_id': expense_id})
+            expense_batch.append({
+                'id': expense_id,
+                'date': end_date - timedelta(days=rng.randrange(SPAN_DAYS)),
+                'description': f'{rng.choice(DESCRIPTIONS)} #{expense_id}',
+                'total_amount_minor': total,
+                'own_amount_minor': own,
+                'tag': rng.choice(tags),
+                'user_id': user_id,
+            })
+            if len(expense_batch) >= batch_size:
+                flush()
+    flush()
+
+    rebuild_aggregates()
+    return {'users': users, 'expenses': expense_id, 'receivables': receivable_id, 'tags': len(tag_rows)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--expenses', type=int, default=10000, help='Expenses per user.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--reset', action='store_true', help='Drop every table first.')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    app = create_app()
+
+    started = time.perf_counter()
+    with app.app_context():
+        summary = seed_database(args.users, args.expenses, seed=args.seed, batch_size=args.batch_size, reset=args.reset)
+    print(f"Seeded {summary['users']} users, {summary['expenses']} expenses and {summary['receivables']} receivables "
+          f"in {time.perf_counter() - started:.1f}s (log in as {bench_username(1)} / {BENCH_PASSWORD}).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Per-user response cache with TTL + LRU eviction and version-based invalidation.
+
+Entries are keyed by (namespace, user, user version, query parameters). Write paths call
+invalidate_user(), which bumps the user's version so every older entry becomes unreachable
+and simply ages out. A version_of callable adds a version kept outside the cache, such as the
+change counter the app bumps in the database with every write: then a write made by any
+process, another worker or a job on another dispatcher, retires the entries of every
+process's cache, even with the in-process backend.
+
+Two backends are provided:
+  * MemoryCacheBackend -- an in-process OrderedDict (one cache per worker).
+  * SQLiteCacheBackend -- a small SQLite file that every worker on the host can share.
+Values must be JSON-serialisable so that both backends behave the same.
+
+TagRegistry is a smaller in-process cache of each user's tags, checked on every lookup against
+a version_of callable; the app passes the database change counter, so a tag added or used by
+any process is seen by all of them on their next lookup.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_local import ThreadLocalConnections
+
+
+class MemoryCacheBackend:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # key -> (expires_at, json value)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return json.loads(value)
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, json.dumps(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_version(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def bump_version(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._connections = ThreadLocalConnections(path)
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_entry ("
+                         "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entry_last_access ON cache_entry (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_version (user_id INTEGER PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connection(self):
+        return self._connections.get()
+
+    def get(self, key):
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM cache_entry WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        with conn:
+            if expires_at <= now:
+                conn.execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE cache_entry SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value, ttl):
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO cache_entry (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                         (key, json.dumps(value), now + ttl, now))
+            conn.execute("DELETE FROM cache_entry WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM cache_entry WHERE key IN ("
+                         "SELECT key FROM cache_entry ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def get_version(self, user_id):
+        row = self._connection().execute("SELECT version FROM cache_version WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, user_id):
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT INTO cache_version (user_id, version) VALUES (?, 1) "
+                         "ON CONFLICT(user_id) DO UPDATE SET version = version + 1", (user_id,))
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM cache_entry")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM cache_entry").fetchone()[0]
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl=300, enabled=True, version_of=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.version_of = version_of
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, namespace, user_id, params):
+        version = self.backend.get_version(user_id)
+        if self.version_of is not None:
+            # Read before compute() runs, so a write landing meanwhile leaves an unreachable entry, never a stale one
+            version = f"{self.version_of(user_id)}.{version}"
+        return f"{namespace}:{user_id}:v{version}:{json.dumps(params, sort_keys=True, default=str)}"
+
+    def get_or_compute(self, namespace, user_id, params, compute):
+        """Returns the cached value for this user and params, calling compute() on a miss."""
+        if not self.enabled:
+            return compute()
+        key = self._key(namespace, user_id, params)
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            value = compute()
+            self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate_user(self, user_id):
+        self.backend.bump_version(user_id)
+
+    def stats(self):
+        """Hit/miss counters for this process, plus the number of stored entries."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': len(self.backend),
+        }
+
+
+class TagRegistry:
+    """Per-user {tag name: usage count} maps, reloaded whenever the user's cache version moves on."""
+    def __init__(self, load, version_of, max_users=4096):
+        self.load = load
+        self.version_of = version_of
+        self.max_users = max_users
+        self._entries = OrderedDict() # user_id -> (version, tags)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        # Read the version first: a write landing during load() leaves a stale version behind, never stale tags
+        version = self.version_of(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                return dict(entry[1])
+        tags = self.load(user_id)
+        with self._lock:
+            self._entries[user_id] = (version, tags)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return dict(tags)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+def create_cache(backend='memory', path=None, max_entries=1024, ttl=300, enabled=True, version_of=None):
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError("The sqlite cache backend needs a path")
+        return ResponseCache(SQLiteCacheBackend(path, max_entries), ttl=ttl, enabled=enabled, version_of=version_of)
+    if backend == 'memory':
+        return ResponseCache(MemoryCacheBackend(max_entries), ttl=ttl, enabled=enabled, version_of=version_of)
+    raise ValueError(f"Unknown cache backend '{backend}'")
@@ -0,0 +1,73 @@
+"""The app's `flask` commands, added to its CLI by register_commands()."""
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from extensions import get_shard_router, job_queue
+from models import db, create_search_index, create_tables
+from services import parse_date, load_rates, rebuild_aggregates, run_scheduled_tasks
+
+@click.command('create-tables')
+@with_appcontext
+def create_tables_command():
+    """Creates missing tables and indexes (for deployments started with EXPENSES_CREATE_TABLES=0)."""
+    create_tables()
+    click.echo('Tables created.')
+
+@click.command('load-rates')
+@click.argument('path', required=False)
+@with_appcontext
+def load_rates_command(path):
+    """Loads exchange rates from a CSV file (default EXPENSES_EXCHANGE_RATES)."""
+    path = path or current_app.config['EXCHANGE_RATES_PATH']
+    db.create_all()
+    click.echo(f'Loaded {load_rates(path)} rates from {path}.')
+
+@click.command('rebuild-aggregates')
+@click.option('--verify', is_flag=True, help='Only compare the aggregates against the raw data.')
+@click.option('--user-id', type=int, default=None, help='Limit to a single user.')
+@with_appcontext
+def rebuild_aggregates_command(verify, user_id):
+    """Rebuilds (or verifies) the per-user summary tables."""
+    mismatches = rebuild_aggregates(user_id=user_id, verify_only=verify)
+    if not verify:
+        click.echo('Aggregates rebuilt.')
+    elif mismatches:
+        for mismatch in mismatches:
+            click.echo(f'Mismatch: {mismatch}')
+        raise SystemExit(1)
+    else:
+        click.echo('Aggregates match the raw data.')
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Recreates the expense full-text index from the raw rows."""
+    shard_router = get_shard_router()
+    engines = [shard_router.engine(shard) for shard in shard_router.shards()] if shard_router else [db.engine]
+    for engine in engines:
+        with engine.begin() as connection:
+            create_search_index(connection, rebuild=True)
+    click.echo('Search index rebuilt.')
+
+@click.command('run-scheduler')
+@click.option('--date', 'run_date', default=None, help='Run as of this day (YYYY-MM-DD) instead of today.')
+@with_appcontext
+def run_scheduler_command(run_date):
+    """Rolls budget periods over and creates due recurring expenses."""
+    summary = run_scheduled_tasks(parse_date(run_date) if run_date else None)
+    click.echo(', '.join(f"{key.replace('_', ' ')}: {value}" for key, value in summary.items()))
+
+@click.command('run-jobs')
+@with_appcontext
+def run_jobs_command():
+    """Runs a dedicated background job worker until interrupted."""
+    click.echo(f"Running jobs from {current_app.config['JOBS_PATH']} with {job_queue.max_workers} workers (Ctrl+C to stop)")
+    job_queue.run_forever()
+
+COMMANDS = (create_tables_command, load_rates_command, rebuild_aggregates_command, rebuild_search_index_command,
+            run_scheduler_command, run_jobs_command)
+
+def register_commands(app):
+    for command in COMMANDS:
+        app.cli.add_command(command)
@@ -0,0 +1,38 @@
+"""gzip compression of text responses, for deployments without a compressing reverse proxy.
+
+init_compression(app) compresses HTML, JSON, CSV and other text bodies of at least min_size
+bytes when the client sends Accept-Encoding: gzip. Streamed responses (CSV exports) and files
+from send_file() pass through untouched, as do empty and already encoded bodies. Responses that
+could have been compressed carry Vary: Accept-Encoding so caches keep both variants apart.
+"""
+import gzip
+
+from flask import request
+
+COMPRESSIBLE_TYPES = frozenset((
+    'text/html', 'text/plain', 'text/csv', 'text/css', 'text/javascript',
+    'application/json', 'application/javascript', 'application/x-ndjson',
+))
+
+
+def init_compression(app, min_size=1024, level=6):
+    @app.after_request
+    def compress_response(response):
+        if (response.mimetype not in COMPRESSIBLE_TYPES or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers or response.status_code in (204, 304)):
+            return response
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if not request.accept_encodings['gzip']:
+            return response
+        # mtime=0 keeps the output identical for identical bodies
+        response.set_data(gzip.compress(body, compresslevel=level, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+        # The encoded bytes differ from the original, so a strong validator no longer holds
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
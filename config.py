@@ -0,0 +1,213 @@
+"""Application configuration, read from the environment with development-friendly defaults.
+
+Database settings:
+  EXPENSES_DATABASE_URI (or DATABASE_URL)  SQLAlchemy URI; 'postgres://' is accepted for PostgreSQL.
+                                           Defaults to sqlite:///expenses.db next to app.py.
+  EXPENSES_DB_POOL_SIZE, EXPENSES_DB_MAX_OVERFLOW, EXPENSES_DB_POOL_TIMEOUT, EXPENSES_DB_POOL_RECYCLE
+                                           Connection pool tuning.
+  EXPENSES_SQLITE_TUNING=0                 Leave SQLite on its default pragmas (rollback journal,
+                                           synchronous=FULL, no busy timeout).
+  EXPENSES_SQLITE_BUSY_TIMEOUT_MS, EXPENSES_SQLITE_CACHE_SIZE_KB, EXPENSES_SQLITE_MMAP_SIZE
+                                           Per-connection SQLite pragmas.
+
+Sharding (see sharding.py):
+  EXPENSES_SHARDS                          Spread users' data over this many shards; 0 (default) keeps
+                                           everything in the one database. Change it with rebalance_shards.py.
+  EXPENSES_SHARD_URI                       Shard URI with a {shard} placeholder. Defaults to SQLite files
+                                           in shards/ next to the database, or for PostgreSQL to a
+                                           shard_{shard} schema of the same database.
+
+Instrumentation:
+  EXPENSES_INSTRUMENTATION=1               Per-request SQL/template timings, /metrics and the slow-request log.
+  EXPENSES_SLOW_REQUEST_MS                 Latency above which a request is logged with its statements.
+
+Responses:
+  EXPENSES_COMPRESSION=0                   Don't gzip responses in the app (when a reverse proxy does it).
+
+Currencies:
+  EXPENSES_BASE_CURRENCY                   Currency of existing data and of new users (default INR).
+  EXPENSES_EXCHANGE_RATES                  Rates CSV read by `flask load-rates` (default rates.csv next to app.py).
+  EXPENSES_EXCHANGE_RATE_REFERENCE         Currency the file's rates are quoted against (default EUR, as the ECB's).
+
+Sign-in:
+  EXPENSES_PASSWORD_HASH_METHOD            werkzeug KDF and cost for new hashes (default scrypt:32768:8:1);
+                                           older hashes are upgraded on the next successful login.
+  EXPENSES_PASSWORD_HASH_WORKERS           Threads hashing passwords at once in one process.
+  EXPENSES_RATE_LIMIT=0                    Switch off the per-IP and per-username sign-in limits.
+  EXPENSES_TRUSTED_PROXIES                 Reverse proxies in front of the app (default 0). Behind one, every
+                                           request comes from the proxy's address, so one client could use up
+                                           the per-IP limit for all; set it to the number of proxies and the
+                                           client address is taken from X-Forwarded-For instead. Only set it
+                                           when that many proxies really rewrite the header, or clients can
+                                           claim any address.
+
+Background jobs:
+  EXPENSES_JOBS_PATH                       SQLite file holding the job queue (default jobs.db next to app.py).
+  EXPENSES_JOBS_SPOOL                      Directory for uploaded CSVs and finished exports.
+  EXPENSES_JOBS_IN_PROCESS=0               Don't run jobs in the web process; use `flask run-jobs` instead.
+  EXPENSES_JOBS_MAX_WORKERS                Jobs one process runs at once.
+  EXPENSES_JOBS_MAX_PENDING_PER_USER       Queued plus running jobs a user may have before uploads are refused.
+  EXPENSES_SCHEDULER_INTERVAL              Seconds between scheduler runs (recurring expenses, budget rollover).
+
+Startup:
+  EXPENSES_CREATE_TABLES=0                 Don't create or upgrade tables when the app starts; run
+                                           `flask create-tables` once per deploy instead.
+  EXPENSES_TEMPLATE_CACHE                  Directory for compiled templates, shared by every worker so only
+                                           the first compiles them (default template_cache next to app.py;
+                                           empty to compile in memory only).
+  EXPENSES_PRECOMPILED_TEMPLATES           Comma-separated templates compiled at startup instead of on their
+                                           first request (default index.html,reports.html).
+"""
+import os
+
+from sqlalchemy import event
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def database_uri():
+    uri = os.environ.get('EXPENSES_DATABASE_URI') or os.environ.get('DATABASE_URL')
+    if not uri:
+        return 'sqlite:///' + os.path.join(basedir, 'expenses.db')
+    # Hosting providers still hand out the scheme SQLAlchemy dropped in 1.4
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def shard_uri_template(uri):
+    """Default EXPENSES_SHARD_URI for a main database URI."""
+    if uri.startswith('sqlite'):
+        path = uri.split(':///', 1)[1] if ':///' in uri else ''
+        if not path or path == ':memory:':
+            path = os.path.join(basedir, 'expenses.db')
+        stem, extension = os.path.splitext(os.path.basename(path))
+        return 'sqlite:///' + os.path.join(os.path.dirname(path), 'shards', f'{stem}-{{shard}}{extension or ".db"}')
+    # Tables are created in, and looked up from, the shard's schema first; "user" is found in public
+    return uri + ('&' if '?' in uri else '?') + 'options=-csearch_path%3Dshard_{shard}%2Cpublic'
+
+
+def engine_options(uri):
+    options = {
+        'pool_pre_ping': True,
+        'pool_recycle': env_int('EXPENSES_DB_POOL_RECYCLE', 1800),
+    }
+    if uri.startswith('sqlite') and ':memory:' not in uri and uri.rstrip('/') != 'sqlite:':
+        # File databases get a QueuePool; the driver-level timeout backs up busy_timeout
+        options.update(pool_size=env_int('EXPENSES_DB_POOL_SIZE', 5),
+                       max_overflow=env_int('EXPENSES_DB_MAX_OVERFLOW', 10),
+                       pool_timeout=env_int('EXPENSES_DB_POOL_TIMEOUT', 30),
+                       connect_args={'timeout': env_int('EXPENSES_SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000,
+                                     'check_same_thread': False})
+    elif not uri.startswith('sqlite'):
+        options.update(pool_size=env_int('EXPENSES_DB_POOL_SIZE', 10),
+                       max_overflow=env_int('EXPENSES_DB_MAX_OVERFLOW', 20),
+                       pool_timeout=env_int('EXPENSES_DB_POOL_TIMEOUT', 30))
+    return options
+
+
+def sqlite_pragmas():
+    """Pragmas applied to every new SQLite connection, or {} when tuning is switched off."""
+    if os.environ.get('EXPENSES_SQLITE_TUNING', '1') == '0':
+        return {}
+    return {
+        # WAL lets readers run alongside the single writer instead of blocking on it
+        'journal_mode': 'WAL',
+        # Safe with WAL: a crash can lose the last commits but never corrupts the file
+        'synchronous': 'NORMAL',
+        'busy_timeout': env_int('EXPENSES_SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'cache_size': -env_int('EXPENSES_SQLITE_CACHE_SIZE_KB', 65536), # negative means KiB
+        'mmap_size': env_int('EXPENSES_SQLITE_MMAP_SIZE', 268435456),
+        'temp_store': 'MEMORY',
+    }
+
+
+def register_sqlite_pragmas(engine, pragmas):
+    """Applies the pragmas on each new DB-API connection of a SQLite engine."""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+class Config:
+    SECRET_KEY = os.environ.get('EXPENSES_SECRET_KEY', 'your_super_secret_key')
+    DEBUG = os.environ.get('FLASK_DEBUG', '0') == '1'
+
+    SQLALCHEMY_DATABASE_URI = database_uri()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLITE_PRAGMAS = sqlite_pragmas()
+
+    SHARD_COUNT = env_int('EXPENSES_SHARDS', 0)
+    SHARD_URI = os.environ.get('EXPENSES_SHARD_URI') or shard_uri_template(SQLALCHEMY_DATABASE_URI)
+    SHARD_BUCKETS = 256 # users map to buckets and buckets to shards; rebalancing moves whole buckets
+    SHARD_MAP_MAX_AGE_SECONDS = 30 # workers re-read the bucket map this often
+
+    EXPENSE_PAGE_SIZE = 50
+    EXPENSE_PAGE_SIZE_MAX = 500
+    DASHBOARD_DEBTS_LIMIT = 20 # newest unpaid splits on the dashboard; the ledger has the rest
+    CSV_IMPORT_BATCH_SIZE = 5000
+    CSV_IMPORT_MAX_REPORTED_ERRORS = 1000
+    EXPORT_YIELD_PER = 1000
+
+    BASE_CURRENCY = os.environ.get('EXPENSES_BASE_CURRENCY', 'INR')
+    EXCHANGE_RATES_PATH = os.environ.get('EXPENSES_EXCHANGE_RATES', os.path.join(basedir, 'rates.csv'))
+    EXCHANGE_RATE_REFERENCE = os.environ.get('EXPENSES_EXCHANGE_RATE_REFERENCE', 'EUR')
+    EXCHANGE_RATE_MAX_AGE_SECONDS = 3600 # workers reload rates this often
+
+    CACHE_ENABLED = os.environ.get('EXPENSES_CACHE_ENABLED', '1') != '0'
+    CACHE_BACKEND = os.environ.get('EXPENSES_CACHE_BACKEND', 'memory') # 'memory' or 'sqlite'
+    CACHE_PATH = os.environ.get('EXPENSES_CACHE_PATH', os.path.join(basedir, 'response_cache.db'))
+    CACHE_TTL_SECONDS = 300
+    CACHE_MAX_ENTRIES = 1024
+
+    SERIES_DEFAULT_BUCKETS = 12
+    SERIES_MAX_BUCKETS = 400
+
+    COMPRESSION_ENABLED = os.environ.get('EXPENSES_COMPRESSION', '1') != '0'
+    COMPRESSION_MIN_SIZE = 1024 # bytes; smaller bodies gain little and still cost a gzip header
+    COMPRESSION_LEVEL = 6
+
+    INSTRUMENTATION_ENABLED = os.environ.get('EXPENSES_INSTRUMENTATION', '0') == '1'
+    SLOW_REQUEST_MS = env_int('EXPENSES_SLOW_REQUEST_MS', 500)
+    SLOW_REQUEST_MAX_STATEMENTS = 10
+
+    PASSWORD_HASH_METHOD = os.environ.get('EXPENSES_PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = env_int('EXPENSES_PASSWORD_HASH_WORKERS', 2)
+    PASSWORD_HASH_MAX_QUEUED = 16 # waiting hashes before sign-ins get a 503
+    RATE_LIMIT_ENABLED = os.environ.get('EXPENSES_RATE_LIMIT', '1') != '0'
+    TRUSTED_PROXIES = env_int('EXPENSES_TRUSTED_PROXIES', 0) # X-Forwarded-For entries to trust, see ProxyFix
+    LOGIN_IP_BURST = 20 # attempts, refilled at the per-minute rate below
+    LOGIN_IP_PER_MINUTE = 10
+    LOGIN_USERNAME_BURST = 5
+    LOGIN_USERNAME_PER_MINUTE = 2
+
+    JOBS_PATH = os.environ.get('EXPENSES_JOBS_PATH', os.path.join(basedir, 'jobs.db'))
+    JOBS_SPOOL_DIR = os.environ.get('EXPENSES_JOBS_SPOOL', os.path.join(basedir, 'job_files'))
+    JOBS_IN_PROCESS = os.environ.get('EXPENSES_JOBS_IN_PROCESS', '1') != '0'
+    JOBS_MAX_WORKERS = env_int('EXPENSES_JOBS_MAX_WORKERS', 2)
+    JOBS_PER_USER_CONCURRENCY = 1
+    JOBS_MAX_PENDING_PER_USER = env_int('EXPENSES_JOBS_MAX_PENDING_PER_USER', 5)
+    JOBS_POLL_SECONDS = 1.0
+    JOBS_RETENTION_SECONDS = 7 * 24 * 3600 # finished jobs and their files are purged after this
+
+    SCHEDULER_INTERVAL_SECONDS = env_int('EXPENSES_SCHEDULER_INTERVAL', 3600)
+    RECURRING_BATCH_SIZE = 1000 # rules (and budgets) per transaction
+    RECURRING_MAX_CATCH_UP = 400 # occurrences one rule may create per run
+    BUDGET_HISTORY_LIMIT = 12
+
+    CREATE_TABLES = os.environ.get('EXPENSES_CREATE_TABLES', '1') != '0'
+    TEMPLATE_CACHE_DIR = os.environ.get('EXPENSES_TEMPLATE_CACHE', os.path.join(basedir, 'template_cache'))
+    PRECOMPILED_TEMPLATES = [name.strip() for name in
+                             os.environ.get('EXPENSES_PRECOMPILED_TEMPLATES', 'index.html,reports.html').split(',')
+                             if name.strip()]
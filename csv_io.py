@@ -0,0 +1,169 @@
+"""CSV import and CSV/NDJSON export.
+
+Only upload jobs and exports need this, so the app imports it on first use rather than at startup.
+"""
+import codecs
+import csv
+import json
+from datetime import datetime, timezone
+
+from flask import current_app
+
+from currency import to_base
+from extensions import exchange_rates, response_cache
+from models import db, Expense, Receivable
+from services import (parse_date, to_minor, from_minor, format_money, read_currency, get_base_currency, get_user_tags,
+                      adjust_aggregates)
+
+# --- CSV Import Engine ---
+def validate_csv_row(row, user_tags, base_currency=None, currency_index=None):
+    """Validates one 'Date, Description, Amount, Tag' row, plus the Currency column if the file has one.
+
+    Returns a dict of Expense column values, or raises ValueError with the rejection reason.
+    """
+    if len(row) < 4:
+        raise ValueError(f'Expected 4 columns, got {len(row)}')
+    date_str, description, amount_str, tag = (value.strip() for value in row[:4])
+    expense_date = parse_date(date_str)
+    if not description:
+        raise ValueError('Description is empty')
+    if len(description) > 200:
+        raise ValueError('Description is longer than 200 characters')
+    amount = to_minor(amount_str)
+    if amount <= 0:
+        raise ValueError(f"Amount must be a positive number, got '{amount_str}'")
+    tag = tag.lower()
+    if tag not in user_tags:
+        raise ValueError(f"Unknown tag '{tag}'")
+    base_currency = base_currency or current_app.config['BASE_CURRENCY']
+    currency = read_currency(row[currency_index] if currency_index is not None and currency_index < len(row) else '',
+                             base_currency)
+    # CSV imports aren't split, so the whole amount is the user's own share
+    return {'date': expense_date, 'description': description, 'total_amount_minor': amount, 'own_amount_minor': amount, 'tag': tag,
+            'currency': currency, 'base_rate': exchange_rates.conversion(currency, base_currency, expense_date)}
+
+def import_expenses_csv(user_id, byte_stream, batch_size=None, max_reported_errors=None, progress=None):
+    """Streams a CSV upload into the expense table in bounded batches.
+
+    The stream is decoded incrementally, valid rows are inserted with one executemany
+    per batch (each batch is its own transaction, aggregates included), and invalid
+    rows are collected into a rejection report instead of aborting the import.
+    progress, if given, is called with the number of rows handled after every batch.
+    """
+    batch_size = batch_size or current_app.config['CSV_IMPORT_BATCH_SIZE']
+    max_reported_errors = max_reported_errors or current_app.config['CSV_IMPORT_MAX_REPORTED_ERRORS']
+    user_tags = get_user_tags(user_id)
+    base_currency = get_base_currency(user_id)
+    report = {'imported': 0, 'rejected': 0, 'errors': []}
+
+    def reject(line, reason):
+        report['rejected'] += 1
+        if len(report['errors']) < max_reported_errors:
+            report['errors'].append({'line': line, 'reason': reason})
+
+    def flush(batch, day_tag_deltas):
+        if not batch:
+            return
+        db.session.execute(Expense.__table__.insert(), batch)
+        adjust_aggregates(user_id, day_tag_deltas)
+        db.session.commit()
+        response_cache.invalidate_user(user_id)
+        report['imported'] += len(batch)
+
+    csv_reader = csv.reader(codecs.iterdecode(byte_stream, 'utf-8-sig'))
+    batch, day_tag_deltas = [], {}
+    try:
+        header = [name.strip().lower() for name in next(csv_reader, None) or []]
+        # Rows are in the base currency unless the file has a Currency column, as exports do
+        currency_index = header.index('currency') if 'currency' in header else None
+        for row in csv_reader:
+            if not any(value.strip() for value in row):
+                continue
+            try:
+                values = validate_csv_row(row, user_tags, base_currency, currency_index)
+            except ValueError as e:
+                reject(csv_reader.line_num, str(e))
+                continue
+            values['user_id'] = user_id
+            batch.append(values)
+            key = (values['date'], values['tag'])
+            amount, count = day_tag_deltas.get(key, (0, 0))
+            day_tag_deltas[key] = (amount + to_base(values['own_amount_minor'], values['base_rate']), count + 1)
+            if len(batch) >= batch_size:
+                flush(batch, day_tag_deltas)
+                batch, day_tag_deltas = [], {}
+                if progress:
+                    progress(report['imported'] + report['rejected'])
+    except (UnicodeDecodeError, csv.Error) as e:
+        # The rest of the file can't be read; keep what was already committed
+        reject(csv_reader.line_num + 1, f'Could not read the rest of the file: {e}')
+    flush(batch, day_tag_deltas)
+    return report
+
+# --- Export ---
+class _EchoBuffer:
+    """File-like object whose write() hands the line back, so csv.writer can feed a generator."""
+    def write(self, value):
+        return value
+
+def iter_export_rows(user_id, start_date=None, end_date=None, tags=None):
+    """Yields (expense, receivables) pairs from a server-side cursor, oldest first."""
+    query = db.session.query(
+        Expense.id, Expense.date, Expense.description, Expense.total_amount_minor, Expense.own_amount_minor, Expense.tag,
+        Expense.currency, Receivable.person_name, Receivable.amount_minor, Receivable.is_paid
+    ).outerjoin(Receivable, Receivable.expense_id == Expense.id).filter(Expense.user_id == user_id)
+    if start_date:
+        query = query.filter(Expense.date >= start_date)
+    if end_date:
+        query = query.filter(Expense.date <= end_date)
+    if tags:
+        query = query.filter(Expense.tag.in_(tags))
+    query = query.order_by(Expense.date, Expense.id, Receivable.id).execution_options(yield_per=current_app.config['EXPORT_YIELD_PER'])
+
+    # Rows arrive ordered by expense, so receivables can be folded in without buffering more than one expense
+    current, receivables = None, []
+    for row in query:
+        if current is not None and row.id != current.id:
+            yield current, receivables
+            receivables = []
+        current = row
+        if row.person_name is not None:
+            receivables.append({'person_name': row.person_name, 'amount_minor': row.amount_minor, 'is_paid': row.is_paid})
+    if current is not None:
+        yield current, receivables
+
+def export_lines(rows, export_format):
+    """Returns (line generator, mimetype, file extension) for an export in 'csv' or 'ndjson'."""
+    if export_format == 'ndjson':
+        def generate():
+            for expense, receivables in rows:
+                yield json.dumps({
+                    'id': expense.id,
+                    'date': expense.date.isoformat(),
+                    'description': expense.description,
+                    'total_amount': from_minor(expense.total_amount_minor),
+                    'own_amount': from_minor(expense.own_amount_minor),
+                    'currency': expense.currency,
+                    'tag': expense.tag,
+                    'receivables': [
+                        {'person_name': r['person_name'], 'amount': from_minor(r['amount_minor']), 'is_paid': r['is_paid']}
+                        for r in receivables
+                    ]
+                }) + '\n'
+        return generate(), 'application/x-ndjson', 'ndjson'
+
+    def generate():
+        # The first four columns match the upload format, and the importer finds Currency by name,
+        # so an export can be re-imported
+        writer = csv.writer(_EchoBuffer())
+        yield writer.writerow(['Date', 'Description', 'Amount', 'Tag', 'Own Amount', 'Receivables', 'Currency'])
+        for expense, receivables in rows:
+            split_info = '; '.join(
+                f"{r['person_name']}:{format_money(r['amount_minor'])}:{'paid' if r['is_paid'] else 'unpaid'}" for r in receivables
+            )
+            yield writer.writerow([expense.date.isoformat(), expense.description, format_money(expense.total_amount_minor),
+                                   expense.tag, format_money(expense.own_amount_minor), split_info, expense.currency])
+    return generate(), 'text/csv', 'csv'
+
+def export_filename(extension):
+    return f"expenses-{datetime.now(timezone.utc).strftime('%Y%m%d')}.{extension}"
@@ -0,0 +1,143 @@
+"""Currencies and exchange rates.
+
+Rates are read from a local CSV file (`flask load-rates`) into the exchange_rate table. Two
+layouts are accepted:
+  * wide, like the ECB's eurofxref-hist.csv: a Date column, then one column per currency;
+  * long: Date,Currency,Rate rows.
+A rate is how many units of the currency one unit of the reference currency buys (EUR for the
+ECB file); the reference currency itself is always 1. Days without a rate (weekends, holidays)
+use the latest earlier one.
+
+RateTable keeps each currency's rate history in memory and memoizes lookups by (currency, day),
+so converting a batch of expenses costs one lookup per distinct currency and day, not per row.
+Rates are reloaded every max_age seconds, which is how workers pick up a new load-rates run.
+"""
+import csv
+import math
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+
+# Shown in front of amounts; other currencies are shown by their code
+CURRENCY_SYMBOLS = {
+    'INR': '₹', 'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥', 'CNY': '¥', 'KRW': '₩', 'RUB': '₽',
+    'TRY': '₺', 'ILS': '₪', 'PHP': '₱', 'THB': '฿', 'VND': '₫', 'NGN': '₦', 'UAH': '₴', 'PLN': 'zł',
+    'AUD': 'A$', 'CAD': 'C$', 'NZD': 'NZ$', 'SGD': 'S$', 'HKD': 'HK$', 'BRL': 'R$', 'ZAR': 'R',
+}
+
+
+class MissingRateError(ValueError):
+    pass
+
+
+def currency_symbol(code):
+    return CURRENCY_SYMBOLS.get(code, f'{code} ')
+
+
+def normalize_currency(code):
+    """Upper-cases a currency code; raises ValueError unless it is three letters."""
+    code = (code or '').strip().upper()
+    if len(code) != 3 or not code.isalpha() or not code.isascii():
+        raise ValueError(f"Invalid currency '{code}'")
+    return code
+
+
+def to_base(amount_minor, rate):
+    """Converts minor units at `rate`, rounding half away from zero like SQL's ROUND()."""
+    value = amount_minor * rate
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+
+def read_rates_file(text_stream):
+    """Yields (currency, day, rate) from a wide or long rates CSV; empty and 'N/A' cells are skipped."""
+    reader = csv.reader(text_stream)
+    header = [name.strip() for name in next(reader, [])]
+    if [name.lower() for name in header[:3]] == ['date', 'currency', 'rate']:
+        for row in reader:
+            if len(row) >= 3 and row[2].strip() not in ('', 'N/A'):
+                yield normalize_currency(row[1]), date.fromisoformat(row[0].strip()), float(row[2])
+        return
+    currencies = [normalize_currency(name) if name else None for name in header[1:]]
+    for row in reader:
+        if not row or not row[0].strip():
+            continue
+        day = date.fromisoformat(row[0].strip())
+        for currency, value in zip(currencies, row[1:]):
+            value = value.strip()
+            if currency and value and value != 'N/A':
+                yield currency, day, float(value)
+
+
+def read_rates_path(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        yield from read_rates_file(f)
+
+
+class RateTable:
+    """Memoized exchange rates. load_series(currency) returns that currency's (days, rates), oldest first."""
+    def __init__(self, load_series, load_currencies, reference='EUR', max_age=3600, max_lookups=100_000):
+        self.load_series = load_series
+        self.load_currencies = load_currencies
+        self.reference = reference
+        self.max_age = max_age
+        self.max_lookups = max_lookups
+        self._series = {} # currency -> (days, rates)
+        self._lookups = {} # (currency, day) -> rate
+        self._currencies = None
+        self._loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self._lookups.clear()
+            self._currencies = None
+            self._loaded_at = time.monotonic()
+
+    def _expire(self):
+        if time.monotonic() - self._loaded_at >= self.max_age:
+            self.clear()
+
+    def currencies(self):
+        """Every currency with rates, plus the reference currency when there are any."""
+        self._expire()
+        if self._currencies is None:
+            loaded = set(self.load_currencies())
+            self._currencies = frozenset(loaded | {self.reference}) if loaded else frozenset()
+        return self._currencies
+
+    def rate(self, currency, day):
+        """Units of currency per unit of the reference currency on day (or the latest day before)."""
+        if currency == self.reference:
+            return 1.0
+        self._expire()
+        key = (currency, day)
+        rate = self._lookups.get(key)
+        if rate is not None:
+            return rate
+        series = self._series.get(currency)
+        if series is None:
+            series = self.load_series(currency)
+            with self._lock:
+                self._series[currency] = series
+        days, rates = series
+        index = bisect_right(days, day) - 1
+        if index < 0:
+            raise MissingRateError(f'No exchange rate for {currency} on or before {day.isoformat()}')
+        rate = rates[index]
+        with self._lock:
+            if len(self._lookups) >= self.max_lookups:
+                self._lookups.clear()
+            self._lookups[key] = rate
+        return rate
+
+    def conversion(self, from_currency, to_currency, day):
+        """Multiplier taking an amount in from_currency to to_currency on day."""
+        if from_currency == to_currency:
+            return 1.0
+        return self.rate(to_currency, day) / self.rate(from_currency, day)
+
+    def conversions(self, pairs, to_currency):
+        """{(currency, day): multiplier} for many pairs at once; raises MissingRateError for the first gap."""
+        return {(currency, day): self.conversion(currency, to_currency, day) for currency, day in set(pairs)}
@@ -0,0 +1,27 @@
+"""Per-app service objects, reachable from any module without importing the app.
+
+create_app() builds one of each (response cache, password hasher, sign-in limiters, exchange
+rates, tag registry, job queue and, with sharding on, the shard router) and stores it in
+app.extensions. The names below are proxies to the current app's objects, so views, jobs and
+CLI commands use them as before while each app built by the factory keeps its own.
+"""
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+
+def _extension(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+
+response_cache = _extension('response_cache')
+password_hasher = _extension('password_hasher')
+login_ip_limiter = _extension('login_ip_limiter')
+login_username_limiter = _extension('login_username_limiter')
+exchange_rates = _extension('exchange_rates')
+tag_registry = _extension('tag_registry')
+job_queue = _extension('job_queue')
+
+
+def get_shard_router():
+    """The app's ShardRouter, or None when sharding is off (a proxy can't stand in for None)."""
+    return current_app.extensions.get('shard_router')
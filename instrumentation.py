@@ -0,0 +1,195 @@
+"""Opt-in per-request performance instrumentation.
+
+When enabled (EXPENSES_INSTRUMENTATION=1) every request records its SQL query count, SQL time,
+template render time and total latency. Totals per endpoint are exposed in Prometheus text
+format at /metrics, each response carries a Server-Timing header, and requests slower than
+SLOW_REQUEST_MS are logged together with their slowest statements.
+
+query_budget() works without the rest of the instrumentation and is meant for tests:
+
+    with query_budget(db.engine, 5) as counter:
+        client.get('/dashboard')
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+slow_request_log = logging.getLogger('expenses.slow_requests')
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    """Timings collected for the request in flight, stored on flask.g."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.statements = [] # (duration, statement)
+        self._template_started = None
+
+
+class MetricsRegistry:
+    """Per-endpoint totals, shared by all threads of one worker process."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, method, status, metrics, total):
+        with self._lock:
+            stats = self._endpoints.setdefault((endpoint, method), {
+                'statuses': {}, 'count': 0, 'latency_sum': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS),
+                'queries': 0, 'sql_time': 0.0, 'template_time': 0.0,
+            })
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+            stats['count'] += 1
+            stats['latency_sum'] += total
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if total <= bound:
+                    stats['buckets'][i] += 1
+            stats['queries'] += metrics.query_count
+            stats['sql_time'] += metrics.sql_time
+            stats['template_time'] += metrics.template_time
+
+    def render_prometheus(self):
+        with self._lock:
+            endpoints = {key: dict(value, statuses=dict(value['statuses']), buckets=list(value['buckets']))
+                         for key, value in self._endpoints.items()}
+        lines = [
+            '# HELP expense_requests_total Requests handled, by endpoint, method and status.',
+            '# TYPE expense_requests_total counter',
+        ]
+        for (endpoint, method), stats in sorted(endpoints.items()):
+            for status, count in sorted(stats['statuses'].items()):
+                lines.append(f'expense_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+        lines += [
+            '# HELP expense_request_duration_seconds Total request latency.',
+            '# TYPE expense_request_duration_seconds histogram',
+        ]
+        for (endpoint, method), stats in sorted(endpoints.items()):
+            labels = f'endpoint="{endpoint}",method="{method}"'
+            for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+                lines.append(f'expense_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'expense_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+            lines.append(f'expense_request_duration_seconds_sum{{{labels}}} {stats["latency_sum"]:.6f}')
+            lines.append(f'expense_request_duration_seconds_count{{{labels}}} {stats["count"]}')
+        for name, key, help_text in (
+            ('expense_sql_queries_total', 'queries', 'SQL statements executed.'),
+            ('expense_sql_duration_seconds_total', 'sql_time', 'Time spent executing SQL.'),
+            ('expense_template_render_seconds_total', 'template_time', 'Time spent rendering templates.'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (endpoint, method), stats in sorted(endpoints.items()):
+                value = stats[key]
+                formatted = str(value) if isinstance(value, int) else f'{value:.6f}'
+                lines.append(f'{name}{{endpoint="{endpoint}",method="{method}"}} {formatted}')
+        return '\n'.join(lines) + '\n'
+
+
+def current_metrics():
+    return g.get('perf_metrics') if has_request_context() else None
+
+
+def instrument_engine(engine):
+    """Counts and times the statements run on engine towards the request in flight."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('perf_query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['perf_query_started'].pop()
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.query_count += 1
+            metrics.sql_time += duration
+            metrics.statements.append((duration, statement))
+
+
+def init_instrumentation(app, engine):
+    """Wires the SQLAlchemy, template and request hooks and registers the /metrics route.
+
+    Engines opened later (shards) are added with instrument_engine().
+    """
+    registry = MetricsRegistry()
+    slow_threshold = app.config['SLOW_REQUEST_MS'] / 1000
+    max_statements = app.config['SLOW_REQUEST_MAX_STATEMENTS']
+    instrument_engine(engine)
+
+    @before_render_template.connect_via(app)
+    def on_before_render(sender, template, context, **extra):
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics._template_started = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def on_rendered(sender, template, context, **extra):
+        metrics = current_metrics()
+        if metrics is not None and metrics._template_started is not None:
+            metrics.template_time += time.perf_counter() - metrics._template_started
+            metrics._template_started = None
+
+    @app.before_request
+    def start_request_metrics():
+        g.perf_metrics = RequestMetrics()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        metrics = g.pop('perf_metrics', None)
+        if metrics is None or request.endpoint == 'metrics':
+            return response
+        total = time.perf_counter() - metrics.started
+        endpoint = request.endpoint or 'unmatched'
+        registry.record(endpoint, request.method, response.status_code, metrics, total)
+
+        response.headers['Server-Timing'] = (
+            f'sql;dur={metrics.sql_time * 1000:.1f};desc="{metrics.query_count} queries", '
+            f'tpl;dur={metrics.template_time * 1000:.1f}, total;dur={total * 1000:.1f}'
+        )
+        response.headers['X-Query-Count'] = str(metrics.query_count)
+
+        if total >= slow_threshold:
+            slowest = sorted(metrics.statements, key=lambda item: item[0], reverse=True)[:max_statements]
+            slow_request_log.warning(
+                'Slow request %s %s (%s): %.1f ms total, %d queries in %.1f ms, templates %.1f ms\n%s',
+                request.method, request.path, endpoint, total * 1000, metrics.query_count,
+                metrics.sql_time * 1000, metrics.template_time * 1000,
+                '\n'.join(f'  {duration * 1000:8.2f} ms  {" ".join(statement.split())}' for duration, statement in slowest)
+            )
+        return response
+
+    def metrics():
+        return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+    app.add_url_rule('/metrics', 'metrics', metrics)
+
+    return registry
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+
+@contextmanager
+def query_budget(engine, max_queries=None):
+    """Counts statements run on engine inside the block; fails if more than max_queries ran."""
+    counter = QueryCounter()
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter.count += 1
+        counter.statements.append(statement)
+
+    event.listen(engine, 'after_cursor_execute', count)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'after_cursor_execute', count)
+    if max_queries is not None and counter.count > max_queries:
+        raise AssertionError(f'Query budget exceeded: {counter.count} > {max_queries}\n' + '\n'.join(counter.statements))
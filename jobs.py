@@ -0,0 +1,300 @@
+"""Background jobs for work too slow for a request: CSV imports, exports and aggregate rebuilds.
+
+Jobs live in a small SQLite file, like the shared response cache, so every worker process on
+the host sees one queue and no broker is needed. Each process that runs jobs has a dispatcher
+thread claiming queued jobs into a bounded thread pool; `flask run-jobs` runs a dedicated one.
+
+Limits:
+  * at most max_workers jobs run at once in one process;
+  * at most per_user_concurrency jobs run at once for one user, the rest wait their turn;
+  * enqueue() refuses a user who already has max_pending_per_user jobs queued or running.
+
+schedule() makes the dispatchers queue a job every so often, such as the recurring-expense run.
+The last run time lives in the queue file, so one job is queued per interval however many
+processes are dispatching. Scheduled jobs belong to SYSTEM_USER.
+
+Handlers take a JobContext and report progress with ctx.progress(processed, total), which
+also raises JobCancelled once a cancel was requested. Work the handler already committed
+stays committed; the job just ends as 'cancelled'.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from sqlite_local import ThreadLocalConnections
+
+job_log = logging.getLogger('expenses.jobs')
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+SYSTEM_USER = 0 # owner of scheduled jobs
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobLimitError(Exception):
+    pass
+
+
+class JobContext:
+    """What a handler sees of its job."""
+    def __init__(self, queue, job):
+        self.queue = queue
+        self.id = job['id']
+        self.user_id = job['user_id']
+        self.payload = job['payload']
+
+    def progress(self, processed, total=None):
+        """Records progress and raises JobCancelled if the job was asked to stop."""
+        if self.queue._record_progress(self.id, processed, total):
+            raise JobCancelled()
+
+
+class JobQueue:
+    def __init__(self, path, max_workers=2, per_user_concurrency=1, max_pending_per_user=5,
+                 poll_interval=1.0, stale_after=600, retention=7 * 24 * 3600, context_factory=None, on_purge=None):
+        self.path = path
+        self.max_workers = max_workers
+        self.per_user_concurrency = per_user_concurrency
+        self.max_pending_per_user = max_pending_per_user
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.retention = retention
+        self.context_factory = context_factory or nullcontext
+        self.on_purge = on_purge
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self._handlers = {}
+        self._schedules = {} # kind -> (interval seconds, payload)
+        # Autocommit mode; multi-statement changes go through _transaction()
+        self._connections = ThreadLocalConnections(path, row_factory=sqlite3.Row, on_connect=self._connected,
+                                                   isolation_level=None)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._running = 0
+        self._started = False
+        self._executor = None
+        self._last_purge = 0.0
+        self._schema_ready = False
+
+    def _connection(self):
+        return self._connections.get()
+
+    def _connected(self, conn):
+        # The file is only created once something actually uses the queue
+        with self._lock:
+            if not self._schema_ready:
+                self._create_schema(conn)
+                self._schema_ready = True
+
+    @staticmethod
+    def _create_schema(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS job ("
+                     "id TEXT PRIMARY KEY, kind TEXT NOT NULL, user_id INTEGER NOT NULL, status TEXT NOT NULL, "
+                     "payload TEXT NOT NULL, result TEXT, error TEXT, "
+                     "processed INTEGER NOT NULL DEFAULT 0, total INTEGER, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+                     "worker TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_job_status_created ON job (status, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_job_user_status ON job (user_id, status)")
+        conn.execute("CREATE TABLE IF NOT EXISTS job_schedule (kind TEXT PRIMARY KEY, last_enqueued REAL NOT NULL)")
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front, so two processes can't claim the same job
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def schedule(self, kind, every, payload=None):
+        """Queues a SYSTEM_USER job of this (registered) kind every `every` seconds, starting at once."""
+        self._schedules[kind] = (every, payload)
+
+    def enqueue(self, kind, user_id, payload=None):
+        """Queues a job and returns its id. Raises JobLimitError if the user has too many pending."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job_id = uuid.uuid4().hex
+        with self._transaction() as conn:
+            pending = conn.execute("SELECT COUNT(*) FROM job WHERE user_id = ? AND status IN (?, ?)",
+                                   (user_id, QUEUED, RUNNING)).fetchone()[0]
+            if pending >= self.max_pending_per_user:
+                raise JobLimitError(f'You already have {pending} jobs waiting or running; try again when one finishes.')
+            conn.execute("INSERT INTO job (id, kind, user_id, status, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         (job_id, kind, user_id, QUEUED, json.dumps(payload or {}), time.time()))
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        row = self._connection().execute("SELECT * FROM job WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list_for_user(self, user_id, limit=20):
+        rows = self._connection().execute("SELECT * FROM job WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+                                          (user_id, limit)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        """Cancels a queued job outright, or asks a running one to stop at its next progress report."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE job SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                         (CANCELLED, now, job_id, QUEUED))
+            conn.execute("UPDATE job SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING))
+        return self.get(job_id)
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    # --- Worker side ---
+    def start(self):
+        """Starts this process' dispatcher thread; safe to call more than once."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+            threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True).start()
+
+    def run_forever(self):
+        self.start()
+        try:
+            while not self._stopping.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self, wait=True):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+
+    def _dispatch_loop(self):
+        while not self._stopping.is_set():
+            try:
+                self._maintain()
+                while not self._stopping.is_set():
+                    with self._lock:
+                        if self._running >= self.max_workers:
+                            break
+                    job = self._claim()
+                    if job is None:
+                        break
+                    with self._lock:
+                        self._running += 1
+                    try:
+                        self._executor.submit(self._run, job)
+                    except RuntimeError:
+                        # stop() or interpreter shutdown closed the pool after the claim; let another worker have it
+                        with self._lock:
+                            self._running -= 1
+                        self._release(job['id'])
+                        job_log.info('Job pool closed; returned job %s to the queue', job['id'])
+                        return
+            except sqlite3.Error:
+                job_log.exception('Job dispatcher hit a database error; retrying')
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _maintain(self):
+        """Keeps this worker's running jobs alive, fails jobs orphaned by dead workers, purges old ones."""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("UPDATE job SET heartbeat_at = ? WHERE worker = ? AND status = ?", (now, self.worker_id, RUNNING))
+        conn.execute("UPDATE job SET status = ?, error = ?, finished_at = ? WHERE status = ? AND heartbeat_at < ?",
+                     (FAILED, 'Interrupted: the worker running this job stopped.', now, RUNNING, now - self.stale_after))
+        for kind, (every, payload) in self._schedules.items():
+            if self._claim_schedule(kind, every, now):
+                try:
+                    self.enqueue(kind, SYSTEM_USER, payload)
+                except JobLimitError:
+                    job_log.warning('Skipped scheduled %s job: earlier runs are still pending', kind)
+        if now - self._last_purge >= 3600:
+            self._last_purge = now
+            self.purge(now - self.retention)
+
+    def _claim_schedule(self, kind, every, now):
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO job_schedule (kind, last_enqueued) VALUES (?, 0)", (kind,))
+            return conn.execute("UPDATE job_schedule SET last_enqueued = ? WHERE kind = ? AND last_enqueued <= ?",
+                                (now, kind, now - every)).rowcount == 1
+
+    def purge(self, finished_before):
+        with self._transaction() as conn:
+            rows = conn.execute(f"SELECT * FROM job WHERE status IN ({', '.join('?' * len(FINISHED))}) AND finished_at < ?",
+                                (*FINISHED, finished_before)).fetchall()
+            conn.executemany("DELETE FROM job WHERE id = ?", [(row['id'],) for row in rows])
+        for row in rows:
+            if self.on_purge:
+                self.on_purge(self._to_dict(row))
+        return len(rows)
+
+    def _claim(self):
+        kinds = list(self._handlers)
+        if not kinds:
+            return None
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT * FROM job WHERE status = ? AND kind IN ({', '.join('?' * len(kinds))}) "
+                "AND (SELECT COUNT(*) FROM job AS active WHERE active.user_id = job.user_id AND active.status = ?) < ? "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, *kinds, RUNNING, self.per_user_concurrency)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE job SET status = ?, worker = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                         (RUNNING, self.worker_id, now, now, row['id']))
+        return self._to_dict(row)
+
+    def _release(self, job_id):
+        """Puts a job this worker claimed but never started back in the queue."""
+        self._connection().execute("UPDATE job SET status = ?, worker = NULL, started_at = NULL, heartbeat_at = NULL "
+                                   "WHERE id = ? AND status = ? AND worker = ?", (QUEUED, job_id, RUNNING, self.worker_id))
+
+    def _record_progress(self, job_id, processed, total):
+        conn = self._connection()
+        conn.execute("UPDATE job SET processed = ?, total = coalesce(?, total), heartbeat_at = ? WHERE id = ?",
+                     (processed, total, time.time(), job_id))
+        return bool(conn.execute("SELECT cancel_requested FROM job WHERE id = ?", (job_id,)).fetchone()[0])
+
+    def _finish(self, job_id, status, result=None, error=None):
+        self._connection().execute("UPDATE job SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                                   (status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+
+    def _run(self, job):
+        try:
+            with self.context_factory():
+                result = self._handlers[job['kind']](JobContext(self, job))
+            self._finish(job['id'], SUCCEEDED, result)
+        except JobCancelled:
+            self._finish(job['id'], CANCELLED)
+        except Exception as e:
+            job_log.exception('Job %s (%s) failed', job['id'], job['kind'])
+            self._finish(job['id'], FAILED, error=str(e))
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._wakeup.set()
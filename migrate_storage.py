@@ -0,0 +1,166 @@
+"""Migrates a database created before native date/amount storage to the current schema.
+
+Older databases keep Expense.date as a 'YYYY-MM-DD'-ish string and every amount as a float.
+This tool rewrites expense, receivable and budget into the current schema (a real DATE column
+and integer minor units), recreates the indexes and the search index, and rebuilds the
+aggregate tables from the converted rows.
+
+Usage: python migrate_storage.py [--dry-run] [--batch-size 5000] [--no-backup]
+
+The database is taken from EXPENSES_DATABASE_URI (or the app default, expenses.db). For SQLite
+files a timestamped copy is written next to the database before anything is changed.
+"""
+import argparse
+import shutil
+import sys
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from app import create_app
+from models import db, Expense, Receivable, Budget, create_search_index, needs_migration
+from services import parse_date, to_minor, rebuild_aggregates
+
+# Children first, so that renaming a parent never has to chase a live child table
+LEGACY_TABLES = ['receivable', 'expense', 'budget', 'daily_tag_total', 'user_totals']
+LEGACY_PREFIX = '_legacy_'
+
+
+def find_bad_dates(conn):
+    """Returns (id, raw date) for every expense whose date none of the accepted formats can parse."""
+    bad = []
+    for expense_id, raw_date in conn.execute(text("SELECT id, date FROM expense")):
+        try:
+            parse_date(raw_date)
+        except ValueError:
+            bad.append((expense_id, raw_date))
+    return bad
+
+
+def backup_sqlite_file(engine):
+    path = engine.url.database
+    if engine.url.get_backend_name() != 'sqlite' or not path or path == ':memory:':
+        return None
+    backup_path = f"{path}.bak-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    shutil.copy2(path, backup_path)
+    return backup_path
+
+
+def copy_in_batches(conn, select_sql, target_table, convert, batch_size):
+    """Copies rows keyed by id in id order, converting each one, one INSERT batch at a time."""
+    copied, last_id = 0, 0
+    while True:
+        rows = conn.execute(text(select_sql), {'last_id': last_id, 'limit': batch_size}).all()
+        if not rows:
+            return copied
+        conn.execute(target_table.insert(), [convert(row) for row in rows])
+        copied += len(rows)
+        last_id = rows[-1].id
+
+
+def migrate(batch_size, make_backup=True):
+    engine = db.engine
+    inspector = inspect(engine)
+    if not needs_migration(inspector):
+        print('Schema is already up to date; nothing to do.')
+        return 0
+
+    with engine.connect() as conn:
+        bad_dates = find_bad_dates(conn)
+    if bad_dates:
+        print(f'{len(bad_dates)} expenses have dates in no recognised format; fix them and re-run:')
+        for expense_id, raw_date in bad_dates[:20]:
+            print(f'  expense {expense_id}: {raw_date!r}')
+        return 1
+
+    if make_backup:
+        backup_path = backup_sqlite_file(engine)
+        if backup_path:
+            print(f'Backed up database to {backup_path}')
+
+    existing = [name for name in LEGACY_TABLES if inspector.has_table(name)]
+    with engine.begin() as conn:
+        # Index names are global in SQLite and Postgres, so drop them before the new tables claim them
+        for name in existing:
+            for index in inspector.get_indexes(name):
+                if index['name']:
+                    conn.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+            conn.execute(text(f'ALTER TABLE "{name}" RENAME TO "{LEGACY_PREFIX}{name}"'))
+
+        db.metadata.create_all(conn)
+
+        expenses = copy_in_batches(
+            conn,
+            f"SELECT id, date, description, total_amount, own_amount, tag, user_id FROM {LEGACY_PREFIX}expense "
+            "WHERE id > :last_id ORDER BY id LIMIT :limit",
+            Expense.__table__,
+            lambda row: {
+                'id': row.id, 'date': parse_date(row.date), 'description': row.description,
+                'total_amount_minor': to_minor(row.total_amount), 'own_amount_minor': to_minor(row.own_amount),
+                'tag': row.tag, 'user_id': row.user_id,
+            },
+            batch_size,
+        )
+        receivables = 0
+        if 'receivable' in existing:
+            receivables = copy_in_batches(
+                conn,
+                f"SELECT id, person_name, amount, is_paid, expense_id FROM {LEGACY_PREFIX}receivable "
+                "WHERE id > :last_id ORDER BY id LIMIT :limit",
+                Receivable.__table__,
+                lambda row: {
+                    'id': row.id, 'person_name': row.person_name, 'amount_minor': to_minor(row.amount),
+                    'is_paid': bool(row.is_paid), 'expense_id': row.expense_id,
+                },
+                batch_size,
+            )
+        budgets = 0
+        if 'budget' in existing:
+            budgets = copy_in_batches(
+                conn,
+                f"SELECT id, amount, period, user_id FROM {LEGACY_PREFIX}budget "
+                "WHERE id > :last_id ORDER BY id LIMIT :limit",
+                Budget.__table__,
+                lambda row: {'id': row.id, 'amount_minor': to_minor(row.amount), 'period': row.period, 'user_id': row.user_id},
+                batch_size,
+            )
+
+        for name in existing:
+            conn.execute(text(f'DROP TABLE "{LEGACY_PREFIX}{name}"'))
+        # The search triggers followed the renamed tables and were dropped with them, which also kept
+        # create_all() from adding them to the new ones; rebuild the index over the converted rows
+        create_search_index(conn, rebuild=True)
+
+    print(f'Converted {expenses} expenses, {receivables} receivables and {budgets} budgets.')
+
+    # The aggregate tables are derived data, so they are rebuilt rather than converted
+    rebuild_aggregates()
+    print('Aggregates rebuilt.')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='Only report whether a migration is needed and which dates would fail.')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--no-backup', action='store_true', help='Skip the SQLite file backup.')
+    args = parser.parse_args()
+
+    # The app refuses to create tables on an old database, which is what this tool is for
+    app = create_app({'CREATE_TABLES': False})
+    with app.app_context():
+        if args.dry_run:
+            if not needs_migration(inspect(db.engine)):
+                print('Schema is already up to date; nothing to do.')
+                return 0
+            with db.engine.connect() as conn:
+                bad_dates = find_bad_dates(conn)
+            print(f'Migration needed; {len(bad_dates)} expenses have unparseable dates.')
+            for expense_id, raw_date in bad_dates[:20]:
+                print(f'  expense {expense_id}: {raw_date!r}')
+            return 1 if bad_dates else 0
+        return migrate(args.batch_size, make_backup=not args.no_backup)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
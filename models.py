@@ -0,0 +1,292 @@
+"""Database models, and the hooks that create_all() runs to bring an existing database up to date.
+
+db is bound to an app by create_app(). Its session is a ShardedSession, which only routes
+statements when the app has a shard router (see sharding.py).
+"""
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+
+from config import Config
+from extensions import get_shard_router
+from sharding import ShardedSession
+
+db = SQLAlchemy(session_options={'class_': ShardedSession})
+
+def default_currency():
+    # Read per insert, so an app created with another BASE_CURRENCY gets its own
+    return current_app.config['BASE_CURRENCY']
+
+# --- Database Models ---
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password = db.Column(db.String(255), nullable=False) # werkzeug hash, see auth.py
+    # Totals, budgets and reports are in this currency
+    base_currency = db.Column(db.String(3), nullable=False, default=default_currency,
+                              server_default=Config.BASE_CURRENCY)
+    expenses = db.relationship('Expense', backref='owner', lazy=True, cascade="all, delete-orphan")
+    tags = db.relationship('Tag', backref='owner', lazy=True, cascade="all, delete-orphan")
+    budget = db.relationship('Budget', backref='user', uselist=False, cascade="all, delete-orphan")
+
+class Expense(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    description = db.Column(db.String(200), nullable=False)
+    total_amount_minor = db.Column(db.Integer, nullable=False) # Amounts are stored in minor units (paise)
+    own_amount_minor = db.Column(db.Integer, nullable=False)
+    tag = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Amounts (and the receivables') are in this currency; base_rate converts them to the owner's base currency
+    currency = db.Column(db.String(3), nullable=False, default=default_currency,
+                         server_default=Config.BASE_CURRENCY)
+    base_rate = db.Column(db.Float, nullable=False, default=1.0, server_default='1')
+    # 'selectin' loads the receivables of a whole page of expenses in one IN query
+    receivables = db.relationship('Receivable', backref='expense', lazy='selectin', cascade="all, delete-orphan")
+
+    # Backs the keyset-paginated feed, which walks (date, id) per user newest first
+    # Tag filters (exports, tag-in-use checks) narrow by (user_id, tag) before the date range
+    __table_args__ = (
+        db.Index('ix_expense_user_date_id', 'user_id', 'date', 'id'),
+        db.Index('ix_expense_user_tag_date', 'user_id', 'tag', 'date'),
+    )
+
+class Receivable(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    person_name = db.Column(db.String(80), nullable=False)
+    amount_minor = db.Column(db.Integer, nullable=False)
+    is_paid = db.Column(db.Boolean, default=False, nullable=False)
+    expense_id = db.Column(db.Integer, db.ForeignKey('expense.id'), nullable=False)
+
+    # Joins from a user's expenses land on (expense_id, is_paid); settling by person starts from the name
+    __table_args__ = (
+        db.Index('ix_receivable_expense_paid', 'expense_id', 'is_paid'),
+        db.Index('ix_receivable_person', 'person_name'),
+    )
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    expense_count = db.Column(db.Integer, nullable=False, default=0, server_default='0') # kept by adjust_aggregates()
+    __table_args__ = (db.Index('uq_tag_user_name', 'user_id', 'name', unique=True),)
+
+class Budget(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    amount_minor = db.Column(db.Integer, nullable=False)
+    period = db.Column(db.String(10), nullable=False, default='monthly') # Can be 'monthly' or 'weekly'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+
+class BudgetPeriod(db.Model):
+    """Spend against the budget over one weekly or monthly window; closed periods are the budget history."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    period = db.Column(db.String(10), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    budget_minor = db.Column(db.Integer, nullable=False)
+    spent_minor = db.Column(db.Integer, nullable=False, default=0) # kept by adjust_aggregates()
+    closed = db.Column(db.Boolean, nullable=False, default=False)
+    __table_args__ = (db.Index('uq_budget_period_user_start', 'user_id', 'start_date', 'period', unique=True),)
+
+class RecurringExpense(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    description = db.Column(db.String(200), nullable=False)
+    amount_minor = db.Column(db.Integer, nullable=False)
+    currency = db.Column(db.String(3), nullable=False, default=default_currency,
+                         server_default=Config.BASE_CURRENCY)
+    tag = db.Column(db.String(50), nullable=False)
+    frequency = db.Column(db.String(10), nullable=False) # 'weekly', 'monthly' or 'yearly'
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date)
+    occurrences = db.Column(db.Integer, nullable=False, default=0) # created so far
+    next_date = db.Column(db.Date, index=True) # None once stopped or past end_date
+
+class RecurringOccurrence(db.Model):
+    """One row per created occurrence; the primary key stops two runs creating the same one."""
+    recurring_id = db.Column(db.Integer, db.ForeignKey('recurring_expense.id'), primary_key=True)
+    occurrence = db.Column(db.Integer, primary_key=True)
+    due_date = db.Column(db.Date, nullable=False)
+
+class ExchangeRate(db.Model):
+    """Units of currency per unit of the reference currency on a day, see currency.py."""
+    currency = db.Column(db.String(3), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    rate = db.Column(db.Float, nullable=False)
+
+class ShardBucket(db.Model):
+    """The shard holding the users of a bucket (user_id % SHARD_BUCKETS), see sharding.py."""
+    bucket = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard = db.Column(db.Integer, nullable=False)
+
+# --- Aggregate Models (kept in sync by the write routes) ---
+class DailyTagTotal(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    tag = db.Column(db.String(50), primary_key=True)
+    amount_minor = db.Column(db.Integer, nullable=False, default=0) # Sum of own_amount_minor
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserTotals(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    total_spent_minor = db.Column(db.Integer, nullable=False, default=0)
+    outstanding_minor = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped by every write to the user's data; the JSON API's ETags are built from it
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+# Columns added to existing tables since their first release: (table, column, DDL, backfill SQL or None)
+ADDED_COLUMNS = (
+    ('tag', 'expense_count', 'INTEGER NOT NULL DEFAULT 0',
+     "UPDATE tag SET expense_count = (SELECT COUNT(*) FROM expense "
+     "WHERE expense.user_id = tag.user_id AND expense.tag = tag.name)"),
+    ('user_totals', 'version', 'INTEGER NOT NULL DEFAULT 0', None),
+    ('user', 'base_currency', f"VARCHAR(3) NOT NULL DEFAULT '{Config.BASE_CURRENCY}'", None),
+    ('expense', 'currency', f"VARCHAR(3) NOT NULL DEFAULT '{Config.BASE_CURRENCY}'", None),
+    ('expense', 'base_rate', 'FLOAT NOT NULL DEFAULT 1', None),
+    ('recurring_expense', 'currency', f"VARCHAR(3) NOT NULL DEFAULT '{Config.BASE_CURRENCY}'", None),
+)
+
+@event.listens_for(db.metadata, 'after_create')
+def _upgrade_existing_tables(target, connection, **kw):
+    # create_all() never alters a table it finds, so older databases get the ADDED_COLUMNS here
+    # and lose any duplicate tags so the unique index below can be built. Registered first so it runs first.
+    inspector = inspect(connection)
+    for table_name, column_name, ddl, backfill in ADDED_COLUMNS:
+        if not inspector.has_table(table_name): # a shard has no user table
+            continue
+        if column_name not in {c['name'] for c in inspector.get_columns(table_name)}:
+            connection.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN {column_name} {ddl}'))
+            if backfill:
+                connection.execute(text(backfill))
+    if 'uq_tag_user_name' not in {index['name'] for index in inspector.get_indexes('tag')}:
+        connection.execute(text("DELETE FROM tag WHERE id NOT IN (SELECT MIN(id) FROM tag GROUP BY user_id, name)"))
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_missing_indexes(target, connection, **kw):
+    # create_all() only builds indexes along with a new table, so indexes added to an
+    # existing table's model are created here on the next start
+    existing_tables = set(inspect(connection).get_table_names())
+    for model_table in target.sorted_tables:
+        if model_table.name not in existing_tables:
+            continue
+        for index in model_table.indexes:
+            index.create(connection, checkfirst=True)
+
+# --- Sharding ---
+# Tables kept in the main database; the others hold per-user rows and live on the user's shard
+GLOBAL_TABLES = ('user', 'exchange_rate', 'shard_bucket')
+SHARDED_TABLES = [model_table for model_table in db.metadata.sorted_tables if model_table.name not in GLOBAL_TABLES]
+
+def read_shard_map(connection):
+    return dict(connection.execute(select(ShardBucket.bucket, ShardBucket.shard)).all())
+
+@event.listens_for(db.metadata, 'after_create')
+def _fill_shard_map(target, connection, **kw):
+    # Stores the default shard of every bucket the map lacks, so a later change of EXPENSES_SHARDS
+    # can't move anyone's data out from under them; from then on only rebalance_shards.py moves buckets
+    shard_router = get_shard_router()
+    if shard_router is None or connection.engine is not db.engine:
+        return
+    stored = read_shard_map(connection)
+    missing = [{'bucket': bucket, 'shard': shard_router.default_shard(bucket)}
+               for bucket in range(shard_router.buckets) if bucket not in stored]
+    if missing:
+        connection.execute(ShardBucket.__table__.insert(), missing)
+    shard_router.set_map(read_shard_map(connection))
+
+# --- Full-Text Search ---
+# SQLite keeps an FTS5 index over each expense's description, tag and the names of the people
+# it was split with, plus an 'owner' token (u<user id>) so a search only ever walks one user's
+# rows. The triggers keep it in step with every write, including the CSV importer's Core
+# inserts, so no route has to remember it. Other databases fall back to LIKE matching.
+SEARCH_INDEX_TABLE = """
+CREATE VIRTUAL TABLE expense_fts USING fts5(
+    description, tag, people, owner, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)
+"""
+SEARCH_INDEX_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_ai AFTER INSERT ON expense BEGIN
+        INSERT INTO expense_fts (rowid, description, tag, people, owner)
+        VALUES (new.id, new.description, new.tag, '', 'u' || new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_au AFTER UPDATE OF description, tag, user_id ON expense BEGIN
+        UPDATE expense_fts SET description = new.description, tag = new.tag, owner = 'u' || new.user_id
+        WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_ad AFTER DELETE ON expense BEGIN
+        DELETE FROM expense_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS receivable_fts_ai AFTER INSERT ON receivable BEGIN
+        UPDATE expense_fts SET people = trim(people || ' ' || new.person_name) WHERE rowid = new.expense_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS receivable_fts_au AFTER UPDATE OF person_name, expense_id ON receivable BEGIN
+        UPDATE expense_fts SET people = coalesce((SELECT group_concat(person_name, ' ') FROM receivable
+                                                 WHERE expense_id = old.expense_id), '') WHERE rowid = old.expense_id;
+        UPDATE expense_fts SET people = coalesce((SELECT group_concat(person_name, ' ') FROM receivable
+                                                 WHERE expense_id = new.expense_id), '') WHERE rowid = new.expense_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS receivable_fts_ad AFTER DELETE ON receivable BEGIN
+        UPDATE expense_fts SET people = coalesce((SELECT group_concat(person_name, ' ') FROM receivable
+                                                 WHERE expense_id = old.expense_id), '') WHERE rowid = old.expense_id;
+    END""",
+]
+SEARCH_INDEX_BACKFILL = """
+INSERT INTO expense_fts (rowid, description, tag, people, owner)
+SELECT expense.id, expense.description, expense.tag, coalesce(people.names, ''), 'u' || expense.user_id
+FROM expense LEFT JOIN (
+    SELECT expense_id, group_concat(person_name, ' ') AS names FROM receivable GROUP BY expense_id
+) AS people ON people.expense_id = expense.id
+"""
+
+def create_search_index(connection, rebuild=False):
+    """Creates the FTS table and its triggers if missing, filling it from the existing rows."""
+    if connection.dialect.name != 'sqlite':
+        return
+    if rebuild:
+        connection.exec_driver_sql("DROP TABLE IF EXISTS expense_fts")
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expense_fts'").first() is not None
+    if not exists:
+        connection.exec_driver_sql(SEARCH_INDEX_TABLE)
+        connection.exec_driver_sql(SEARCH_INDEX_BACKFILL)
+    for trigger in SEARCH_INDEX_TRIGGERS:
+        connection.exec_driver_sql(trigger)
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    create_search_index(connection)
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql("DROP TABLE IF EXISTS expense_fts")
+
+class SchemaMigrationRequired(RuntimeError):
+    pass
+
+def needs_migration(inspector):
+    """True for a database from before native date/amount storage, which migrate_storage.py converts."""
+    if not inspector.has_table('expense'):
+        return False
+    columns = {column['name'] for column in inspector.get_columns('expense')}
+    return 'total_amount_minor' not in columns
+
+def create_tables():
+    """db.create_all() for the current app, run by every worker at startup.
+
+    Workers starting together race to create the same tables; the loser of a race retries once,
+    when the tables it tripped over already exist. A database still in the old storage format is
+    refused before anything is changed, since create_all() would only half-upgrade it.
+    """
+    if needs_migration(inspect(db.engine)):
+        raise SchemaMigrationRequired(f'{db.engine.url.render_as_string(hide_password=True)} still stores dates as '
+                                      'text and amounts as floats; run `python migrate_storage.py` before starting the app.')
+    for attempt in range(2):
+        try:
+            db.create_all()
+            return
+        except DBAPIError:
+            if attempt:
+                raise
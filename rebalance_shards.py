@@ -0,0 +1,250 @@
+"""Moves users' data between shards, and out of the main database into shards.
+
+Users are placed by bucket (user_id % SHARD_BUCKETS) and the shard_bucket table names each
+bucket's shard (see sharding.py). This tool plans a placement over --shards shards and moves every
+bucket whose shard changes:
+  * by default bucket b goes to shard b % N, the placement a new deployment starts with;
+  * with --balance buckets are spread by their number of expenses, largest first onto the least
+    loaded shard, so that a few heavy users don't end up sharing one.
+A bucket's expenses, splits, tags, budgets, recurring rules and aggregate rows are copied to the
+new shard, its map row is switched, then the old copies are deleted. Ids already taken on the new
+shard are shifted past its highest id, together with the splits and occurrences pointing at them.
+
+Rows still in the main database from before sharding was switched on are first moved to their
+bucket's shard, which is how an existing deployment is migrated:
+
+    EXPENSES_SHARDS=4 python rebalance_shards.py
+
+Usage: python rebalance_shards.py [--shards N] [--balance] [--dry-run] [--batch-size 5000]
+
+Stop the app and job workers first: workers cache the bucket map for SHARD_MAP_MAX_AGE_SECONDS
+and would keep writing a moved bucket to its old shard. An interrupted run is finished by running
+the tool again; rows an interrupted move left on a shard the map doesn't name are deleted at the
+end of every run.
+"""
+import argparse
+import sys
+
+from flask import current_app
+from sqlalchemy import delete, func, select, text, update
+
+from app import create_app
+from extensions import get_shard_router, response_cache
+from models import db, User, ShardBucket, SHARDED_TABLES, read_shard_map
+
+ID_CHUNK = 500 # user ids per IN list
+
+
+def chunks(values, size=ID_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def table_plan():
+    """(table, foreign key column, parent table) for every sharded table, parents first.
+
+    Tables with a user_id column are selected by it (no foreign key); the others through their
+    foreign key to another sharded table.
+    """
+    sharded = set(SHARDED_TABLES)
+    plan = []
+    for table in SHARDED_TABLES:
+        if 'user_id' in table.c:
+            plan.append((table, None, None))
+        else:
+            fk = next(fk for fk in table.foreign_keys if fk.column.table in sharded)
+            plan.append((table, fk.parent, fk.column.table))
+    return plan
+
+
+def owned_by(table, fk_column, parent, user_ids):
+    if fk_column is None:
+        return table.c.user_id.in_(user_ids)
+    return fk_column.in_(select(parent.c[list(parent.primary_key)[0].name]).where(parent.c.user_id.in_(user_ids)))
+
+
+def delete_rows(conn, user_ids):
+    """Deletes every sharded row of user_ids on one database, children first."""
+    deleted = 0
+    for table, fk_column, parent in reversed(table_plan()):
+        for chunk in chunks(user_ids):
+            deleted += conn.execute(delete(table).where(owned_by(table, fk_column, parent, chunk))).rowcount
+    return deleted
+
+
+def copy_rows(source, dest, user_ids, batch_size):
+    """Copies every sharded row of user_ids from source to dest; returns the number of expenses copied."""
+    offsets, copied_expenses = {}, 0
+    for table, fk_column, parent in table_plan():
+        id_column = table.autoincrement_column
+        if id_column is not None:
+            chunk_mins = [source.execute(select(func.min(id_column)).where(owned_by(table, fk_column, parent, chunk))).scalar()
+                          for chunk in chunks(user_ids)]
+            source_min = min((value for value in chunk_mins if value is not None), default=None)
+            dest_max = dest.execute(select(func.max(id_column))).scalar() or 0
+            # Ids are kept when they are all free on the destination
+            offsets[table.name] = max(0, dest_max + 1 - source_min) if source_min is not None else 0
+
+        def convert(row):
+            values = dict(row._mapping)
+            if id_column is not None:
+                values[id_column.name] += offsets[table.name]
+            if fk_column is not None:
+                values[fk_column.name] += offsets.get(parent.name, 0)
+            if table.name == 'user_totals':
+                values['version'] += 1 # ids changed, so cached API responses must not revalidate
+            return values
+
+        for chunk in chunks(user_ids):
+            result = source.execution_options(yield_per=batch_size).execute(
+                select(table).where(owned_by(table, fk_column, parent, chunk)))
+            for rows in result.partitions():
+                dest.execute(table.insert(), [convert(row) for row in rows])
+                if table.name == 'expense':
+                    copied_expenses += len(rows)
+
+        if id_column is not None and dest.dialect.name == 'postgresql':
+            # Explicit ids don't advance the sequence, so the next insert would reuse one
+            dest.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.name}', '{id_column.name}'), "
+                              f"coalesce(max({id_column.name}), 1)) FROM {table.name}"))
+    return copied_expenses
+
+
+def move_users(user_ids, source_engine, dest_engine, batch_size, switch_map=None):
+    """Copies user_ids' rows to dest, runs switch_map(), then deletes them from source.
+
+    The destination's copies are cleared first, so repeating a move that was cut short is safe.
+    """
+    with dest_engine.begin() as dest, source_engine.connect() as source:
+        delete_rows(dest, user_ids)
+        copied = copy_rows(source, dest, user_ids, batch_size)
+    if switch_map:
+        switch_map()
+    with source_engine.begin() as source:
+        delete_rows(source, user_ids)
+    for uid in user_ids:
+        response_cache.invalidate_user(uid)
+    return copied
+
+
+def users_with_rows(engine):
+    """Ids of the users owning rows on one database."""
+    user_ids = set()
+    with engine.connect() as conn:
+        for table, fk_column, _ in table_plan():
+            if fk_column is None:
+                user_ids.update(uid for (uid,) in conn.execute(select(table.c.user_id).distinct()))
+    return user_ids
+
+
+def expenses_per_bucket(engine, buckets):
+    expense = next(table for table in SHARDED_TABLES if table.name == 'expense')
+    bucket = (expense.c.user_id % buckets).label('bucket')
+    with engine.connect() as conn:
+        return dict(conn.execute(select(bucket, func.count()).group_by(bucket)).all())
+
+
+def plan_placement(current, sizes, shard_count, buckets, balance):
+    if not balance:
+        return {bucket: bucket % shard_count for bucket in range(buckets)}
+    loads, target = [0] * shard_count, {}
+    for bucket in sorted(range(buckets), key=lambda b: (-sizes.get(b, 0), b)):
+        # Least loaded shard first; on a tie, stay put
+        shard = min(range(shard_count), key=lambda s: (loads[s], s != current.get(bucket), s))
+        target[bucket] = shard
+        # Counting each bucket once more spreads the empty ones (and future sign-ups) evenly
+        loads[shard] += sizes.get(bucket, 0) + 1
+    return target
+
+
+def shard_loads(placement, sizes):
+    loads = {}
+    for bucket, shard in placement.items():
+        loads[shard] = loads.get(shard, 0) + sizes.get(bucket, 0)
+    return loads
+
+
+def set_bucket_shard(bucket, shard):
+    with db.engine.begin() as conn:
+        conn.execute(update(ShardBucket).where(ShardBucket.bucket == bucket).values(shard=shard))
+
+
+def rebalance(shard_count, balance, batch_size, dry_run):
+    shard_router = get_shard_router()
+    buckets = shard_router.buckets
+    with db.engine.connect() as conn:
+        current = read_shard_map(conn)
+    users_by_bucket = {}
+    for (uid,) in db.session.query(User.id):
+        users_by_bucket.setdefault(uid % buckets, []).append(uid)
+
+    main_users = users_with_rows(db.engine)
+    sizes = expenses_per_bucket(db.engine, buckets)
+    for shard in sorted(set(current.values())):
+        for bucket, count in expenses_per_bucket(shard_router.engine(shard), buckets).items():
+            sizes[bucket] = sizes.get(bucket, 0) + count
+
+    target = plan_placement(current, sizes, shard_count, buckets, balance)
+    moves = sorted(bucket for bucket in range(buckets) if target[bucket] != current[bucket])
+    before, after = shard_loads(current, sizes), shard_loads(target, sizes)
+    print(f'{len(main_users)} users still in the main database, {len(moves)} of {buckets} buckets to move.')
+    for shard in sorted(before.keys() | after.keys()):
+        print(f'  shard {shard}: {before.get(shard, 0):>10} expenses now, {after.get(shard, 0):>10} after')
+    if dry_run:
+        for bucket in moves:
+            if bucket in users_by_bucket:
+                print(f'  bucket {bucket}: shard {current[bucket]} -> {target[bucket]} ({sizes.get(bucket, 0)} expenses)')
+        return 0
+
+    migrated = 0
+    main_by_bucket = {}
+    for uid in main_users:
+        main_by_bucket.setdefault(uid % buckets, []).append(uid)
+    for bucket, user_ids in sorted(main_by_bucket.items()):
+        migrated += move_users(user_ids, db.engine, shard_router.engine(current[bucket]), batch_size)
+    if main_users:
+        print(f'Moved {migrated} expenses of {len(main_users)} users out of the main database.')
+
+    moved = 0
+    for bucket in moves:
+        source_engine, dest_engine = shard_router.engine(current[bucket]), shard_router.engine(target[bucket])
+        moved += move_users(users_by_bucket.get(bucket, []), source_engine, dest_engine, batch_size,
+                            switch_map=lambda: set_bucket_shard(bucket, target[bucket]))
+    print(f'Moved {len(moves)} buckets ({moved} expenses).')
+
+    # Rows an interrupted run left behind on a shard their bucket has since moved away from
+    stray = 0
+    for shard in sorted(set(current.values()) | set(target.values())):
+        engine = shard_router.engine(shard)
+        leftover = [uid for uid in users_with_rows(engine) if target[uid % buckets] != shard]
+        if leftover:
+            with engine.begin() as conn:
+                stray += delete_rows(conn, leftover)
+    if stray:
+        print(f'Deleted {stray} stray rows.')
+    if shard_count != current_app.config['SHARD_COUNT']:
+        print(f'Set EXPENSES_SHARDS={shard_count} for the app; the bucket map already routes every user.')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, default=None, help='Shards to spread the buckets over (default EXPENSES_SHARDS).')
+    parser.add_argument('--balance', action='store_true', help='Place buckets by their number of expenses.')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the plan.')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = create_app()
+    shard_count = args.shards or app.config['SHARD_COUNT']
+    with app.app_context():
+        if get_shard_router() is None:
+            print('Sharding is off; set EXPENSES_SHARDS to the number of shards (and EXPENSES_SHARD_URI if needed).')
+            return 1
+        db.create_all() # also stores the default placement of any bucket not in the map yet
+        return rebalance(shard_count, args.balance, args.batch_size, args.dry_run)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
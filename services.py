@@ -0,0 +1,669 @@
+"""Logic shared by the blueprints, the background jobs and the CLI commands.
+
+Everything here runs inside an app context and reads its settings from current_app.config;
+the per-app service objects come from extensions.py.
+"""
+import calendar
+import hashlib
+import json
+import os
+from contextlib import nullcontext
+from datetime import date, datetime, timezone, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import wraps
+
+from flask import current_app, jsonify, redirect, request, session, url_for
+from sqlalchemy import and_, bindparam, create_engine, delete, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from config import engine_options, register_sqlite_pragmas
+from currency import MissingRateError, normalize_currency, to_base, read_rates_path
+from extensions import exchange_rates, get_shard_router, response_cache, tag_registry
+from instrumentation import instrument_engine
+from models import (db, User, Expense, Receivable, Tag, Budget, BudgetPeriod, RecurringExpense, RecurringOccurrence,
+                    ExchangeRate, DailyTagTotal, UserTotals, SHARDED_TABLES, read_shard_map)
+from sharding import ensure_schema
+
+# --- User Authentication Decorator ---
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('auth.login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# --- Date and Amount Helpers ---
+# Accepted input date formats, tried in order. Day-first wins over month-first for ambiguous dates.
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%m/%d/%Y', '%d %b %Y', '%d %B %Y')
+
+def parse_date(value):
+    """Parses a date string in any of DATE_FORMATS. Raises ValueError if none match."""
+    value = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date '{value}'")
+
+def utc_today():
+    """Today's date in UTC, the calendar every period, budget and age in the app is counted in."""
+    return datetime.now(timezone.utc).date()
+
+def to_minor(value):
+    """Converts a user-entered amount (string or number) to integer minor units, rounding half up."""
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, TypeError) as e:
+        raise ValueError(f"Invalid amount '{value}'") from e
+    if not amount.is_finite():
+        raise ValueError(f"Invalid amount '{value}'")
+    return int((amount * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def from_minor(amount_minor):
+    """Converts minor units back to a major-unit number for JSON payloads and charts."""
+    return (amount_minor or 0) / 100
+
+def format_money(amount_minor):
+    """Formats minor units as a two-decimal string without going through a float."""
+    amount_minor = amount_minor or 0
+    sign = '-' if amount_minor < 0 else ''
+    return f"{sign}{abs(amount_minor) // 100}.{abs(amount_minor) % 100:02d}"
+
+# --- Sharding ---
+def load_shard_map():
+    with db.engine.connect() as connection:
+        return read_shard_map(connection)
+
+def make_shard_engine(shard):
+    """Opens a shard with the same pool and pragma settings as the main database, creating or upgrading its tables."""
+    url = make_url(current_app.config['SHARD_URI'].format(shard=shard))
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+        if not os.path.isabs(url.database): # relative like Flask-SQLAlchemy's own SQLite paths
+            url = url.set(database=os.path.join(current_app.instance_path, url.database))
+        os.makedirs(os.path.dirname(url.database), exist_ok=True)
+    engine = create_engine(url, **engine_options(url.render_as_string(hide_password=False)))
+    register_sqlite_pragmas(engine, current_app.config['SQLITE_PRAGMAS'])
+    if current_app.config['INSTRUMENTATION_ENABLED']:
+        instrument_engine(engine)
+    for attempt in range(2):
+        try:
+            with engine.begin() as connection:
+                ensure_schema(connection)
+                db.metadata.create_all(connection, tables=SHARDED_TABLES)
+            break
+        except DBAPIError:
+            # Another worker created the tables of the same new shard between our checks and our CREATEs
+            if attempt:
+                raise
+    return engine
+
+def user_shard(user_id):
+    """Selects the user's shard for the block, for work done outside their own requests (a no-op unsharded)."""
+    shard_router = get_shard_router()
+    return shard_router.use_user(user_id) if shard_router else nullcontext()
+
+def across_shards(user_ids=None):
+    """Yields the part of user_ids on each shard in turn, with that shard selected for the loop body.
+
+    With user_ids None every shard is visited and None is yielded; unsharded there is one pass over
+    everything. Ids repeat across shards, so the session is emptied before each new shard: commit
+    before moving on.
+    """
+    shard_router = get_shard_router()
+    if shard_router is None:
+        yield user_ids
+        return
+    if user_ids is None:
+        groups = {shard: None for shard in shard_router.shards()}
+    else:
+        groups = {}
+        for uid in user_ids:
+            groups.setdefault(shard_router.shard_for_user(uid), []).append(uid)
+    for index, (shard, shard_user_ids) in enumerate(groups.items()):
+        if index:
+            db.session.close()
+        with shard_router.use(shard):
+            yield shard_user_ids
+
+# --- Currency Conversion ---
+# Each expense keeps its own currency plus the rate into its owner's base currency, fixed when it
+# is written. The aggregate tables only ever hold base-currency amounts, so totals, budgets,
+# reports and comparisons need no conversion when they are read.
+def load_rate_series(currency):
+    rows = db.session.query(ExchangeRate.day, ExchangeRate.rate).filter(
+        ExchangeRate.currency == currency
+    ).order_by(ExchangeRate.day).all()
+    return [day for day, _ in rows], [rate for _, rate in rows]
+
+def load_rate_currencies():
+    return [currency for (currency,) in db.session.query(ExchangeRate.currency).distinct()]
+
+def get_base_currency(user_id):
+    return db.session.query(User.base_currency).filter(User.id == user_id).scalar() or current_app.config['BASE_CURRENCY']
+
+def available_currencies(base_currency):
+    return sorted(exchange_rates.currencies() | {base_currency})
+
+def read_currency(value, base_currency):
+    """The currency named by a form or CSV value (blank means the base currency). Raises ValueError."""
+    currency = normalize_currency(value) if (value or '').strip() else base_currency
+    if currency != base_currency and currency not in exchange_rates.currencies():
+        raise MissingRateError(f"No exchange rates for {currency}")
+    return currency
+
+def in_base(amount):
+    """SQL for an expense amount (own share or a receivable) in the owner's base currency, rounded like to_base()."""
+    converted = amount * Expense.base_rate
+    # Amounts are positive, where SQLite's ROUND() and floor(x + 0.5) both round half up as to_base() does
+    rounded = db.func.round(converted) if db.engine.dialect.name == 'sqlite' else db.func.floor(converted + 0.5)
+    return db.cast(rounded, db.Integer)
+
+def dialect_insert(model_table):
+    """An INSERT with the database's ON CONFLICT support; the PostgreSQL dialect is only imported when in use."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model_table)
+
+def load_rates(path, batch_size=5000):
+    """Upserts every rate in a rates CSV into exchange_rate; returns how many rows were read."""
+    stmt = dialect_insert(ExchangeRate.__table__)
+    stmt = stmt.on_conflict_do_update(index_elements=['currency', 'day'], set_={'rate': stmt.excluded.rate})
+    count, batch = 0, []
+    for currency, day, rate in read_rates_path(path):
+        batch.append({'currency': currency, 'day': day, 'rate': rate})
+        if len(batch) >= batch_size:
+            db.session.execute(stmt, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(stmt, batch)
+        count += len(batch)
+    db.session.commit()
+    exchange_rates.clear()
+    return count
+
+def change_base_currency(user, currency, today=None):
+    """Moves a user's totals, budget and reports to another base currency.
+
+    Every expense is re-rated with one memoized lookup per distinct (currency, day) and one
+    executemany, then the aggregates are rebuilt in SQL. The budget is converted at today's rate.
+    Raises MissingRateError before anything is changed if a rate is missing.
+    """
+    today = today or utc_today()
+    pairs = db.session.query(Expense.currency, Expense.date).filter(Expense.user_id == user.id).distinct().all()
+    rates = exchange_rates.conversions(pairs, currency)
+    budget_rate = exchange_rates.conversion(user.base_currency, currency, today)
+
+    expenses = Expense.__table__
+    if rates:
+        db.session.execute(
+            update(expenses).where(expenses.c.user_id == bindparam('e_user_id'), expenses.c.currency == bindparam('e_currency'),
+                                   expenses.c.date == bindparam('e_date'))
+            .values(base_rate=bindparam('e_rate')),
+            [{'e_user_id': user.id, 'e_currency': pair_currency, 'e_date': day, 'e_rate': rate}
+             for (pair_currency, day), rate in rates.items()]
+        )
+    if user.budget:
+        user.budget.amount_minor = to_base(user.budget.amount_minor, budget_rate)
+    for budget_period in BudgetPeriod.query.filter_by(user_id=user.id):
+        budget_period.budget_minor = to_base(budget_period.budget_minor, budget_rate)
+    user.base_currency = currency
+    rebuild_aggregates(user.id)
+
+# --- Aggregate Helpers ---
+def adjust_aggregates(user_id, day_tag_deltas=None, owed_delta=0):
+    """Applies deltas to the summary tables as part of the caller's transaction.
+
+    day_tag_deltas maps (day, tag) to an (amount_minor, expense_count) delta; the counts
+    also move the tags' usage counts, the amounts the budget periods covering each day.
+    Every change is an increment done by the database, so concurrent writers can't lose
+    each other's updates.
+    """
+    day_tag_deltas = {key: delta for key, delta in (day_tag_deltas or {}).items() if delta != (0, 0)}
+    spent_delta = 0
+    tag_count_deltas = {}
+    day_amounts = {}
+    for (day, tag), (amount, count) in day_tag_deltas.items():
+        spent_delta += amount
+        tag_count_deltas[tag] = tag_count_deltas.get(tag, 0) + count
+        day_amounts[day] = day_amounts.get(day, 0) + amount
+    if day_tag_deltas:
+        db.session.execute(upsert(DailyTagTotal, ['user_id', 'day', 'tag'], ['amount_minor', 'expense_count']), [
+            {'user_id': user_id, 'day': day, 'tag': tag, 'amount_minor': amount, 'expense_count': count}
+            for (day, tag), (amount, count) in day_tag_deltas.items()
+        ])
+        # Days and tags left without expenses
+        db.session.execute(delete(DailyTagTotal).where(
+            DailyTagTotal.user_id == user_id, DailyTagTotal.day.in_(day_amounts), DailyTagTotal.expense_count <= 0
+        ).execution_options(synchronize_session=False))
+
+    for tag, count in tag_count_deltas.items():
+        if count:
+            db.session.execute(update(Tag).where(Tag.user_id == user_id, Tag.name == tag)
+                               .values(expense_count=Tag.expense_count + count)
+                               .execution_options(synchronize_session=False))
+    add_budget_period_spend([{'b_user_id': user_id, 'b_day': day, 'b_amount': amount}
+                             for day, amount in day_amounts.items()])
+    db.session.execute(upsert(UserTotals, ['user_id'], ['total_spent_minor', 'outstanding_minor', 'version']),
+                       {'user_id': user_id, 'total_spent_minor': spent_delta, 'outstanding_minor': owed_delta, 'version': 1})
+
+def touch_user(user_id):
+    """Bumps the user's change counter, for writes that don't move any aggregate (tags, budgets, rules)."""
+    touch_users([user_id])
+
+def touch_users(user_ids):
+    if user_ids:
+        db.session.execute(upsert(UserTotals, ['user_id'], ['version']), [
+            {'user_id': user_id, 'total_spent_minor': 0, 'outstanding_minor': 0, 'version': 1} for user_id in user_ids
+        ])
+
+def get_user_version(user_id):
+    return db.session.query(UserTotals.version).filter(UserTotals.user_id == user_id).scalar() or 0
+
+def add_budget_period_spend(rows):
+    """Adds each row's b_amount to the user's budget periods that contain b_day, in one executemany."""
+    rows = [row for row in rows if row['b_amount']]
+    if not rows:
+        return
+    periods = BudgetPeriod.__table__
+    db.session.execute(
+        update(periods)
+        .where(periods.c.user_id == bindparam('b_user_id'),
+               periods.c.start_date <= bindparam('b_day'), periods.c.end_date >= bindparam('b_day'))
+        .values(spent_minor=periods.c.spent_minor + bindparam('b_amount')),
+        rows
+    )
+
+def upsert(model, index_elements, increments):
+    """INSERT .. ON CONFLICT DO UPDATE adding the new values of `increments` to the stored ones."""
+    model_table = model.__table__
+    stmt = dialect_insert(model_table)
+    return stmt.on_conflict_do_update(index_elements=index_elements, set_={
+        name: model_table.c[name] + stmt.excluded[name] for name in increments
+    })
+
+def add_to_aggregates(day_tag_deltas_by_user):
+    """Bulk version of adjust_aggregates() for many users at once, for writers that only add expenses.
+
+    day_tag_deltas_by_user maps user_id to day_tag_deltas. Every table is brought up to date
+    with a handful of executemany statements, however many users are involved.
+    """
+    day_rows, tag_rows, period_rows, spent = [], {}, {}, {}
+    for user_id, day_tag_deltas in day_tag_deltas_by_user.items():
+        for (day, tag), (amount, count) in day_tag_deltas.items():
+            day_rows.append({'user_id': user_id, 'day': day, 'tag': tag, 'amount_minor': amount, 'expense_count': count})
+            tag_rows[user_id, tag] = tag_rows.get((user_id, tag), 0) + count
+            period_rows[user_id, day] = period_rows.get((user_id, day), 0) + amount
+            spent[user_id] = spent.get(user_id, 0) + amount
+    if not day_rows:
+        return
+    db.session.execute(upsert(DailyTagTotal, ['user_id', 'day', 'tag'], ['amount_minor', 'expense_count']), day_rows)
+    db.session.execute(upsert(UserTotals, ['user_id'], ['total_spent_minor', 'version']), [
+        {'user_id': user_id, 'total_spent_minor': amount, 'outstanding_minor': 0, 'version': 1}
+        for user_id, amount in spent.items()
+    ])
+    tags = Tag.__table__
+    db.session.execute(
+        update(tags).where(tags.c.user_id == bindparam('t_user_id'), tags.c.name == bindparam('t_name'))
+        .values(expense_count=tags.c.expense_count + bindparam('t_count')),
+        [{'t_user_id': user_id, 't_name': tag, 't_count': count} for (user_id, tag), count in tag_rows.items()]
+    )
+    add_budget_period_spend([{'b_user_id': user_id, 'b_day': day, 'b_amount': amount}
+                             for (user_id, day), amount in period_rows.items()])
+
+def expense_deltas(expense, sign=1):
+    """Returns the (day_tag_deltas, owed_delta) an expense contributes in base currency, negated when sign is -1."""
+    unpaid = sum(to_base(r.amount_minor, expense.base_rate) for r in expense.receivables if not r.is_paid)
+    return {(expense.date, expense.tag): (sign * to_base(expense.own_amount_minor, expense.base_rate), sign)}, sign * unpaid
+
+def merge_deltas(*delta_maps):
+    merged = {}
+    for deltas in delta_maps:
+        for key, (amount, count) in deltas.items():
+            old_amount, old_count = merged.get(key, (0, 0))
+            merged[key] = (old_amount + amount, old_count + count)
+    return merged
+
+def get_user_totals(user_id):
+    """Returns (total_spent_minor, outstanding_minor) for a user."""
+    totals = db.session.get(UserTotals, user_id)
+    if totals is None:
+        return 0, 0
+    return totals.total_spent_minor, totals.outstanding_minor
+
+def get_tag_totals(user_id, start_date=None, end_date=None):
+    """Sums own spend per tag (minor units) from the daily aggregates; cost is O(days in range), not O(expenses)."""
+    query = db.session.query(DailyTagTotal.tag, db.func.sum(DailyTagTotal.amount_minor)).filter(
+        DailyTagTotal.user_id == user_id
+    )
+    if start_date:
+        query = query.filter(DailyTagTotal.day >= start_date)
+    if end_date:
+        query = query.filter(DailyTagTotal.day <= end_date)
+    return {tag: amount for tag, amount in query.group_by(DailyTagTotal.tag)}
+
+def period_bounds(period, day):
+    """First and last day of the weekly (Monday to Sunday) or monthly window containing day."""
+    if period == 'weekly':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    return day.replace(day=1), day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+def spent_between(user_id, start, end):
+    return db.session.query(db.func.sum(DailyTagTotal.amount_minor)).filter(
+        DailyTagTotal.user_id == user_id,
+        DailyTagTotal.day >= start,
+        DailyTagTotal.day <= end
+    ).scalar() or 0
+
+def get_budget_period(budget, today):
+    """The stored period of this budget containing today, opened on the spot if the scheduler hasn't yet."""
+    start, end = period_bounds(budget.period, today)
+    budget_period = BudgetPeriod.query.filter_by(user_id=budget.user_id, start_date=start, period=budget.period).first()
+    if budget_period is None:
+        budget_period = BudgetPeriod(user_id=budget.user_id, period=budget.period, start_date=start, end_date=end,
+                                     budget_minor=budget.amount_minor, spent_minor=spent_between(budget.user_id, start, end))
+        db.session.add(budget_period)
+        try:
+            db.session.commit()
+        except IntegrityError: # opened by a concurrent request
+            db.session.rollback()
+            budget_period = BudgetPeriod.query.filter_by(user_id=budget.user_id, start_date=start, period=budget.period).one()
+    return budget_period
+
+def get_budget_data(user):
+    """Spend against the user's budget for the current weekly or monthly window, read from its stored period."""
+    user_budget = user.budget
+    budget_data = {'budget_obj': user_budget, 'spent': 0, 'remaining': 0, 'percent': 0}
+    if user_budget:
+        spent_this_period = get_budget_period(user_budget, utc_today()).spent_minor
+        budget_data['spent'] = spent_this_period
+        budget_data['remaining'] = user_budget.amount_minor - spent_this_period
+        if user_budget.amount_minor > 0:
+            budget_data['percent'] = min(100, (spent_this_period / user_budget.amount_minor) * 100)
+    return budget_data
+
+def get_budget_history(user_id, limit=None):
+    """Closed budget periods, newest first."""
+    return BudgetPeriod.query.filter_by(user_id=user_id, closed=True).order_by(
+        BudgetPeriod.start_date.desc()
+    ).limit(limit or current_app.config['BUDGET_HISTORY_LIMIT']).all()
+
+def rebuild_aggregates(user_id=None, verify_only=False):
+    """Recomputes the aggregate tables from raw expenses.
+
+    With verify_only nothing is written; the list of mismatches is returned instead.
+    """
+    user_ids = [user_id] if user_id else [uid for (uid,) in db.session.query(User.id)]
+    mismatches = []
+    for shard_user_ids in across_shards(user_ids):
+        mismatches.extend(_rebuild_aggregates(shard_user_ids, verify_only))
+    return mismatches
+
+def _rebuild_aggregates(user_ids, verify_only):
+    mismatches = []
+    for uid in user_ids:
+        raw_days = {
+            (day, tag): (amount, count)
+            for day, tag, amount, count in db.session.query(
+                Expense.date, Expense.tag, db.func.sum(in_base(Expense.own_amount_minor)), db.func.count(Expense.id)
+            ).filter(Expense.user_id == uid).group_by(Expense.date, Expense.tag)
+        }
+        raw_spent = sum(amount for amount, _ in raw_days.values())
+        raw_tag_counts = {}
+        for (_, tag), (_, count) in raw_days.items():
+            raw_tag_counts[tag] = raw_tag_counts.get(tag, 0) + count
+        raw_owed = db.session.query(db.func.sum(in_base(Receivable.amount_minor))).join(Expense).filter(
+            Expense.user_id == uid,
+            Receivable.is_paid == False
+        ).scalar() or 0
+
+        if verify_only:
+            stored_days = {
+                (row.day, row.tag): (row.amount_minor, row.expense_count)
+                for row in DailyTagTotal.query.filter_by(user_id=uid)
+            }
+            for key in raw_days.keys() | stored_days.keys():
+                if raw_days.get(key, (0, 0)) != stored_days.get(key, (0, 0)):
+                    mismatches.append((uid, key, raw_days.get(key, (0, 0)), stored_days.get(key, (0, 0))))
+            total_spent, total_owed = get_user_totals(uid)
+            if raw_spent != total_spent:
+                mismatches.append((uid, 'total_spent_minor', raw_spent, total_spent))
+            if raw_owed != total_owed:
+                mismatches.append((uid, 'outstanding_minor', raw_owed, total_owed))
+            for tag in Tag.query.filter_by(user_id=uid):
+                if raw_tag_counts.get(tag.name, 0) != tag.expense_count:
+                    mismatches.append((uid, f'tag {tag.name}', raw_tag_counts.get(tag.name, 0), tag.expense_count))
+            for budget_period in BudgetPeriod.query.filter_by(user_id=uid):
+                raw_period = sum(amount for (day, _), (amount, _) in raw_days.items()
+                                 if budget_period.start_date <= day <= budget_period.end_date)
+                if raw_period != budget_period.spent_minor:
+                    mismatches.append((uid, f'budget period {budget_period.start_date}', raw_period, budget_period.spent_minor))
+            continue
+
+        DailyTagTotal.query.filter_by(user_id=uid).delete()
+        db.session.add_all([
+            DailyTagTotal(user_id=uid, day=day, tag=tag, amount_minor=amount, expense_count=count)
+            for (day, tag), (amount, count) in raw_days.items()
+        ])
+        totals = db.session.get(UserTotals, uid) or UserTotals(user_id=uid, version=0)
+        totals.total_spent_minor = raw_spent
+        totals.outstanding_minor = raw_owed
+        totals.version += 1
+        db.session.add(totals)
+        for tag in Tag.query.filter_by(user_id=uid):
+            tag.expense_count = raw_tag_counts.get(tag.name, 0)
+        for budget_period in BudgetPeriod.query.filter_by(user_id=uid):
+            budget_period.spent_minor = sum(amount for (day, _), (amount, _) in raw_days.items()
+                                            if budget_period.start_date <= day <= budget_period.end_date)
+
+    if not verify_only:
+        db.session.commit()
+        for uid in user_ids:
+            response_cache.invalidate_user(uid)
+    return mismatches
+
+# --- Tag Registry ---
+def load_user_tags(user_id):
+    return {name: count for name, count in db.session.query(Tag.name, Tag.expense_count).filter_by(user_id=user_id)}
+
+def get_user_tags(user_id):
+    """The user's tags as {name: number of expenses using it}, from the in-process registry.
+
+    The registry checks the user's change counter in the database on every call, so tags
+    added or used through another worker or a background job show up on the next call.
+    """
+    return tag_registry.get(user_id)
+
+def tags_response(user_id, message):
+    tags = get_user_tags(user_id)
+    return jsonify({'success': True, 'message': message, 'tags': sorted(tags), 'usage': tags})
+
+# --- Recurring Expenses and Budget Rollover ---
+RECURRING_FREQUENCIES = ('weekly', 'monthly', 'yearly')
+
+def occurrence_date(start, frequency, n):
+    """Date of the n-th occurrence (0 is start). Always counted from start, so the 31st stays the 31st when it exists."""
+    if frequency == 'weekly':
+        return start + timedelta(weeks=n)
+    month_index = start.month - 1 + n * (12 if frequency == 'yearly' else 1)
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+def next_occurrence(rule, n):
+    """Date of occurrence n, or None if it falls after the rule's end date."""
+    due = occurrence_date(rule.start_date, rule.frequency, n)
+    return None if rule.end_date and due > rule.end_date else due
+
+def materialize_recurring(today=None, user_id=None, batch_size=None, progress=None):
+    """Creates the expenses of every recurring rule that has come due by today; returns how many.
+
+    Rules are taken in id order, batch_size at a time, and each batch is one transaction.
+    A rule missed for a while catches up on every occurrence it missed (at most
+    RECURRING_MAX_CATCH_UP per run). Each occurrence is first claimed in RecurringOccurrence,
+    so if two runs overlap, the batch that loses the race rolls back and is read again.
+    """
+    today = today or utc_today()
+    batch_size = batch_size or current_app.config['RECURRING_BATCH_SIZE']
+    created, last_id, retries = 0, 0, 0
+    while True:
+        query = RecurringExpense.query.filter(RecurringExpense.next_date <= today, RecurringExpense.id > last_id)
+        if user_id is not None:
+            query = query.filter(RecurringExpense.user_id == user_id)
+        rules = query.order_by(RecurringExpense.id).limit(batch_size).all()
+        if not rules:
+            return created
+        try:
+            created += _materialize_batch(rules, today)
+        except IntegrityError:
+            db.session.rollback()
+            retries += 1
+            if retries > 3:
+                raise
+            continue
+        last_id, retries = rules[-1].id, 0
+        if progress:
+            progress(created)
+
+def _materialize_batch(rules, today):
+    claims, expense_rows, rule_updates, deltas = [], [], [], {}
+    base_currencies = dict(db.session.query(User.id, User.base_currency).filter(User.id.in_({rule.user_id for rule in rules})))
+    for rule in rules:
+        n, due = rule.occurrences, rule.next_date
+        base_currency = base_currencies.get(rule.user_id, current_app.config['BASE_CURRENCY'])
+        for _ in range(current_app.config['RECURRING_MAX_CATCH_UP']):
+            if due is None or due > today:
+                break
+            try:
+                base_rate = exchange_rates.conversion(rule.currency, base_currency, due)
+            except MissingRateError as e:
+                # Left due, so the next run picks it up once the rates are loaded
+                current_app.logger.warning('Recurring expense %s not created: %s', rule.id, e)
+                break
+            claims.append({'recurring_id': rule.id, 'occurrence': n, 'due_date': due})
+            expense_rows.append({'date': due, 'description': rule.description, 'total_amount_minor': rule.amount_minor,
+                                 'own_amount_minor': rule.amount_minor, 'tag': rule.tag, 'user_id': rule.user_id,
+                                 'currency': rule.currency, 'base_rate': base_rate})
+            user_deltas = deltas.setdefault(rule.user_id, {})
+            amount, count = user_deltas.get((due, rule.tag), (0, 0))
+            user_deltas[due, rule.tag] = (amount + to_base(rule.amount_minor, base_rate), count + 1)
+            n += 1
+            due = next_occurrence(rule, n)
+        rule_updates.append({'id': rule.id, 'occurrences': n, 'next_date': due})
+
+    if claims:
+        db.session.execute(RecurringOccurrence.__table__.insert(), claims)
+        db.session.execute(Expense.__table__.insert(), expense_rows)
+    db.session.execute(update(RecurringExpense), rule_updates)
+    add_to_aggregates(deltas)
+    db.session.commit()
+    for uid in deltas:
+        response_cache.invalidate_user(uid)
+    return len(expense_rows)
+
+def roll_budget_periods(today=None, batch_size=None):
+    """Closes budget periods that have ended and opens the current one for every budget.
+
+    A new period starts with whatever was already spent in it, so a run after some downtime
+    still opens it with the right total. Returns (closed, opened).
+    """
+    today = today or utc_today()
+    batch_size = batch_size or current_app.config['RECURRING_BATCH_SIZE']
+    ended = BudgetPeriod.query.filter(BudgetPeriod.closed == False, BudgetPeriod.end_date < today)
+    touch_users([user_id for (user_id,) in ended.with_entities(BudgetPeriod.user_id).distinct()])
+    closed = ended.update({'closed': True}, synchronize_session=False)
+    db.session.commit()
+
+    opened = 0
+    for period in ('weekly', 'monthly'):
+        start, end = period_bounds(period, today)
+        last_id = 0
+        while True:
+            budgets = db.session.query(Budget.id, Budget.user_id, Budget.amount_minor).outerjoin(
+                BudgetPeriod, and_(BudgetPeriod.user_id == Budget.user_id, BudgetPeriod.period == period,
+                                   BudgetPeriod.start_date == start)
+            ).filter(Budget.period == period, Budget.id > last_id, BudgetPeriod.id.is_(None)).order_by(
+                Budget.id
+            ).limit(batch_size).all()
+            if not budgets:
+                break
+            last_id = budgets[-1].id
+            spent = dict(db.session.query(DailyTagTotal.user_id, db.func.sum(DailyTagTotal.amount_minor)).filter(
+                DailyTagTotal.user_id.in_([budget.user_id for budget in budgets]),
+                DailyTagTotal.day >= start, DailyTagTotal.day <= end
+            ).group_by(DailyTagTotal.user_id))
+            db.session.execute(BudgetPeriod.__table__.insert(), [
+                {'user_id': budget.user_id, 'period': period, 'start_date': start, 'end_date': end,
+                 'budget_minor': budget.amount_minor, 'spent_minor': spent.get(budget.user_id, 0), 'closed': False}
+                for budget in budgets
+            ])
+            touch_users([budget.user_id for budget in budgets])
+            db.session.commit()
+            opened += len(budgets)
+    return closed, opened
+
+def run_scheduled_tasks(today=None, progress=None):
+    """One scheduler pass: budget rollover, then recurring expenses, shard by shard."""
+    summary = {'budget_periods_closed': 0, 'budget_periods_opened': 0, 'recurring_expenses_created': 0}
+    for _ in across_shards():
+        closed, opened = roll_budget_periods(today)
+        done = summary['recurring_expenses_created']
+        created = materialize_recurring(today, progress=progress and (lambda count: progress(done + count)))
+        summary['budget_periods_closed'] += closed
+        summary['budget_periods_opened'] += opened
+        summary['recurring_expenses_created'] += created
+    return summary
+
+def serialize_recurring(rule):
+    return {
+        'id': rule.id,
+        'description': rule.description,
+        'amount': from_minor(rule.amount_minor),
+        'currency': rule.currency,
+        'tag': rule.tag,
+        'frequency': rule.frequency,
+        'start_date': rule.start_date.isoformat(),
+        'end_date': rule.end_date.isoformat() if rule.end_date else None,
+        'next_date': rule.next_date.isoformat() if rule.next_date else None,
+        'occurrences': rule.occurrences,
+    }
+
+def get_active_recurring(user_id):
+    return RecurringExpense.query.filter(
+        RecurringExpense.user_id == user_id, RecurringExpense.next_date.isnot(None)
+    ).order_by(RecurringExpense.next_date, RecurringExpense.id).all()
+
+# --- JSON API ---
+# Read-only JSON for the pages' scripts and other clients. Responses carry a weak ETag made from
+# the user's change counter, so revalidating costs one primary-key lookup and an unchanged
+# resource comes back as an empty 304 without being rebuilt.
+API_VERSION = 1
+
+def conditional_json(user_id, build, *etag_parts):
+    """jsonify(build()) with an ETag, or a bodiless 304 if the client's copy is still current.
+
+    etag_parts are whatever else the payload depends on besides the URL and the user's data.
+    build() should read the database, not an in-process cache, so the body is the state the
+    ETag's version stands for.
+    """
+    version = get_user_version(user_id)
+    key = json.dumps([API_VERSION, user_id, version, request.full_path, *etag_parts], default=str)
+    etag = hashlib.sha1(key.encode()).hexdigest()[:24]
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+        if get_user_version(user_id) != version:
+            # A write landed while build() ran, so the body may not match the version in the ETag;
+            # send it without one and the client's next request fetches it afresh
+            etag = None
+    if etag:
+        response.set_etag(etag, weak=True)
+    # Browsers may keep the response but must revalidate before every use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,156 @@
+"""Optional per-user sharding of the expense data.
+
+With EXPENSES_SHARDS set, users and exchange rates stay in the main database, while everything
+a user owns (expenses, splits, tags, budgets, recurring rules and the aggregate tables) lives on
+one of several shards: SQLite files, or schemas of the same PostgreSQL database. A user id picks
+a bucket (user_id % buckets) and the shard_bucket table maps buckets to shards, so moving users
+between shards (rebalance_shards.py) rewrites the rows of whole buckets and one map row each.
+
+Routing sits under the models. ShardedSession.get_bind() sends statements on global tables to
+the main database and everything else to the selected shard: the logged-in user's during a
+request, or whichever ShardRouter.use() / use_user() selects for jobs, CLI commands and the
+scheduler. Ids repeat across shards, so one session only ever holds one shard's rows at a time;
+code that walks every user goes shard by shard. A statement on a sharded table with no shard
+selected raises ShardingError instead of quietly reading the main database. Commits that touch
+the main database and a shard are not atomic across the two.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+from sqlalchemy.sql import Join, Select
+from sqlalchemy.sql.dml import UpdateBase
+
+
+class ShardingError(RuntimeError):
+    pass
+
+
+def statement_table(mapper=None, clause=None):
+    """Name of the table a statement is about: the mapper's, else the clause's first FROM; None for text."""
+    if mapper is not None:
+        return inspect(mapper).local_table.name
+    if isinstance(clause, UpdateBase):
+        clause = clause.table
+    elif isinstance(clause, Select):
+        froms = clause.get_final_froms()
+        clause = froms[0] if froms else None
+    while isinstance(clause, Join):
+        clause = clause.left
+    return getattr(clause, 'name', None)
+
+
+def ensure_schema(connection):
+    """Creates the schema a PostgreSQL shard's search_path starts with; SQLite shards need nothing."""
+    if connection.dialect.name != 'postgresql':
+        return
+    schema = connection.exec_driver_sql('SHOW search_path').scalar().split(',')[0].strip().strip('"')
+    if schema and schema not in ('public', '$user'):
+        connection.exec_driver_sql(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+
+
+class ShardRouter:
+    """Maps users to shards and hands out one engine per shard.
+
+    make_engine(shard) opens a shard's engine (the first time it is needed); load_map() reads
+    {bucket: shard} from the main database. Buckets missing from the map use bucket % shard_count.
+    """
+    def __init__(self, shard_count, buckets, make_engine, load_map, global_tables, max_age=30):
+        self.shard_count = shard_count
+        self.buckets = buckets
+        self.make_engine = make_engine
+        self.load_map = load_map
+        self.global_tables = frozenset(global_tables)
+        self.max_age = max_age
+        self._map = None
+        self._loaded_at = 0.0
+        self._engines = {}
+        self._lock = threading.Lock()
+        self._selected = ContextVar('selected_shard', default=None)
+
+    def bucket(self, user_id):
+        return user_id % self.buckets
+
+    def default_shard(self, bucket):
+        return bucket % self.shard_count
+
+    def set_map(self, bucket_map):
+        self._map = dict(bucket_map)
+        self._loaded_at = time.monotonic()
+
+    def bucket_map(self):
+        if self._map is None or time.monotonic() - self._loaded_at >= self.max_age:
+            self.set_map(self.load_map())
+        return self._map
+
+    def shard_for_user(self, user_id):
+        bucket = self.bucket(user_id)
+        return self.bucket_map().get(bucket, self.default_shard(bucket))
+
+    def shards(self):
+        """Every shard that holds (or by default would hold) a bucket."""
+        return sorted(set(range(self.shard_count)) | set(self.bucket_map().values()))
+
+    def engine(self, shard):
+        engine = self._engines.get(shard)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(shard)
+                if engine is None:
+                    engine = self._engines[shard] = self.make_engine(shard)
+        return engine
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+    def current(self):
+        """The selected shard, else the logged-in user's during a request, else None."""
+        shard = self._selected.get()
+        if shard is None and has_request_context() and 'user_id' in session:
+            shard = self.shard_for_user(session['user_id'])
+        return shard
+
+    @contextmanager
+    def use(self, shard):
+        previous = self._selected.get()
+        self._selected.set(shard)
+        try:
+            yield shard
+        finally:
+            # Restored by value rather than by token, so a generator closed in another context can't fail here
+            self._selected.set(previous)
+
+    def use_user(self, user_id):
+        return self.use(self.shard_for_user(user_id))
+
+    def bind_for(self, table_name):
+        """The shard engine for a statement on table_name, or None when it belongs to the main database."""
+        if table_name in self.global_tables:
+            return None
+        shard = self.current()
+        if shard is None:
+            if table_name is None:
+                return None
+            raise ShardingError(f'No shard selected for a statement on {table_name}')
+        return self.engine(shard)
+
+
+class ShardedSession(Session):
+    """db.session's class; routes by app.extensions['shard_router'], or like a plain session without one."""
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self.router = current_app.extensions.get('shard_router')
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.router is not None:
+            shard_engine = self.router.bind_for(statement_table(mapper, clause))
+            if shard_engine is not None:
+                return shard_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,42 @@
+"""Per-thread connections to the small SQLite files every worker on the host shares.
+
+The shared response cache and the job queue each keep one such file. Both open it through
+ThreadLocalConnections so the journal mode, sync level and busy timeout stay the same.
+"""
+import os
+import sqlite3
+import threading
+
+BUSY_TIMEOUT_SECONDS = 10
+# The main database's journal and sync settings; config.sqlite_pragmas explains them
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+)
+
+
+class ThreadLocalConnections:
+    """Opens a connection per thread on first use, since sqlite3 connections can't be shared across threads.
+
+    connect_kwargs go to sqlite3.connect(); on_connect(conn) runs once for each new connection.
+    """
+    def __init__(self, path, row_factory=None, on_connect=None, **connect_kwargs):
+        self.path = path
+        self.row_factory = row_factory
+        self.on_connect = on_connect
+        self.connect_kwargs = connect_kwargs
+        self._local = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, **self.connect_kwargs)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            if self.on_connect is not None:
+                self.on_connect(conn)
+        return conn
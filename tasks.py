@@ -0,0 +1,98 @@
+"""Background job handlers, and the per-app job queue that runs them (see jobs.py)."""
+import os
+
+from flask import current_app
+
+from jobs import JobQueue
+from services import parse_date, user_shard, rebuild_aggregates, run_scheduled_tasks
+
+# --- Background Jobs ---
+EXPORT_PROGRESS_EVERY = 1000 # rows between progress reports of an export job
+
+def spool_path(filename):
+    """Path for a job's input or output file; the spool directory is created on first use."""
+    os.makedirs(current_app.config['JOBS_SPOOL_DIR'], exist_ok=True)
+    return os.path.join(current_app.config['JOBS_SPOOL_DIR'], filename)
+
+def remove_file(path):
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def remove_job_files(job):
+    """Deletes the files a purged job left in the spool directory."""
+    remove_file(job['payload'].get('path'))
+    remove_file((job['result'] or {}).get('file'))
+
+def run_import_job(ctx):
+    from csv_io import import_expenses_csv
+    try:
+        with open(ctx.payload['path'], 'rb') as f, user_shard(ctx.user_id):
+            report = import_expenses_csv(ctx.user_id, f, progress=ctx.progress)
+    finally:
+        remove_file(ctx.payload['path'])
+    report['filename'] = ctx.payload.get('filename')
+    return report
+
+def run_export_job(ctx):
+    with user_shard(ctx.user_id):
+        return _run_export_job(ctx)
+
+def _run_export_job(ctx):
+    from csv_io import iter_export_rows, export_lines, export_filename
+    payload = ctx.payload
+    rows = iter_export_rows(ctx.user_id, parse_date(payload['start']) if payload['start'] else None,
+                            parse_date(payload['end']) if payload['end'] else None, payload['tags'])
+
+    def counted(rows):
+        for processed, row in enumerate(rows, 1):
+            if processed % EXPORT_PROGRESS_EVERY == 0:
+                ctx.progress(processed)
+            yield row
+
+    lines, mimetype, extension = export_lines(counted(rows), payload['format'])
+    path = spool_path(f'export-{ctx.id}.{extension}')
+    try:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            f.writelines(lines)
+    except BaseException:
+        remove_file(path)
+        raise
+    return {'file': path, 'filename': export_filename(extension), 'mimetype': mimetype}
+
+def run_scheduler_job(ctx):
+    return run_scheduled_tasks(progress=ctx.progress)
+
+def run_rebuild_job(ctx):
+    ctx.progress(0, 1)
+    rebuild_aggregates(user_id=ctx.user_id)
+    return {'rebuilt': True}
+
+def init_jobs(app):
+    """Creates the app's job queue with every handler registered, as app.extensions['job_queue']."""
+    job_queue = JobQueue(
+        app.config['JOBS_PATH'],
+        max_workers=app.config['JOBS_MAX_WORKERS'],
+        per_user_concurrency=app.config['JOBS_PER_USER_CONCURRENCY'],
+        max_pending_per_user=app.config['JOBS_MAX_PENDING_PER_USER'],
+        poll_interval=app.config['JOBS_POLL_SECONDS'],
+        retention=app.config['JOBS_RETENTION_SECONDS'],
+        context_factory=app.app_context,
+        on_purge=remove_job_files,
+    )
+    job_queue.register('import_csv', run_import_job)
+    job_queue.register('export', run_export_job)
+    job_queue.register('rebuild_aggregates', run_rebuild_job)
+    job_queue.register('scheduler', run_scheduler_job)
+    job_queue.schedule('scheduler', every=app.config['SCHEDULER_INTERVAL_SECONDS'])
+
+    @app.before_request
+    def start_job_workers():
+        # Started lazily so scripts and CLI commands that create the app don't spawn threads
+        if app.config['JOBS_IN_PROCESS']:
+            job_queue.start()
+
+    app.extensions['job_queue'] = job_queue
+    return job_queue
@@ -0,0 +1,105 @@
+"""Fixtures: a fresh app on a throwaway SQLite database per test, a signed-in client, a second worker
+on the same database, and a helper that adds expenses through the /add form."""
+import os
+import sys
+from datetime import date
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app
+from models import db, User, Tag
+from services import user_shard
+
+TAGS = ('food', 'travel')
+DAY = date(2024, 3, 5)
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    """create_app() overrides for a test; a module can override this fixture to change them."""
+    return {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'expenses.db'),
+        'JOBS_PATH': str(tmp_path / 'jobs.db'),
+        'JOBS_SPOOL_DIR': str(tmp_path / 'job_files'),
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'JOBS_IN_PROCESS': False,
+        'TEMPLATE_CACHE_DIR': '',
+    }
+
+
+@pytest.fixture
+def start_app():
+    """Builds an app from create_app() overrides, as a worker started at that point would; each is closed after the test."""
+    started = []
+
+    def start(config):
+        started.append(create_app(config))
+        return started[-1]
+    yield start
+    for app in started:
+        with app.app_context():
+            db.engine.dispose()
+        if 'shard_router' in app.extensions:
+            app.extensions['shard_router'].dispose()
+
+
+@pytest.fixture
+def app(start_app, app_config):
+    return start_app(app_config)
+
+
+@pytest.fixture
+def user_id(app):
+    """A user with the TAGS, and no expenses yet."""
+    with app.app_context():
+        user = User(username='alice', password='x')
+        db.session.add(user)
+        db.session.commit()
+        with user_shard(user.id):
+            db.session.add_all([Tag(name=name, user_id=user.id) for name in TAGS])
+            db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    return client
+
+
+@pytest.fixture
+def other_app(app, start_app, app_config):
+    """A second app on the same database, as another worker process would have, with its own in-process state."""
+    return start_app(app_config)
+
+
+@pytest.fixture
+def other_client(other_app, user_id):
+    """The same user signed in on other_app."""
+    client = other_app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    return client
+
+
+def post_expense(client, amount='10.00', tag='food', day=DAY, description='test', splits=(), **fields):
+    """Adds an expense through the form; splits are (person, share) pairs, other fields (like repeat) go as given."""
+    data = {'date': day.isoformat(), 'description': description, 'amount': amount, 'tag': tag, **fields}
+    if splits:
+        data['is_split'] = 'on'
+        data['split_names[]'] = [name for name, _ in splits]
+        data['split_shares[]'] = [share for _, share in splits]
+    response = client.post('/add', data=data)
+    assert response.status_code == 302
+    return response
+
+
+@pytest.fixture
+def add_expense():
+    return post_expense
@@ -0,0 +1,63 @@
+"""The summary tables (user-002) stay equal to what the raw expenses add up to."""
+from datetime import date
+
+from models import db, DailyTagTotal, Expense, Tag, UserTotals
+from services import adjust_aggregates, get_user_totals, rebuild_aggregates
+
+DAY = date(2024, 3, 5)
+
+
+def test_writes_keep_aggregates_in_step(app, client, user_id, add_expense):
+    add_expense(client, '100.00')
+    add_expense(client, '40.50', splits=[('bob', '10.50')])
+    add_expense(client, '20.00', tag='travel', day=date(2024, 3, 6))
+    with app.app_context():
+        first, split, travel = Expense.query.order_by(Expense.id).all()
+        receivable_id = split.receivables[0].id
+    client.post(f'/expense/edit/{first.id}', data={'date': '2024-03-07', 'description': 'moved', 'amount': '80.00',
+                                                   'tag': 'travel'})
+    client.get(f'/delete/{travel.id}')
+    client.post(f'/mark_paid/{receivable_id}')
+
+    with app.app_context():
+        assert rebuild_aggregates(verify_only=True) == []
+        assert get_user_totals(user_id) == (8000 + 3000, 0)
+        counts = dict(db.session.query(Tag.name, Tag.expense_count).filter_by(user_id=user_id))
+        assert counts == {'food': 1, 'travel': 1}
+        assert db.session.get(UserTotals, user_id).version >= 6
+
+
+def test_emptied_days_are_removed(app, client, user_id, add_expense):
+    add_expense(client, '10.00')
+    with app.app_context():
+        expense = Expense.query.one()
+    client.get(f'/delete/{expense.id}')
+    with app.app_context():
+        assert DailyTagTotal.query.filter_by(user_id=user_id).count() == 0
+        # A negative delta for a day with no row yet leaves nothing behind either
+        adjust_aggregates(user_id, {(DAY, 'food'): (-500, -1)})
+        db.session.commit()
+        assert DailyTagTotal.query.filter_by(user_id=user_id).count() == 0
+
+
+def test_overlapping_writers_lose_nothing(app, client, user_id, add_expense):
+    add_expense(client, '10.00')
+    with app.app_context():
+        expense = Expense.query.one()
+        # This request has the totals loaded...
+        loaded = [db.session.get(UserTotals, user_id), *DailyTagTotal.query.filter_by(user_id=user_id)]
+
+        with app.app_context(): # ...when another one commits a +5.00 expense
+            db.session.add(Expense(date=DAY, description='other', total_amount_minor=500, own_amount_minor=500,
+                                   tag='food', user_id=user_id))
+            adjust_aggregates(user_id, {(DAY, 'food'): (500, 1)})
+            db.session.commit()
+
+        adjust_aggregates(user_id, {(DAY, 'food'): (-1000, -1)})
+        db.session.delete(expense)
+        db.session.commit()
+        del loaded
+
+    with app.app_context():
+        assert get_user_totals(user_id) == (500, 0)
+        assert rebuild_aggregates(verify_only=True) == []
@@ -0,0 +1,42 @@
+"""The versioned JSON API (user-017): ETag revalidation, with the ETag always matching the body."""
+from models import db
+from services import conditional_json, touch_user
+
+
+def test_unchanged_resources_revalidate_to_304(client, add_expense):
+    add_expense(client)
+    first = client.get('/api/v1/summary')
+    assert first.status_code == 200 and first.headers['ETag'].startswith('W/')
+    again = client.get('/api/v1/summary', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    add_expense(client, amount='5.00', tag='travel')
+    changed = client.get('/api/v1/summary', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
+    assert changed.get_json()['total_spent'] == 15.0
+
+
+def test_summary_comes_from_the_database(client, add_expense):
+    add_expense(client)
+    add_expense(client, tag='travel')
+    body = client.get('/api/v1/summary').get_json()
+    assert (body['expense_count'], body['tags']) == (2, {'food': 1, 'travel': 1})
+
+
+def test_no_etag_when_a_write_lands_while_building(app, user_id):
+    def build():
+        # Another request commits between the ETag's version read and the end of build()
+        with app.app_context():
+            touch_user(user_id)
+            db.session.commit()
+        return {'stale': True}
+
+    with app.test_request_context('/api/v1/summary'):
+        response = conditional_json(user_id, build)
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+
+    with app.test_request_context('/api/v1/summary'):
+        assert 'ETag' in conditional_json(user_id, lambda: {}).headers
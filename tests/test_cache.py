@@ -0,0 +1,39 @@
+"""The per-user response cache (user-006): no worker serves what any other process's write changed."""
+import io
+from datetime import date
+
+from csv_io import import_expenses_csv
+from models import db, Budget
+from services import roll_budget_periods
+
+COMPARISON = {'p1_start': '2024-02-01', 'p1_end': '2024-02-29', 'p2_start': '2024-03-01', 'p2_end': '2024-03-31'}
+
+
+def march_total(client):
+    return client.get('/get_comparison_data', query_string=COMPARISON).get_json()['period2']['total']
+
+
+def test_writes_on_another_worker_are_seen(app, client, other_client, add_expense):
+    assert app.config['CACHE_BACKEND'] == 'memory'
+    assert march_total(client) == 0
+    assert march_total(client) == 0 # now served from this worker's cache
+
+    add_expense(other_client, amount='12.00')
+    assert march_total(client) == 12.0
+    assert march_total(other_client) == 12.0
+
+
+def test_jobs_in_another_process_are_seen(client, other_app, user_id):
+    assert march_total(client) == 0
+    with other_app.app_context(): # an upload job run by the other worker's dispatcher
+        import_expenses_csv(user_id, io.BytesIO(b'Date,Description,Amount,Tag\n2024-03-09,Taxi,7.50,travel\n'))
+    assert march_total(client) == 7.5
+
+
+def test_budget_rollover_moves_the_users_version(app, user_id):
+    with app.app_context():
+        db.session.add(Budget(user_id=user_id, amount_minor=100000, period='monthly'))
+        db.session.commit()
+        before = app.extensions['response_cache']._key('reports', user_id, {})
+        assert roll_budget_periods(date(2024, 3, 10)) == (0, 1)
+        assert app.extensions['response_cache']._key('reports', user_id, {}) != before
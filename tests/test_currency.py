@@ -0,0 +1,97 @@
+"""Multi-currency expenses (user-018): rate lookups, rounding to minor units and base-currency changes."""
+from datetime import date
+
+import pytest
+
+from currency import MissingRateError, RateTable, to_base
+from models import db, Budget, Expense, User
+from services import get_user_totals, load_rates, rebuild_aggregates
+
+FRIDAY, SATURDAY, HOLIDAY, TUESDAY = date(2024, 3, 1), date(2024, 3, 2), date(2024, 3, 4), date(2024, 3, 5)
+# EUR is the reference; Monday the 4th was a holiday with no fixing
+RATES_CSV = 'Date,USD,INR,\n2024-03-05,1.10,91.0,\n2024-03-04,N/A,N/A,\n2024-03-01,1.08,90.0,\n'
+
+
+def make_table(series, calls=None):
+    def load_series(currency):
+        if calls is not None:
+            calls.append(currency)
+        return series.get(currency, ([], []))
+    return RateTable(load_series, lambda: list(series))
+
+
+def test_days_without_a_rate_use_the_previous_one():
+    table = make_table({'USD': ([FRIDAY, TUESDAY], [1.08, 1.10])})
+    assert table.rate('USD', SATURDAY) == table.rate('USD', HOLIDAY) == 1.08
+    assert table.rate('USD', TUESDAY) == 1.10
+    assert table.rate('EUR', SATURDAY) == 1.0
+    with pytest.raises(MissingRateError, match='on or before 2024-02-29'):
+        table.rate('USD', date(2024, 2, 29))
+
+
+def test_missing_currency_raises():
+    table = make_table({'USD': ([FRIDAY], [1.08])})
+    with pytest.raises(MissingRateError, match='GBP'):
+        table.conversion('GBP', 'USD', SATURDAY)
+    assert table.currencies() == {'USD', 'EUR'}
+
+
+def test_lookups_are_memoized_per_currency():
+    calls = []
+    table = make_table({'USD': ([FRIDAY], [1.08]), 'INR': ([FRIDAY], [90.0])}, calls)
+    conversions = table.conversions([('USD', SATURDAY), ('USD', HOLIDAY), ('USD', SATURDAY)], 'INR')
+    assert conversions == {('USD', SATURDAY): 90.0 / 1.08, ('USD', HOLIDAY): 90.0 / 1.08}
+    assert sorted(calls) == ['INR', 'USD']
+
+
+@pytest.mark.parametrize('amount_minor, rate, expected', [
+    (5, 0.5, 3), # halves round away from zero
+    (-5, 0.5, -3),
+    (1000, 90.0 / 1.08, 83333),
+    (1234, 0.011, 14),
+    (100000, 1.10 / 91.0, 1209),
+])
+def test_conversions_round_to_minor_units(amount_minor, rate, expected):
+    assert to_base(amount_minor, rate) == expected
+
+
+@pytest.fixture
+def rates(app, tmp_path):
+    path = tmp_path / 'rates.csv'
+    path.write_text(RATES_CSV)
+    with app.app_context():
+        assert load_rates(str(path)) == 4 # the N/A cells are skipped
+
+
+def test_expenses_keep_the_rate_of_their_day(app, client, user_id, rates, add_expense):
+    add_expense(client, '10.00', day=SATURDAY, currency='USD')
+    add_expense(client, '10.00', day=HOLIDAY, currency='usd')
+    add_expense(client, '500.00', day=TUESDAY)
+    add_expense(client, '10.00', day=TUESDAY, currency='GBP') # no rates: refused
+    with app.app_context():
+        rows = db.session.query(Expense.currency, Expense.base_rate).order_by(Expense.id).all()
+        assert rows == [('USD', 90.0 / 1.08), ('USD', 90.0 / 1.08), ('INR', 1.0)]
+        assert get_user_totals(user_id) == (83333 * 2 + 50000, 0)
+
+
+def test_changing_the_base_currency_recalculates_stored_amounts(app, client, user_id, rates, add_expense):
+    with app.app_context():
+        db.session.add(Budget(user_id=user_id, amount_minor=100000, period='monthly'))
+        db.session.commit()
+    add_expense(client, '10.00', day=SATURDAY, currency='USD')
+    add_expense(client, '500.00', day=TUESDAY, splits=[('bob', '100.00')])
+
+    assert client.post('/settings/currency', data={'currency': 'usd'}).status_code == 302
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        assert user.base_currency == 'USD'
+        assert [rate for (rate,) in db.session.query(Expense.base_rate).order_by(Expense.id)] == [1.0, 1.10 / 91.0]
+        # Own shares 10.00 USD and 400.00 INR; bob owes 100.00 INR
+        assert get_user_totals(user_id) == (1000 + 484, 121)
+        # The budget moves at the latest rate
+        assert user.budget.amount_minor == 1209
+        assert rebuild_aggregates(user_id, verify_only=True) == []
+
+    assert client.post('/settings/currency', data={'currency': 'GBP'}).status_code == 302
+    with app.app_context():
+        assert db.session.get(User, user_id).base_currency == 'USD'
@@ -0,0 +1,48 @@
+"""The keyset-paginated expense feed (user-001)."""
+from datetime import date
+
+from models import db, User, Expense, Receivable
+
+
+def seed(app, user_id):
+    """Seven expenses over three days, the first with a split; plus one of another user's."""
+    days = [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 2), date(2024, 1, 3), date(2024, 1, 2),
+            date(2024, 1, 1), date(2024, 1, 3)]
+    with app.app_context():
+        expenses = [Expense(date=day, description=f'e{i}', total_amount_minor=100 * (i + 1), own_amount_minor=100 * (i + 1),
+                            tag='food', user_id=user_id) for i, day in enumerate(days)]
+        other = User(username='mallory', password='x')
+        db.session.add_all([*expenses, other])
+        db.session.flush()
+        db.session.add(Expense(date=date(2024, 1, 2), description='not yours', total_amount_minor=1, own_amount_minor=1,
+                               tag='food', user_id=other.id))
+        db.session.add(Receivable(person_name='bob', amount_minor=50, expense_id=expenses[0].id))
+        db.session.commit()
+        return [(e.date, e.id) for e in expenses]
+
+
+def test_pages_cover_every_expense_once_newest_first(app, client, user_id):
+    positions = seed(app, user_id)
+    seen, cursor = [], None
+    while True:
+        body = client.get('/api/v1/expenses', query_string={'limit': 3, **({'cursor': cursor} if cursor else {})}).get_json()
+        assert len(body['expenses']) <= 3
+        seen += [(date.fromisoformat(e['date']), e['id']) for e in body['expenses']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert seen == sorted(positions, reverse=True)
+
+
+def test_expenses_carry_their_receivables(app, client, user_id):
+    seed(app, user_id)
+    expenses = client.get('/expenses/feed', query_string={'limit': 50}).get_json()['expenses']
+    split = [e for e in expenses if e['receivables']]
+    assert [(e['description'], e['receivables'][0]['person_name'], e['receivables'][0]['amount']) for e in split] == [
+        ('e0', 'bob', 0.5)]
+
+
+def test_bad_cursor_or_limit_is_rejected(client):
+    assert client.get('/expenses/feed', query_string={'cursor': 'not-a-cursor'}).status_code == 400
+    assert client.get('/expenses/feed', query_string={'limit': 0}).status_code == 400
+    assert client.get('/expenses/feed', query_string={'limit': 'many'}).status_code == 400
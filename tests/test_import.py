@@ -0,0 +1,63 @@
+"""The streaming CSV importer (user-003): batched inserts and a row-level rejection report."""
+import io
+from datetime import date
+
+from csv_io import import_expenses_csv
+from models import db, Expense
+from services import get_user_totals, rebuild_aggregates
+
+CSV = """Date,Description,Amount,Tag
+2024-02-01,Lunch,120.50,food
+2024-02-01,Taxi,300,Travel
+not-a-date,Broken,10,food
+2024-02-02,Snacks,-5,food
+2024-02-03,Museum,80,culture
+
+2024-02-04,Dinner,99.99,food
+"""
+
+
+def run_import(app, user_id, text, **kwargs):
+    with app.app_context():
+        return import_expenses_csv(user_id, io.BytesIO(text.encode('utf-8-sig')), **kwargs)
+
+
+def test_bad_rows_are_reported_not_fatal(app, user_id):
+    report = run_import(app, user_id, CSV, batch_size=2)
+    assert report['imported'] == 3
+    assert report['rejected'] == 3
+    assert [error['line'] for error in report['errors']] == [4, 5, 6]
+    assert "Unknown tag 'culture'" in report['errors'][2]['reason']
+    with app.app_context():
+        rows = db.session.query(Expense.date, Expense.description, Expense.total_amount_minor, Expense.tag).order_by(Expense.id)
+        assert rows.all() == [(date(2024, 2, 1), 'Lunch', 12050, 'food'), (date(2024, 2, 1), 'Taxi', 30000, 'travel'),
+                              (date(2024, 2, 4), 'Dinner', 9999, 'food')]
+        assert get_user_totals(user_id) == (12050 + 30000 + 9999, 0)
+        assert rebuild_aggregates(verify_only=True) == []
+
+
+def test_batches_commit_and_report_progress(app, user_id):
+    lines = ['Date,Description,Amount,Tag'] + [f'2024-02-{day % 28 + 1:02d},Row {day},1.00,food' for day in range(25)]
+    calls = []
+    report = run_import(app, user_id, '\n'.join(lines) + '\n', batch_size=10, progress=calls.append)
+    assert report == {'imported': 25, 'rejected': 0, 'errors': []}
+    assert calls == [10, 20]
+    with app.app_context():
+        assert Expense.query.count() == 25
+        assert rebuild_aggregates(verify_only=True) == []
+
+
+def test_reported_errors_are_capped(app, user_id):
+    lines = ['Date,Description,Amount,Tag'] + ['bad,Row,1,food'] * 5
+    report = run_import(app, user_id, '\n'.join(lines), max_reported_errors=2)
+    assert report['rejected'] == 5
+    assert len(report['errors']) == 2
+
+
+def test_undecodable_input_keeps_earlier_batches(app, user_id):
+    data = 'Date,Description,Amount,Tag\n2024-02-01,Lunch,1,food\n'.encode() + b'2024-02-02,\xff\xfe,1,food\n'
+    with app.app_context():
+        report = import_expenses_csv(user_id, io.BytesIO(data), batch_size=1)
+        assert report['imported'] == 1
+        assert report['errors'][-1]['reason'].startswith('Could not read the rest of the file')
+        assert Expense.query.count() == 1
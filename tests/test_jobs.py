@@ -0,0 +1,43 @@
+"""The job queue's dispatcher (user-013): a job it can't hand to the pool goes back to the queue."""
+from concurrent.futures import ThreadPoolExecutor
+
+from jobs import JobQueue, QUEUED, SUCCEEDED
+
+
+def make_queue(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), poll_interval=0.01)
+    queue.register('noop', lambda ctx: {'user': ctx.user_id})
+    return queue
+
+
+def test_claimed_job_is_requeued_when_the_pool_is_closed(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue('noop', 1)
+    queue._executor = ThreadPoolExecutor(max_workers=1)
+    queue._executor.shutdown() # as stop() or interpreter shutdown leaves it
+
+    queue._dispatch_loop() # returns instead of dying with the job marked running
+    job = queue.get(job_id)
+    assert (job['status'], job['worker'], job['started_at']) == (QUEUED, None, None)
+    assert queue._running == 0
+
+    # Another dispatcher picks it up
+    other = make_queue(tmp_path)
+    other.start()
+    try:
+        other._wakeup.set()
+        for _ in range(200):
+            if other.get(job_id)['status'] == SUCCEEDED:
+                break
+            other._stopping.wait(0.01)
+        assert other.get(job_id)['result'] == {'user': 1}
+    finally:
+        other.stop()
+
+
+def test_stopped_dispatcher_claims_nothing(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue('noop', 1)
+    queue.stop()
+    queue._dispatch_loop()
+    assert queue.get(job_id)['status'] == QUEUED
@@ -0,0 +1,96 @@
+"""The receivables ledger (user-012): per-person balances, ageing and bulk settling."""
+from datetime import timedelta
+
+import pytest
+
+from models import db, User, Expense, Receivable
+from services import get_user_totals, rebuild_aggregates, utc_today
+from views.expenses import get_ledger
+
+
+@pytest.fixture
+def splits(app, client, user_id):
+    """Unpaid splits with bob (10 days and 45 days old) and carol (100 days old), one paid split with carol,
+    and another user's split with bob. Returns the ids of this user's receivables by (person, age)."""
+    today = utc_today()
+    ids = {}
+    for person, age, amount, paid in (('bob', 10, 1000, False), ('bob', 45, 2000, False), ('carol', 100, 500, False),
+                                      ('carol', 5, 700, True)):
+        client.post('/add', data={'date': (today - timedelta(days=age)).isoformat(), 'description': f'{person} {age}',
+                                  'amount': '100.00', 'tag': 'food', 'is_split': 'on', 'split_names[]': [person],
+                                  'split_shares[]': [f'{amount / 100:.2f}']})
+        with app.app_context():
+            receivable = Receivable.query.order_by(Receivable.id.desc()).first()
+            ids[person, age] = receivable.id
+        if paid:
+            client.post(f'/mark_paid/{receivable.id}')
+    with app.app_context():
+        other = User(username='mallory', password='x')
+        db.session.add(other)
+        db.session.flush()
+        expense = Expense(date=today, description='theirs', total_amount_minor=5000, own_amount_minor=4000, tag='food',
+                          user_id=other.id)
+        db.session.add(expense)
+        db.session.flush()
+        db.session.add(Receivable(person_name='bob', amount_minor=1000, expense_id=expense.id))
+        db.session.commit()
+        ids['other'] = expense.receivables[0].id
+    return ids
+
+
+def test_balances_and_ageing(app, user_id, splits):
+    with app.app_context():
+        bob, carol = get_ledger(user_id)
+    assert (bob['person_name'], bob['outstanding'], bob['settled'], bob['open_splits']) == ('bob', 3000, 0, 2)
+    assert bob['aged'] == {'0-30': 1000, '31-60': 2000, '61-90': 0, '90+': 0}
+    assert (carol['person_name'], carol['outstanding'], carol['settled'], carol['splits']) == ('carol', 500, 700, 2)
+    assert carol['aged'] == {'0-30': 0, '31-60': 0, '61-90': 0, '90+': 500}
+    assert carol['oldest_unpaid'] == utc_today() - timedelta(days=100)
+
+
+
+def test_future_splits_age_as_today(app, client, user_id, add_expense):
+    add_expense(client, '30.00', day=utc_today() + timedelta(days=7), splits=[('dave', '12.00')])
+    with app.app_context():
+        [dave] = get_ledger(user_id)
+    assert dave['outstanding'] == 1200
+    assert dave['aged'] == {'0-30': 1200, '31-60': 0, '61-90': 0, '90+': 0}
+
+def test_settle_a_person(app, client, user_id, splits):
+    response = client.post('/ledger/settle', json={'person': 'bob'})
+    assert response.get_json() == {'settled': 2, 'amount': 30.0}
+    with app.app_context():
+        assert Receivable.query.filter_by(person_name='bob', is_paid=False).count() == 1 # the other user's
+        assert get_user_totals(user_id)[1] == 500
+        assert rebuild_aggregates(user_id, verify_only=True) == []
+
+
+def test_settle_by_id_only_touches_own_receivables(app, client, user_id, splits):
+    response = client.post('/ledger/settle', json={'ids': [splits['carol', 100], splits['other']]})
+    assert response.get_json() == {'settled': 1, 'amount': 5.0}
+    with app.app_context():
+        assert not db.session.get(Receivable, splits['other']).is_paid
+        assert rebuild_aggregates(user_id, verify_only=True) == []
+
+
+def test_settle_from_the_form(app, client, splits):
+    response = client.post('/ledger/settle', data={'ids[]': [str(splits['bob', 10])]})
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(Receivable, splits['bob', 10]).is_paid
+
+
+@pytest.mark.parametrize('payload', [
+    [1, 2],
+    {'ids': '12'},
+    {'ids': [True]},
+    {'ids': ['1']},
+    {'ids': 1},
+    {'person': ['bob']},
+    {},
+])
+def test_malformed_settle_requests_are_rejected(app, client, splits, payload):
+    response = client.post('/ledger/settle', json=payload)
+    assert response.status_code == 400
+    with app.app_context():
+        assert Receivable.query.filter_by(is_paid=True).count() == 1
@@ -0,0 +1,89 @@
+"""migrate_storage.py (user-005): converting a database from before DATE and minor-unit storage."""
+import sqlite3
+from datetime import date
+
+import pytest
+
+from app import create_app
+from migrate_storage import migrate
+from models import db, Expense, Receivable, User, SchemaMigrationRequired
+from services import get_user_totals
+from views.expenses import search_expenses
+
+LEGACY_SCHEMA = """
+CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, password VARCHAR(80) NOT NULL);
+CREATE TABLE tag (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL, user_id INTEGER NOT NULL REFERENCES user (id));
+CREATE TABLE expense (id INTEGER PRIMARY KEY, date VARCHAR(10) NOT NULL, description VARCHAR(200) NOT NULL,
+                      total_amount FLOAT NOT NULL, own_amount FLOAT NOT NULL, tag VARCHAR(50) NOT NULL,
+                      user_id INTEGER NOT NULL REFERENCES user (id));
+CREATE TABLE receivable (id INTEGER PRIMARY KEY, person_name VARCHAR(80) NOT NULL, amount FLOAT NOT NULL,
+                         is_paid BOOLEAN NOT NULL, expense_id INTEGER NOT NULL REFERENCES expense (id));
+CREATE TABLE budget (id INTEGER PRIMARY KEY, amount FLOAT NOT NULL, period VARCHAR(10) NOT NULL,
+                     user_id INTEGER NOT NULL UNIQUE REFERENCES user (id));
+INSERT INTO user VALUES (1, 'alice', 'x');
+INSERT INTO tag VALUES (1, 'food', 1);
+INSERT INTO expense VALUES (1, '2024-03-05', 'Pizza night', 30.1, 20.1, 'food', 1);
+INSERT INTO expense VALUES (2, '06/03/2024', 'Groceries', 12.5, 12.5, 'food', 1);
+INSERT INTO receivable VALUES (1, 'bob', 10.0, 0, 1);
+"""
+
+
+def legacy_database(tmp_path):
+    path = tmp_path / 'legacy.db'
+    with sqlite3.connect(path) as conn:
+        conn.executescript(LEGACY_SCHEMA)
+    return path
+
+
+def make_app(tmp_path, path, **config):
+    return create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'JOBS_PATH': str(tmp_path / 'jobs.db'),
+                       'TEMPLATE_CACHE_DIR': '', **config})
+
+
+def schema(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall()
+
+
+def test_app_refuses_an_unmigrated_database(tmp_path):
+    path = legacy_database(tmp_path)
+    before = schema(path)
+    with pytest.raises(SchemaMigrationRequired, match='migrate_storage.py'):
+        make_app(tmp_path, path)
+    assert schema(path) == before
+
+
+def test_migrated_database_keeps_search_in_sync(tmp_path):
+    path = legacy_database(tmp_path)
+    # As migrate_storage.main() does
+    app = make_app(tmp_path, path, CREATE_TABLES=False)
+
+    with app.app_context():
+        assert migrate(batch_size=1, make_backup=False) == 0
+        assert db.session.query(Expense.date, Expense.total_amount_minor).order_by(Expense.id).all() == [
+            (date(2024, 3, 5), 3010), (date(2024, 3, 6), 1250)]
+        assert get_user_totals(1) == (2010 + 1250, 1000)
+
+        triggers = {name: table for name, table in db.session.execute(db.text(
+            "SELECT name, tbl_name FROM sqlite_master WHERE type = 'trigger'"))}
+        assert triggers == {'expense_fts_ai': 'expense', 'expense_fts_au': 'expense', 'expense_fts_ad': 'expense',
+                            'receivable_fts_ai': 'receivable', 'receivable_fts_au': 'receivable',
+                            'receivable_fts_ad': 'receivable'}
+        assert [e.id for e in search_expenses(1, 'bob')[0]] == [1]
+
+        expense = Expense(date=date(2024, 3, 7), description='Concert tickets', total_amount_minor=500,
+                          own_amount_minor=500, tag='food', user_id=1)
+        db.session.add(expense)
+        db.session.flush()
+        db.session.add(Receivable(person_name='carol', amount_minor=100, expense_id=expense.id))
+        db.session.commit()
+        assert [e.description for e in search_expenses(1, 'conc')[0]] == ['Concert tickets']
+        assert [e.description for e in search_expenses(1, 'carol')[0]] == ['Concert tickets']
+        assert db.session.get(User, 1).username == 'alice'
+    with app.app_context():
+        db.engine.dispose()
+
+    app = make_app(tmp_path, path) # starts normally now
+    with app.app_context():
+        assert Expense.query.count() == 3
+        db.engine.dispose()
@@ -0,0 +1,55 @@
+"""Statements per request (user-009): the main pages run a fixed number of queries, however much data there is.
+
+A route going over its budget fails with the statements it ran, so an N+1 regression fails
+here rather than in production.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from instrumentation import query_budget
+from models import db, Budget, Expense, Receivable
+from services import rebuild_aggregates
+
+# Statements per request, session and user lookups included
+BUDGETS = {
+    '/dashboard': 9,
+    '/expenses/feed': 4,
+    '/api/v1/expenses': 4,
+    '/reports': 4,
+}
+
+
+def seed(app, user_id, expenses):
+    """Adds expenses over the last 40 days, every third one split between two people."""
+    with app.app_context():
+        rows = [Expense(date=date.today() - timedelta(days=i % 40), description=f'e{i}', total_amount_minor=1000,
+                        own_amount_minor=1000, tag=('food', 'travel')[i % 2], user_id=user_id) for i in range(expenses)]
+        db.session.add_all(rows)
+        if not Budget.query.filter_by(user_id=user_id).first():
+            db.session.add(Budget(user_id=user_id, amount_minor=500000, period='monthly'))
+        db.session.flush()
+        for expense in rows[::3]:
+            expense.own_amount_minor = 400
+            db.session.add_all([Receivable(person_name='bob', amount_minor=300, expense_id=expense.id),
+                                Receivable(person_name='carol', amount_minor=300, expense_id=expense.id)])
+        db.session.commit()
+        rebuild_aggregates(user_id)
+
+
+@pytest.mark.parametrize('path', BUDGETS)
+def test_route_stays_within_query_budget(app, client, user_id, path):
+    # Measure the work itself, not cache hits
+    app.extensions['response_cache'].enabled = False
+    with app.app_context():
+        engine = db.engine
+
+    counts = []
+    for expenses in (3, 60):
+        seed(app, user_id, expenses)
+        client.get(path) # loads the exchange rates and the user's tags, and opens the budget period
+        with query_budget(engine, BUDGETS[path]) as counter:
+            response = client.get(path)
+        assert response.status_code == 200
+        counts.append(counter.count)
+    assert counts[0] == counts[1], 'statements grow with the number of expenses'
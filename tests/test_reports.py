@@ -0,0 +1,36 @@
+"""Multi-period comparisons (user-007): every requested period gets its own totals, even when periods repeat or overlap."""
+from datetime import date
+
+
+def test_identical_periods_each_get_the_total(client, add_expense):
+    add_expense(client, '10.00')
+    march = {'p1_start': '2024-03-01', 'p1_end': '2024-03-31', 'p2_start': '2024-03-01', 'p2_end': '2024-03-31'}
+    body = client.get('/get_comparison_data', query_string=march).get_json()
+    assert body['period1'] == body['period2'] == {'total': 10.0, 'by_tag': {'food': 10.0}}
+
+
+def test_overlapping_periods_share_their_days(client, add_expense):
+    add_expense(client, '10.00')
+    add_expense(client, '4.00', tag='travel', day=date(2024, 3, 20))
+    overlap = {'p1_start': '2024-03-01', 'p1_end': '2024-03-10', 'p2_start': '2024-03-05', 'p2_end': '2024-03-31'}
+    body = client.get('/get_comparison_data', query_string=overlap).get_json()
+    assert body['period1'] == {'total': 10.0, 'by_tag': {'food': 10.0}}
+    assert body['period2'] == {'total': 14.0, 'by_tag': {'food': 10.0, 'travel': 4.0}}
+
+
+def test_series_keeps_repeated_and_overlapping_periods_apart(client, add_expense):
+    add_expense(client, '10.00')
+    periods = ['2024-03-01/2024-03-31', '2024-03-01/2024-03-31', '2024-03-05/2024-03-05', '2024-04-01/2024-04-30']
+    body = client.get('/get_series_data', query_string={'period': periods}).get_json()
+    assert body['labels'] == periods
+    assert body['totals'] == [10.0, 10.0, 10.0, 0.0]
+    assert body['series'] == {'food': [10.0, 10.0, 10.0, 0.0]}
+
+
+def test_rolling_series_buckets_by_label(client, add_expense):
+    add_expense(client, '10.00')
+    add_expense(client, '5.00', day=date(2024, 3, 31))
+    body = client.get('/get_series_data', query_string={'granularity': 'month', 'start': '2024-02-01',
+                                                        'end': '2024-04-30'}).get_json()
+    assert body['labels'] == ['2024-02', '2024-03', '2024-04']
+    assert body['totals'] == [0.0, 15.0, 0.0]
@@ -0,0 +1,90 @@
+"""Recurring expenses and budget rollover (user-016): catching up after downtime, once per occurrence."""
+from datetime import date, timedelta
+
+from models import db, Budget, BudgetPeriod, Expense, RecurringExpense
+from services import (get_budget_history, materialize_recurring, rebuild_aggregates, roll_budget_periods, run_scheduled_tasks,
+                      utc_today)
+
+
+def add_rule(app, user_id, start, frequency='monthly'):
+    """A rule none of whose occurrences exist yet, as if the scheduler hadn't run since start."""
+    with app.app_context():
+        db.session.add(RecurringExpense(user_id=user_id, description='rent', amount_minor=1200, tag='food',
+                                        frequency=frequency, start_date=start, next_date=start))
+        db.session.commit()
+
+
+def expense_dates(app):
+    with app.app_context():
+        return [day for (day,) in db.session.query(Expense.date).order_by(Expense.date, Expense.id)]
+
+
+def test_missed_occurrences_are_caught_up_once(app, user_id):
+    add_rule(app, user_id, date(2023, 1, 31))
+    with app.app_context():
+        # Down since January: every occurrence due by today is created, on the last day of shorter months
+        assert materialize_recurring(today=date(2023, 5, 15)) == 4
+        assert materialize_recurring(today=date(2023, 5, 15)) == 0
+        assert run_scheduled_tasks(today=date(2023, 5, 15))['recurring_expenses_created'] == 0
+        rule = RecurringExpense.query.one()
+        assert (rule.occurrences, rule.next_date) == (4, date(2023, 5, 31))
+        assert rebuild_aggregates(verify_only=True) == []
+    assert expense_dates(app) == [date(2023, 1, 31), date(2023, 2, 28), date(2023, 3, 31), date(2023, 4, 30)]
+
+
+def test_leap_february_keeps_the_29th(app, user_id):
+    add_rule(app, user_id, date(2024, 1, 31))
+    with app.app_context():
+        assert materialize_recurring(today=date(2024, 3, 31)) == 3
+    assert expense_dates(app) == [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)]
+
+
+def test_catch_up_is_capped_per_run(app, user_id):
+    app.config['RECURRING_MAX_CATCH_UP'] = 5
+    add_rule(app, user_id, date(2024, 1, 1), frequency='weekly')
+    with app.app_context():
+        assert materialize_recurring(today=date(2024, 12, 31)) == 5
+        assert RecurringExpense.query.one().next_date == date(2024, 2, 5)
+        assert materialize_recurring(today=date(2024, 12, 31)) == 5
+        assert materialize_recurring(today=date(2024, 2, 20)) == 0
+    assert len(expense_dates(app)) == 10
+
+
+def test_adding_a_past_rule_catches_up_at_once(app, client, add_expense):
+    first = utc_today() - timedelta(weeks=3)
+    add_expense(client, day=first, repeat='weekly')
+    assert expense_dates(app) == [first + timedelta(weeks=n) for n in range(4)]
+
+    with app.app_context():
+        rule_id = RecurringExpense.query.one().id
+    assert client.post(f'/recurring/{rule_id}/stop').status_code == 302
+    with app.app_context():
+        assert materialize_recurring(today=utc_today() + timedelta(days=365)) == 0
+    assert len(expense_dates(app)) == 4
+
+
+def test_budget_rollover_snapshots_closed_periods(app, client, user_id, add_expense):
+    with app.app_context():
+        db.session.add(Budget(user_id=user_id, amount_minor=10000, period='monthly'))
+        db.session.commit()
+        assert roll_budget_periods(date(2024, 2, 10)) == (0, 1)
+    add_expense(client, '30.00', day=date(2024, 2, 12))
+    # Spent on March 1st while the scheduler was down
+    add_expense(client, '5.00', day=date(2024, 3, 1))
+
+    with app.app_context():
+        assert roll_budget_periods(date(2024, 3, 2)) == (1, 1)
+        assert roll_budget_periods(date(2024, 3, 2)) == (0, 0)
+        Budget.query.filter_by(user_id=user_id).update({'amount_minor': 20000})
+        db.session.commit()
+
+        [february] = get_budget_history(user_id)
+        assert (february.start_date, february.end_date) == (date(2024, 2, 1), date(2024, 2, 29))
+        assert (february.budget_minor, february.spent_minor, february.closed) == (10000, 3000, True)
+        march = BudgetPeriod.query.filter_by(user_id=user_id, closed=False).one()
+        assert (march.start_date, march.budget_minor, march.spent_minor) == (date(2024, 3, 1), 10000, 500)
+
+    # A late expense for a closed period still lands in its snapshot
+    add_expense(client, '2.00', day=date(2024, 2, 20))
+    with app.app_context():
+        assert get_budget_history(user_id)[0].spent_minor == 3200
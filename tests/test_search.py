@@ -0,0 +1,91 @@
+"""Full-text expense search (user-011): prefix matching, filters, ranking and the index kept in sync by triggers."""
+from datetime import date
+
+from models import db, User, Expense
+
+
+def add(client, description, amount='10.00', tag='food', day='2024-03-05', splits=()):
+    data = {'date': day, 'description': description, 'amount': amount, 'tag': tag}
+    if splits:
+        data.update({'is_split': 'on', 'split_names[]': list(splits), 'split_shares[]': ['1.00'] * len(splits)})
+    assert client.post('/add', data=data).status_code == 302
+
+
+def search(client, q, **params):
+    response = client.get('/expenses/search', query_string={'q': q, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def descriptions(client, q, **params):
+    return [e['description'] for e in search(client, q, **params)['expenses']]
+
+
+def test_every_word_matches_as_a_prefix(client):
+    add(client, 'Grocery run at the market')
+    add(client, 'Electricity bill', tag='travel')
+    add(client, 'Groceries for the party', splits=['Meera'])
+    assert sorted(descriptions(client, 'groc')) == ['Groceries for the party', 'Grocery run at the market']
+    assert descriptions(client, 'groc part') == ['Groceries for the party']
+    assert descriptions(client, 'mee') == ['Groceries for the party'] # the people it was split with
+    assert descriptions(client, 'trav') == ['Electricity bill'] # and its tag
+    assert descriptions(client, 'rocery') == []
+
+
+def test_filters_narrow_the_matches(client):
+    add(client, 'Taxi home', amount='5.00', tag='travel', day='2024-01-10')
+    add(client, 'Taxi airport', amount='50.00', tag='travel', day='2024-02-10')
+    add(client, 'Taxi lunch', amount='15.00', tag='food', day='2024-03-10')
+    assert descriptions(client, 'taxi', tag='travel', min_amount='10') == ['Taxi airport']
+    assert sorted(descriptions(client, 'taxi', start='2024-02-01', end='2024-03-31')) == ['Taxi airport', 'Taxi lunch']
+    assert descriptions(client, 'taxi', max_amount='5') == ['Taxi home']
+
+
+def test_description_matches_rank_first_then_newest(client):
+    add(client, 'Weekly shop', tag='food', day='2024-03-01', splits=['Food bank'])
+    add(client, 'Food truck', tag='travel', day='2024-01-01')
+    add(client, 'Dinner', tag='food', day='2024-02-01')
+    assert descriptions(client, 'food')[0] == 'Food truck'
+
+
+def test_pages(client):
+    for i in range(5):
+        add(client, f'Coffee {i}', day=f'2024-03-0{i + 1}')
+    first = search(client, 'coffee', limit=2)
+    last = search(client, 'coffee', limit=2, page=3)
+    assert [e['description'] for e in first['expenses']] == ['Coffee 4', 'Coffee 3']
+    assert first['next_page'] == 2
+    assert [e['description'] for e in last['expenses']] == ['Coffee 0']
+    assert last['next_page'] is None
+
+
+def test_index_follows_edits_and_deletes(app, client):
+    add(client, 'Movie tickets', splits=['Arjun'])
+    with app.app_context():
+        expense_id = Expense.query.one().id
+    client.post(f'/expense/edit/{expense_id}', data={'date': '2024-03-05', 'description': 'Concert tickets',
+                                                     'amount': '10.00', 'tag': 'food', 'is_split': 'on',
+                                                     'split_names[]': ['Kavya'], 'split_shares[]': ['2.00']})
+    assert descriptions(client, 'movie') == []
+    assert descriptions(client, 'concert kav') == ['Concert tickets']
+    assert descriptions(client, 'arjun') == []
+    client.get(f'/delete/{expense_id}')
+    assert descriptions(client, 'concert') == []
+
+
+def test_only_the_users_own_expenses(app, client):
+    with app.app_context():
+        other = User(username='mallory', password='x')
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(Expense(date=date(2024, 3, 5), description='Secret purchase', total_amount_minor=100,
+                               own_amount_minor=100, tag='food', user_id=other.id))
+        db.session.commit()
+    add(client, 'Public purchase')
+    assert descriptions(client, 'purchase') == ['Public purchase']
+
+
+def test_bad_queries_are_rejected(client):
+    assert client.get('/expenses/search', query_string={'q': '  !! '}).status_code == 400
+    assert client.get('/expenses/search', query_string={'q': 'x', 'page': 0}).status_code == 400
+    assert client.get('/expenses/search', query_string={'q': 'x', 'start': 'soon'}).status_code == 400
@@ -0,0 +1,123 @@
+"""Sharded storage (user-019): statement routing, and rebalance_shards.py moving users between shards."""
+from datetime import date
+
+import pytest
+from flask import session
+from sqlalchemy import func, select
+
+from extensions import get_shard_router
+from models import db, Expense, ExchangeRate, ShardBucket, Tag, User
+from rebalance_shards import rebalance
+from services import get_user_totals, load_shard_map, rebuild_aggregates, user_shard
+from sharding import ShardingError
+
+
+@pytest.fixture
+def app_config(app_config):
+    return {**app_config, 'SHARD_COUNT': 2}
+
+
+def add_user(app, name):
+    with app.app_context():
+        user = User(username=name, password='x')
+        db.session.add(user)
+        db.session.commit()
+        with user_shard(user.id):
+            db.session.add(Tag(name='food', user_id=user.id))
+            db.session.commit()
+        return user.id
+
+
+def sign_in(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session['user_id'] = user_id
+    return client
+
+
+def expense_counts(app):
+    """Expenses per database: 'main', then each shard."""
+    with app.app_context():
+        engines = {'main': db.engine, **{shard: get_shard_router().engine(shard) for shard in (0, 1)}}
+        counts = {}
+        for name, engine in engines.items():
+            with engine.connect() as conn:
+                counts[name] = conn.execute(select(func.count()).select_from(Expense.__table__)).scalar()
+        return counts
+
+
+def test_global_tables_stay_on_the_main_database(app, user_id):
+    with app.app_context():
+        router = get_shard_router()
+        for model in (User, ExchangeRate, ShardBucket):
+            assert db.session.get_bind(mapper=model) is db.engine
+        with pytest.raises(ShardingError, match='expense'):
+            db.session.get_bind(mapper=Expense)
+        with router.use(0):
+            assert db.session.get_bind(mapper=Expense) is router.engine(0)
+            assert db.session.get_bind(clause=select(Tag.name)) is router.engine(0)
+            assert db.session.get_bind(mapper=User) is db.engine
+        with user_shard(user_id):
+            assert db.session.get_bind(mapper=Expense) is router.engine(router.shard_for_user(user_id))
+
+    with app.test_request_context():
+        session['user_id'] = user_id
+        assert get_shard_router().current() == user_id % 2
+
+
+def test_requests_write_to_the_users_shard(app, client, user_id, add_expense):
+    other_id = add_user(app, 'bob')
+    assert (user_id % 2, other_id % 2) == (1, 0)
+    add_expense(client, '10.00')
+    add_expense(sign_in(app, other_id), '4.00')
+    assert expense_counts(app) == {'main': 0, 0: 1, 1: 1}
+    assert client.get('/api/v1/summary').get_json()['total_spent'] == 10.0
+
+
+def test_balance_moves_a_bucket_and_its_rows(app, app_config, start_app, client, user_id, add_expense):
+    add_user(app, 'bob')
+    carol_id = add_user(app, 'carol')
+    assert (user_id, carol_id) == (1, 3) # buckets 1 and 3, both on shard 1 to begin with
+    for _ in range(3):
+        add_expense(client, '10.00')
+    carol = sign_in(app, carol_id)
+    add_expense(carol, '7.00')
+    add_expense(carol, '8.00', day=date(2024, 3, 6))
+    assert expense_counts(app) == {'main': 0, 0: 0, 1: 5}
+
+    with app.app_context():
+        assert rebalance(2, balance=True, batch_size=1, dry_run=False) == 0
+        assert load_shard_map()[1] == 1 # the largest bucket stays put...
+        assert load_shard_map()[3] == 0 # ...and the next one goes to the empty shard
+    assert expense_counts(app) == {'main': 0, 0: 2, 1: 3}
+
+    # A worker started after the move finds carol on her new shard
+    worker = start_app(app_config)
+    with worker.app_context():
+        assert get_shard_router().shard_for_user(carol_id) == 0
+        with user_shard(carol_id):
+            assert get_user_totals(carol_id) == (1500, 0)
+            assert rebuild_aggregates(carol_id, verify_only=True) == []
+    assert sign_in(worker, carol_id).get('/api/v1/summary').get_json()['total_spent'] == 15.0
+
+    with app.app_context(): # running it again moves nothing
+        assert rebalance(2, balance=True, batch_size=1, dry_run=False) == 0
+    assert expense_counts(app) == {'main': 0, 0: 2, 1: 3}
+
+
+def test_rows_from_before_sharding_leave_the_main_database(app_config, start_app, add_expense):
+    unsharded = start_app({**app_config, 'SHARD_COUNT': 0})
+    with unsharded.app_context():
+        user = User(username='alice', password='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Tag(name='food', user_id=user.id))
+        db.session.commit()
+        user_id = user.id
+    add_expense(sign_in(unsharded, user_id), '10.00')
+
+    app = start_app(app_config)
+    with app.app_context():
+        assert rebalance(2, balance=False, batch_size=1000, dry_run=False) == 0
+    assert expense_counts(app) == {'main': 0, 0: 0, 1: 1}
+    assert sign_in(app, user_id).get('/api/v1/summary').get_json()['total_spent'] == 10.0
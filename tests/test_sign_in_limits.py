@@ -0,0 +1,50 @@
+"""Per-client sign-in limits (user-014), also behind a reverse proxy."""
+import pytest
+
+from app import create_app
+from models import db
+
+PROXY = '10.0.0.1'
+
+
+def make_app(tmp_path, **config):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'expenses.db'),
+        'JOBS_PATH': str(tmp_path / 'jobs.db'),
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'JOBS_IN_PROCESS': False,
+        'TEMPLATE_CACHE_DIR': '',
+        'LOGIN_IP_BURST': 2,
+        'LOGIN_IP_PER_MINUTE': 1,
+        **config,
+    })
+
+
+def attempt(client, n, forwarded_for=None):
+    headers = {'X-Forwarded-For': forwarded_for} if forwarded_for else {}
+    return client.post('/login', data={'username': f'nobody{n}', 'password': 'wrong'}, headers=headers,
+                       environ_base={'REMOTE_ADDR': PROXY}).status_code
+
+
+@pytest.fixture
+def proxied_app(tmp_path):
+    app = make_app(tmp_path, TRUSTED_PROXIES=1)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_clients_behind_the_proxy_are_limited_separately(proxied_app):
+    client = proxied_app.test_client()
+    assert [attempt(client, n, '203.0.113.7') for n in range(3)] == [200, 200, 429]
+    assert attempt(client, 3, '198.51.100.2') == 200
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(tmp_path):
+    app = make_app(tmp_path)
+    client = app.test_client()
+    # Each attempt claims another address, but they all come from the one peer
+    assert [attempt(client, n, f'203.0.113.{n}') for n in range(3)] == [200, 200, 429]
+    with app.app_context():
+        db.engine.dispose()
@@ -0,0 +1,45 @@
+"""The per-thread connections behind the shared response cache and the job queue (user-013)."""
+import threading
+
+from cache import SQLiteCacheBackend
+from jobs import JobQueue, QUEUED
+from sqlite_local import BUSY_TIMEOUT_SECONDS
+
+
+def settings(conn):
+    return (conn.execute('PRAGMA journal_mode').fetchone()[0], conn.execute('PRAGMA synchronous').fetchone()[0],
+            conn.execute('PRAGMA busy_timeout').fetchone()[0])
+
+
+def test_cache_and_queue_open_their_files_alike(tmp_path):
+    cache = SQLiteCacheBackend(str(tmp_path / 'cache' / 'cache.db'))
+    queue = JobQueue(str(tmp_path / 'jobs' / 'jobs.db'))
+    expected = ('wal', 1, BUSY_TIMEOUT_SECONDS * 1000) # synchronous=NORMAL reads back as 1
+    assert settings(cache._connection()) == expected
+    assert settings(queue._connection()) == expected
+
+
+def test_each_thread_gets_its_own_connection(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    queue.register('noop', lambda ctx: None)
+    job_id = queue.enqueue('noop', user_id=1)
+    seen = {}
+
+    def use():
+        seen['conn'] = queue._connection()
+        seen['status'] = queue.get(job_id)['status']
+
+    thread = threading.Thread(target=use)
+    thread.start()
+    thread.join()
+    assert seen['conn'] is not queue._connection()
+    assert queue._connection() is queue._connection()
+    assert seen['status'] == QUEUED
+
+
+def test_cache_round_trip(tmp_path):
+    cache = SQLiteCacheBackend(str(tmp_path / 'cache.db'))
+    cache.set('k', {'a': 1}, ttl=60)
+    cache.bump_version(7)
+    assert cache.get('k') == {'a': 1}
+    assert cache.get_version(7) == 1
@@ -0,0 +1,32 @@
+"""Each user's tags with usage counts (user-015), kept in step across worker processes."""
+from models import db, Expense
+from services import get_user_tags
+
+
+def test_tag_added_on_another_worker_can_be_used(app, client, other_client, user_id, add_expense):
+    with app.app_context():
+        assert get_user_tags(user_id) == {'food': 0, 'travel': 0} # now held by this worker's registry
+    assert other_client.post('/tags/add', json={'tag_name': 'Gym'}).get_json()['success']
+
+    add_expense(client, tag='gym')
+    with app.app_context():
+        assert db.session.query(Expense.tag).all() == [('gym',)]
+        assert get_user_tags(user_id) == {'food': 0, 'travel': 0, 'gym': 1}
+
+
+def test_counts_follow_writes_on_another_worker(app, client, other_client, user_id, add_expense):
+    add_expense(client, tag='food')
+    with app.app_context():
+        assert get_user_tags(user_id)['food'] == 1
+    add_expense(other_client, tag='food')
+    add_expense(other_client, tag='travel')
+    with app.app_context():
+        assert get_user_tags(user_id) == {'food': 2, 'travel': 1}
+    # A tag in use on the other worker can't be deleted here
+    assert not client.post('/tags/delete', json={'tag_name': 'travel'}).get_json()['success']
+
+
+def test_tag_names_are_unique_per_user(client):
+    assert client.post('/tags/add', json={'tag_name': 'Books'}).get_json()['usage'] == {'food': 0, 'travel': 0, 'books': 0}
+    assert not client.post('/tags/add', json={'tag_name': 'books '}).get_json()['success']
+    assert client.post('/tags/delete', json={'tag_name': 'books'}).get_json()['tags'] == ['food', 'travel']
@@ -0,0 +1 @@
+"""The app's blueprints, one module each; create_app() registers them all (see app.BLUEPRINTS)."""
@@ -0,0 +1,91 @@
+"""Sign-in, sign-up and sign-out."""
+import math
+
+from flask import Blueprint, current_app, flash, redirect, render_template, request, session, url_for
+
+from auth import HasherBusy
+from extensions import login_ip_limiter, login_username_limiter, password_hasher
+from models import db, User, Tag
+from services import user_shard
+
+bp = Blueprint('auth', __name__)
+
+# --- Authentication Routes ---
+def sign_in_retry_after(username=None):
+    """Takes a token from the client IP's (and username's) bucket; returns whole seconds to wait, or 0."""
+    if not current_app.config['RATE_LIMIT_ENABLED']:
+        return 0
+    waits = [login_ip_limiter.hit(request.remote_addr)]
+    if username is not None:
+        waits.append(login_username_limiter.hit(username.lower()))
+    return math.ceil(max(waits))
+
+def sign_in_refused(template, message, status, retry_after):
+    flash(message, 'error')
+    return render_template(template), status, {'Retry-After': str(retry_after)}
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        retry_after = sign_in_retry_after(username)
+        if retry_after:
+            return sign_in_refused('login.html', f'Too many sign-in attempts. Try again in {retry_after} seconds.', 429, retry_after)
+        user = User.query.filter_by(username=username).first()
+
+        try:
+            valid = password_hasher.verify(user.password if user else None, password)
+        except HasherBusy as e:
+            return sign_in_refused('login.html', str(e), 503, 1)
+        if valid:
+            if password_hasher.needs_rehash(user.password):
+                # Plaintext or an older cost; upgraded now that the password is known
+                try:
+                    user.password = password_hasher.hash(password)
+                    db.session.commit()
+                except HasherBusy:
+                    pass # upgraded on a later login instead
+            session['user_id'] = user.id
+            return redirect(url_for('expenses.dashboard'))
+        else:
+            flash('Invalid username or password', 'error')
+            
+    return render_template('login.html')
+
+@bp.route('/signup', methods=['GET', 'POST'])
+def signup():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        retry_after = sign_in_retry_after()
+        if retry_after:
+            return sign_in_refused('signup.html', f'Too many attempts. Try again in {retry_after} seconds.', 429, retry_after)
+        
+        if User.query.filter_by(username=username).first():
+            flash('Username already exists!', 'error')
+        else:
+            try:
+                password_hash = password_hasher.hash(password)
+            except HasherBusy as e:
+                return sign_in_refused('signup.html', str(e), 503, 1)
+            new_user = User(username=username, password=password_hash)
+            db.session.add(new_user)
+            db.session.flush()
+
+            default_tags = ["food", "college", "utilities", "transport", "other"]
+            with user_shard(new_user.id):
+                for tag_name in default_tags:
+                    new_tag = Tag(name=tag_name, user_id=new_user.id)
+                    db.session.add(new_tag)
+
+                db.session.commit()
+            flash('Account created successfully! Please login.', 'success')
+            return redirect(url_for('auth.login'))
+
+    return render_template('signup.html')
+
+@bp.route('/logout')
+def logout():
+    session.pop('user_id', None)
+    return redirect(url_for('expenses.home'))
@@ -0,0 +1,131 @@
+"""The budget, the base currency and recurring expenses."""
+
+from flask import Blueprint, flash, jsonify, redirect, request, session, url_for
+
+from currency import MissingRateError, normalize_currency
+from extensions import response_cache
+from models import db, User, Budget, BudgetPeriod, RecurringExpense
+from services import (login_required, utc_today, to_minor, from_minor, change_base_currency, touch_user, get_base_currency,
+                      get_budget_period, get_budget_history, serialize_recurring, get_active_recurring, conditional_json)
+
+bp = Blueprint('budget', __name__)
+
+# --- Budget Route ---
+@bp.route('/set_budget', methods=['POST'])
+@login_required
+def set_budget():
+    try:
+        amount_str = request.form.get('budget_amount')
+        amount = to_minor(amount_str) if amount_str else 0
+        period = request.form.get('budget_period')
+        user_id = session['user_id']
+        
+        if amount < 0 or period not in ['weekly', 'monthly']:
+            flash('Invalid budget amount or period.', 'error')
+            return redirect(url_for('expenses.dashboard'))
+
+        budget = Budget.query.filter_by(user_id=user_id).first()
+
+        if budget and (amount == 0 or period != budget.period):
+            # The unfinished period goes with the old budget; closed periods stay as history
+            BudgetPeriod.query.filter_by(user_id=user_id, period=budget.period, closed=False).delete()
+
+        if amount == 0: # Sentinel for removing budget
+            if budget:
+                db.session.delete(budget)
+                touch_user(user_id)
+                db.session.commit()
+                response_cache.invalidate_user(user_id)
+                flash('Budget removed successfully!', 'success')
+        else:
+            if budget:
+                budget.amount_minor = amount
+                budget.period = period
+                BudgetPeriod.query.filter_by(user_id=user_id, period=period, closed=False).update(
+                    {'budget_minor': amount}, synchronize_session=False)
+            else:
+                budget = Budget(amount_minor=amount, period=period, user_id=user_id)
+                db.session.add(budget)
+            touch_user(user_id)
+            db.session.commit()
+            response_cache.invalidate_user(user_id)
+            flash('Budget updated successfully!', 'success')
+            
+    except (ValueError, TypeError):
+        db.session.rollback()
+        flash('Invalid amount. Please enter a valid number.', 'error')
+    
+    return redirect(request.referrer or url_for('expenses.dashboard'))
+
+@bp.route('/settings/currency', methods=['POST'])
+@login_required
+def set_base_currency():
+    user = db.session.get(User, session['user_id'])
+    try:
+        currency = normalize_currency(request.form.get('currency'))
+        if currency != user.base_currency:
+            change_base_currency(user, currency)
+            flash(f'Totals, budgets and reports are now in {currency}.', 'success')
+    except MissingRateError as e:
+        db.session.rollback()
+        flash(f'{e}; the base currency was not changed.', 'error')
+    except ValueError:
+        flash('Please choose a valid currency.', 'error')
+    return redirect(request.referrer or url_for('expenses.dashboard'))
+
+# --- Recurring Expenses and Budget History ---
+@bp.route('/recurring')
+@login_required
+def list_recurring():
+    return jsonify({'recurring': [serialize_recurring(rule) for rule in get_active_recurring(session['user_id'])]})
+
+@bp.route('/recurring/<int:recurring_id>/stop', methods=['POST'])
+@login_required
+def stop_recurring(recurring_id):
+    rule = db.session.get(RecurringExpense, recurring_id)
+    if rule is None or rule.user_id != session['user_id']:
+        return jsonify({'error': 'Recurring expense not found'}), 404
+    rule.next_date = None # expenses already created stay
+    touch_user(rule.user_id)
+    db.session.commit()
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(serialize_recurring(rule))
+    flash(f"'{rule.description}' will no longer repeat.", 'success')
+    return redirect(url_for('expenses.dashboard'))
+
+@bp.route('/budget/history')
+@login_required
+def budget_history():
+    return jsonify({'history': [{
+        'period': budget_period.period,
+        'start_date': budget_period.start_date.isoformat(),
+        'end_date': budget_period.end_date.isoformat(),
+        'budget': from_minor(budget_period.budget_minor),
+        'spent': from_minor(budget_period.spent_minor),
+        'remaining': from_minor(budget_period.budget_minor - budget_period.spent_minor),
+    } for budget_period in get_budget_history(session['user_id'])]})
+
+# --- JSON API ---
+@bp.route('/api/v1/budget')
+@login_required
+def api_budget():
+    user_id = session['user_id']
+    # The budget window moves with the calendar, so the day is part of the ETag
+    today = utc_today()
+
+    def build():
+        budget = Budget.query.filter_by(user_id=user_id).first()
+        if budget is None:
+            return {'budget': None}
+        budget_period = get_budget_period(budget, today)
+        return {'budget': {
+            'currency': get_base_currency(user_id),
+            'period': budget.period,
+            'start_date': budget_period.start_date.isoformat(),
+            'end_date': budget_period.end_date.isoformat(),
+            'amount': from_minor(budget.amount_minor),
+            'spent': from_minor(budget_period.spent_minor),
+            'remaining': from_minor(budget.amount_minor - budget_period.spent_minor),
+            'percent': min(100, budget_period.spent_minor / budget.amount_minor * 100) if budget.amount_minor > 0 else 0,
+        }}
+    return conditional_json(user_id, build, today)
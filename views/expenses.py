@@ -0,0 +1,742 @@
+"""The dashboard, expenses and their splits, search, the receivables ledger, CSV upload and export, and job status."""
+import base64
+import os
+import re
+import uuid
+from datetime import date, datetime, timezone, timedelta
+
+from flask import (Blueprint, Response, current_app, flash, jsonify, redirect, render_template, request, send_file, session,
+                   stream_with_context, url_for)
+from sqlalchemy import and_, or_, case, column, select, table, text, update
+from sqlalchemy.orm import contains_eager
+
+from currency import MissingRateError, currency_symbol, to_base
+from extensions import exchange_rates, job_queue, response_cache
+from jobs import JobLimitError, SUCCEEDED
+from models import db, User, Expense, Receivable, RecurringExpense, RecurringOccurrence
+from services import (login_required, parse_date, utc_today, to_minor, from_minor, format_money, get_base_currency, available_currencies,
+                      read_currency, in_base, adjust_aggregates, expense_deltas, merge_deltas, get_user_totals, get_budget_data,
+                      get_user_tags, RECURRING_FREQUENCIES, next_occurrence, materialize_recurring, get_active_recurring,
+                      conditional_json)
+from tasks import spool_path
+
+bp = Blueprint('expenses', __name__)
+
+# --- Expense Feed Helpers ---
+def encode_cursor(expense):
+    """Encodes the (date, id) position of an expense as an opaque cursor token."""
+    raw = f"{expense.date.isoformat()}|{expense.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Decodes a cursor token back into (date, id). Raises ValueError if malformed."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        day, expense_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return date.fromisoformat(day), int(expense_id)
+    except ValueError as e: # covers bad base64, bad UTF-8, a bad date and a bad id
+        raise ValueError('Invalid cursor') from e
+
+def get_expense_page(user_id, cursor=None, limit=None):
+    """Returns one page of a user's expenses, newest first, and the cursor for the next page."""
+    limit = limit or current_app.config['EXPENSE_PAGE_SIZE']
+    query = Expense.query.filter(Expense.user_id == user_id)
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Expense.date < after_date,
+            and_(Expense.date == after_date, Expense.id < after_id)
+        ))
+    # Fetch one extra row to know whether another page exists
+    expenses = query.order_by(Expense.date.desc(), Expense.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(expenses[limit - 1]) if len(expenses) > limit else None
+    return expenses[:limit], next_cursor
+
+def serialize_expense(expense):
+    return {
+        'id': expense.id,
+        'date': expense.date.isoformat(),
+        'description': expense.description,
+        'total_amount': from_minor(expense.total_amount_minor),
+        'own_amount': from_minor(expense.own_amount_minor),
+        'currency': expense.currency,
+        'tag': expense.tag,
+        'receivables': [
+            {'id': r.id, 'person_name': r.person_name, 'amount': from_minor(r.amount_minor), 'is_paid': r.is_paid}
+            for r in expense.receivables
+        ]
+    }
+
+# --- Full-Text Search ---
+# Queries the index the triggers in models.py keep up to date.
+SEARCH_TERM = re.compile(r'\w+')
+SEARCH_MAX_TERMS = 10
+
+def search_terms(query_text):
+    return SEARCH_TERM.findall(query_text or '')[:SEARCH_MAX_TERMS]
+
+def search_expenses(user_id, query_text, tags=None, start_date=None, end_date=None,
+                    min_amount=None, max_amount=None, page=1, limit=None):
+    """Returns one page of a user's expenses matching every word of query_text as a prefix.
+
+    SQLite results are ranked by bm25 (description weighted over tag and people), then newest
+    first. Amount bounds are in minor units. Returns (expenses, has_more).
+    """
+    limit = limit or current_app.config['EXPENSE_PAGE_SIZE']
+    terms = search_terms(query_text)
+    if not terms:
+        return [], False
+    filters = []
+    if tags:
+        filters.append(Expense.tag.in_(tags))
+    if start_date:
+        filters.append(Expense.date >= start_date)
+    if end_date:
+        filters.append(Expense.date <= end_date)
+    if min_amount is not None:
+        filters.append(Expense.total_amount_minor >= min_amount)
+    if max_amount is not None:
+        filters.append(Expense.total_amount_minor <= max_amount)
+
+    if db.engine.dialect.name == 'sqlite':
+        fts = table('expense_fts', column('rowid'))
+        match = f'owner : u{user_id} AND {{description tag people}} : (' + ' '.join(f'"{term}"*' for term in terms) + ')'
+        query = select(Expense).join(fts, fts.c.rowid == Expense.id).where(
+            text("expense_fts MATCH :match").bindparams(match=match),
+            # '+ 0' hides user_id from the planner so the join is always driven by the FTS match,
+            # never by walking all of the user's expenses through ix_expense_user_date_id
+            Expense.user_id + 0 == user_id,
+            *filters
+        ).order_by(text("bm25(expense_fts, 4.0, 1.0, 2.0, 0.0)"), Expense.date.desc(), Expense.id.desc())
+    else:
+        filters.append(Expense.user_id == user_id)
+        for term in terms:
+            pattern = f'%{term}%'
+            filters.append(or_(Expense.description.ilike(pattern), Expense.tag.ilike(pattern),
+                               Expense.receivables.any(Receivable.person_name.ilike(pattern))))
+        query = select(Expense).where(*filters).order_by(Expense.date.desc(), Expense.id.desc())
+
+    # Fetch one extra row to know whether another page exists
+    expenses = db.session.execute(query.offset((page - 1) * limit).limit(limit + 1)).scalars().all()
+    return expenses[:limit], len(expenses) > limit
+
+# --- Main Routes ---
+@bp.route('/')
+def home():
+    return render_template('home.html')
+
+@bp.route('/dashboard')
+@login_required
+def dashboard():
+    user = db.session.get(User, session['user_id'])
+    if not user:
+        session.pop('user_id', None)
+        flash('Your session was invalid. Please log in again.', 'error')
+        return redirect(url_for('auth.login'))
+
+    user_expenses, next_cursor = get_expense_page(user.id)
+    total_expenses, total_owed = get_user_totals(user.id)
+
+    owed_receivables = Receivable.query.join(Expense).options(contains_eager(Receivable.expense)).filter(
+        Expense.user_id == user.id,
+        Receivable.is_paid == False
+    ).order_by(Expense.date.desc(), Expense.id.desc()).limit(current_app.config['DASHBOARD_DEBTS_LIMIT']).all()
+
+    today_date = utc_today().isoformat()
+    tag_usage = get_user_tags(user.id)
+
+    budget_data = get_budget_data(user)
+
+    return render_template('index.html',
+                           expenses=user_expenses,
+                           next_cursor=next_cursor,
+                           owed_receivables=owed_receivables,
+                           total=total_expenses,
+                           total_owed=total_owed,
+                           user=user.username,
+                           today_date=today_date,
+                           available_tags=sorted(tag_usage),
+                           tag_usage=tag_usage,
+                           budget_data=budget_data,
+                           recurring=get_active_recurring(user.id),
+                           base_currency=user.base_currency,
+                           currencies=available_currencies(user.base_currency))
+
+# --- Expense and Split Routes ---
+@bp.route('/add', methods=['POST'])
+@login_required
+def add_expense():
+    try:
+        expense_date = parse_date(request.form.get('date'))
+        description = request.form.get('description')
+        total_amount = to_minor(request.form.get('amount'))
+        tag = request.form.get('tag').strip().lower()
+        user_id = session['user_id']
+        is_split = 'is_split' in request.form
+        repeat = request.form.get('repeat', '')
+        
+        if repeat and (repeat not in RECURRING_FREQUENCIES or is_split):
+            flash('Only unsplit expenses can repeat, weekly, monthly or yearly.', 'error')
+            return redirect(url_for('expenses.dashboard'))
+        if not tag:
+            flash('Please select a tag for the expense.', 'error')
+            return redirect(url_for('expenses.dashboard'))
+        if tag not in get_user_tags(user_id):
+            flash(f"Unknown tag '{tag}'. Add it to your tags first.", 'error')
+            return redirect(url_for('expenses.dashboard'))
+        base_currency = get_base_currency(user_id)
+        currency = read_currency(request.form.get('currency'), base_currency)
+        base_rate = exchange_rates.conversion(currency, base_currency, expense_date)
+
+        new_expense = Expense(date=expense_date, description=description, total_amount_minor=total_amount, tag=tag, user_id=user_id, own_amount_minor=total_amount,
+                              currency=currency, base_rate=base_rate)
+        db.session.add(new_expense)
+        owed_amount = 0
+
+        if is_split:
+            split_names = request.form.getlist('split_names[]')
+            split_shares = request.form.getlist('split_shares[]')
+            
+            total_share_amount = 0
+            for share_str in split_shares:
+                total_share_amount += to_minor(share_str)
+
+            if total_share_amount >= total_amount:
+                flash("Total of friends' shares cannot be greater than or equal to the total amount.", 'error')
+                db.session.rollback()
+                return redirect(url_for('expenses.dashboard'))
+            
+            new_expense.own_amount_minor = total_amount - total_share_amount
+            db.session.flush()
+
+            for name, share_str in zip(split_names, split_shares):
+                if name and share_str:
+                    share = to_minor(share_str)
+                    if share <= 0:
+                        flash("All shares must be positive amounts.", 'error')
+                        db.session.rollback()
+                        return redirect(url_for('expenses.dashboard'))
+                    
+                    new_receivable = Receivable(person_name=name, amount_minor=share, is_paid=False, expense_id=new_expense.id)
+                    db.session.add(new_receivable)
+                    owed_amount += to_base(share, base_rate)
+        
+        adjust_aggregates(user_id, {(expense_date, tag): (to_base(new_expense.own_amount_minor, base_rate), 1)}, owed_amount)
+        if repeat:
+            # This expense is occurrence 0; later ones (including any already due) come from the schedule
+            rule = RecurringExpense(user_id=user_id, description=description, amount_minor=total_amount, currency=currency,
+                                    tag=tag, frequency=repeat, start_date=expense_date, occurrences=1)
+            rule.next_date = next_occurrence(rule, 1)
+            db.session.add(rule)
+            db.session.flush()
+            db.session.add(RecurringOccurrence(recurring_id=rule.id, occurrence=0, due_date=expense_date))
+        db.session.commit()
+        response_cache.invalidate_user(user_id)
+        if repeat:
+            materialize_recurring(user_id=user_id)
+        flash('Expense added successfully!', 'success')
+    except MissingRateError as e:
+        db.session.rollback()
+        flash(f'{e}.', 'error')
+    except (ValueError, TypeError):
+        db.session.rollback()
+        flash('Invalid date or amount entered. Please check your input.', 'error')
+    
+    return redirect(url_for('expenses.dashboard'))
+
+@bp.route('/delete/<int:id>')
+@login_required
+def delete_expense(id):
+    expense = Expense.query.get_or_404(id)
+    if expense.owner.id != session['user_id']:
+        flash('You can only delete your own expenses.', 'error')
+        return redirect(url_for('expenses.dashboard'))
+    day_tag_deltas, owed_delta = expense_deltas(expense, sign=-1)
+    adjust_aggregates(expense.user_id, day_tag_deltas, owed_delta)
+    db.session.delete(expense)
+    db.session.commit()
+    response_cache.invalidate_user(session['user_id'])
+    flash('Expense deleted successfully.', 'success')
+    return redirect(url_for('expenses.dashboard'))
+
+@bp.route('/mark_paid/<int:receivable_id>', methods=['POST'])
+@login_required
+def mark_receivable_paid(receivable_id):
+    receivable = Receivable.query.get_or_404(receivable_id)
+    if receivable.expense.user_id != session['user_id']:
+        flash('You do not have permission to modify this item.', 'error')
+        return redirect(url_for('expenses.dashboard'))
+    if not receivable.is_paid:
+        adjust_aggregates(receivable.expense.user_id, owed_delta=-to_base(receivable.amount_minor, receivable.expense.base_rate))
+    receivable.is_paid = True
+    db.session.commit()
+    response_cache.invalidate_user(session['user_id'])
+    flash(f"Payment from {receivable.person_name} marked as paid!", 'success')
+    return redirect(url_for('expenses.dashboard'))
+
+@bp.route('/expenses/feed')
+@bp.route('/api/v1/expenses')
+@login_required
+def expense_feed():
+    user_id = session['user_id']
+    try:
+        limit = min(int(request.args.get('limit', current_app.config['EXPENSE_PAGE_SIZE'])), current_app.config['EXPENSE_PAGE_SIZE_MAX'])
+        if limit <= 0:
+            raise ValueError('limit must be positive')
+        cursor = request.args.get('cursor')
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+
+    def build():
+        expenses, next_cursor = get_expense_page(user_id, cursor, limit)
+        return {'expenses': [serialize_expense(e) for e in expenses], 'next_cursor': next_cursor}
+    return conditional_json(user_id, build)
+
+@bp.route('/expenses/search')
+@login_required
+def expense_search():
+    query_text = request.args.get('q', '')
+    if not search_terms(query_text):
+        return jsonify({'error': 'q must contain at least one word'}), 400
+    tags = [tag.strip().lower() for tag in request.args.getlist('tag') if tag.strip()]
+    try:
+        start_date = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end_date = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+        min_amount = to_minor(request.args['min_amount']) if request.args.get('min_amount') else None
+        max_amount = to_minor(request.args['max_amount']) if request.args.get('max_amount') else None
+        page = int(request.args.get('page', 1))
+        limit = min(int(request.args.get('limit', current_app.config['EXPENSE_PAGE_SIZE'])), current_app.config['EXPENSE_PAGE_SIZE_MAX'])
+        if page <= 0 or limit <= 0:
+            raise ValueError('page and limit must be positive')
+    except ValueError:
+        return jsonify({'error': 'Invalid date, amount, page or limit'}), 400
+
+    expenses, has_more = search_expenses(session['user_id'], query_text, tags, start_date, end_date,
+                                         min_amount, max_amount, page, limit)
+    return jsonify({
+        'expenses': [serialize_expense(e) for e in expenses],
+        'page': page,
+        'next_page': page + 1 if has_more else None
+    })
+
+# --- Routes for Editing Expenses ---
+@bp.route('/expense/get/<int:expense_id>')
+@login_required
+def get_expense(expense_id):
+    expense = Expense.query.get_or_404(expense_id)
+    if expense.user_id != session['user_id']:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    receivables_data = []
+    for r in expense.receivables:
+        receivables_data.append({'person_name': r.person_name, 'amount': from_minor(r.amount_minor)})
+
+    return jsonify({
+        'id': expense.id,
+        'date': expense.date.isoformat(),
+        'description': expense.description,
+        'total_amount': from_minor(expense.total_amount_minor),
+        'currency': expense.currency,
+        'tag': expense.tag,
+        'is_split': bool(expense.receivables),
+        'receivables': receivables_data
+    })
+
+@bp.route('/expense/edit/<int:expense_id>', methods=['POST'])
+@login_required
+def edit_expense(expense_id):
+    expense = Expense.query.get_or_404(expense_id)
+    if expense.user_id != session['user_id']:
+        flash('You do not have permission to edit this expense.', 'error')
+        return redirect(url_for('expenses.dashboard'))
+
+    try:
+        tag = request.form.get('tag').strip().lower()
+        if tag not in get_user_tags(expense.user_id):
+            flash(f"Unknown tag '{tag}'. Add it to your tags first.", 'error')
+            return redirect(url_for('expenses.dashboard'))
+        base_currency = get_base_currency(expense.user_id)
+        currency = read_currency(request.form.get('currency') or expense.currency, base_currency)
+        expense_date = parse_date(request.form.get('date'))
+        base_rate = exchange_rates.conversion(currency, base_currency, expense_date)
+        old_day_tag_deltas, old_owed_delta = expense_deltas(expense, sign=-1)
+        new_owed_amount = 0
+        expense.date = expense_date
+        expense.description = request.form.get('description')
+        expense.total_amount_minor = to_minor(request.form.get('amount'))
+        expense.tag = tag
+        expense.currency = currency
+        expense.base_rate = base_rate
+        is_split = 'is_split' in request.form
+        
+        # Clear existing receivables for this expense. We'll re-add them.
+        for r in expense.receivables:
+            db.session.delete(r)
+
+        if is_split:
+            split_names = request.form.getlist('split_names[]')
+            split_shares = request.form.getlist('split_shares[]')
+            
+            total_share_amount = sum(to_minor(s) for s in split_shares if s)
+
+            if total_share_amount >= expense.total_amount_minor:
+                flash("Total of friends' shares cannot be greater than or equal to the total amount.", 'error')
+                db.session.rollback()
+                return redirect(url_for('expenses.dashboard'))
+
+            expense.own_amount_minor = expense.total_amount_minor - total_share_amount
+            
+            for name, share_str in zip(split_names, split_shares):
+                if name and share_str:
+                    share = to_minor(share_str)
+                    if share <= 0:
+                        flash("All shares must be positive amounts.", 'error')
+                        db.session.rollback()
+                        return redirect(url_for('expenses.dashboard'))
+                    new_receivable = Receivable(person_name=name, amount_minor=share, is_paid=False, expense_id=expense.id)
+                    db.session.add(new_receivable)
+                    new_owed_amount += to_base(share, base_rate)
+        else:
+             expense.own_amount_minor = expense.total_amount_minor
+
+        day_tag_deltas = merge_deltas(old_day_tag_deltas,
+                                      {(expense.date, expense.tag): (to_base(expense.own_amount_minor, base_rate), 1)})
+        adjust_aggregates(expense.user_id, day_tag_deltas, old_owed_delta + new_owed_amount)
+        db.session.commit()
+        response_cache.invalidate_user(expense.user_id)
+        flash('Expense updated successfully!', 'success')
+    except MissingRateError as e:
+        db.session.rollback()
+        flash(f'{e}.', 'error')
+    except (ValueError, TypeError):
+        db.session.rollback()
+        flash('Invalid data provided. Please check the date and amounts.', 'error')
+    return redirect(url_for('expenses.dashboard'))
+
+# --- Receivables Ledger ---
+# (label, minimum age in days, maximum age in days) of an unpaid split, aged from the expense date.
+# A future-dated expense has age 0, so the buckets always add up to the outstanding balance.
+LEDGER_AGE_BUCKETS = (('0-30', 0, 30), ('31-60', 31, 60), ('61-90', 61, 90), ('90+', 91, None))
+LEDGER_HISTORY_LIMIT = 200
+
+def get_ledger(user_id, today=None):
+    """Per-person balances, aged unpaid amounts and activity dates from a single grouped query.
+
+    Amounts are in minor units of the base currency. People with the largest outstanding balance come first.
+    """
+    today = today or utc_today()
+    unpaid = Receivable.is_paid == False
+    amount = in_base(Receivable.amount_minor)
+    bucket_columns = []
+    for label, min_age, max_age in LEDGER_AGE_BUCKETS:
+        conditions = [unpaid]
+        if min_age:
+            conditions.append(Expense.date <= today - timedelta(days=min_age))
+        if max_age is not None:
+            conditions.append(Expense.date >= today - timedelta(days=max_age))
+        bucket_columns.append(db.func.sum(case((and_(*conditions), amount), else_=0)).label(label))
+
+    outstanding = db.func.sum(case((unpaid, amount), else_=0))
+    rows = db.session.query(
+        Receivable.person_name,
+        outstanding.label('outstanding'),
+        db.func.sum(case((unpaid, 0), else_=amount)).label('settled'),
+        db.func.count(Receivable.id).label('splits'),
+        db.func.sum(case((unpaid, 1), else_=0)).label('open_splits'),
+        db.func.min(case((unpaid, Expense.date))).label('oldest_unpaid'),
+        db.func.max(Expense.date).label('last_split'),
+        *bucket_columns
+    ).join(Expense, Receivable.expense_id == Expense.id).filter(
+        Expense.user_id == user_id
+    ).group_by(Receivable.person_name).order_by(outstanding.desc(), Receivable.person_name).all()
+
+    return [{
+        'person_name': row.person_name,
+        'outstanding': row.outstanding,
+        'settled': row.settled,
+        'splits': row.splits,
+        'open_splits': row.open_splits,
+        'oldest_unpaid': row.oldest_unpaid,
+        'last_split': row.last_split,
+        'aged': {label: getattr(row, label) for label, _, _ in LEDGER_AGE_BUCKETS},
+    } for row in rows]
+
+def get_person_history(user_id, person_name, limit=None):
+    """A person's splits with this user, newest first."""
+    limit = limit or LEDGER_HISTORY_LIMIT
+    return db.session.query(Receivable, Expense).join(Expense, Receivable.expense_id == Expense.id).filter(
+        Expense.user_id == user_id,
+        Receivable.person_name == person_name
+    ).order_by(Expense.date.desc(), Receivable.id.desc()).limit(limit).all()
+
+def settle_receivables(user_id, person_name=None, receivable_ids=None):
+    """Marks a user's unpaid receivables paid in one UPDATE, by person and/or id.
+
+    Returns (count, amount_minor) of what was settled, in the base currency; the caller commits.
+    """
+    if person_name is None and not receivable_ids:
+        return 0, 0
+    stmt = update(Receivable).where(
+        Receivable.is_paid == False,
+        Receivable.expense_id.in_(select(Expense.id).where(Expense.user_id == user_id))
+    )
+    if person_name is not None:
+        stmt = stmt.where(Receivable.person_name == person_name)
+    if receivable_ids:
+        stmt = stmt.where(Receivable.id.in_(receivable_ids))
+    base_rate = select(Expense.base_rate).where(Expense.id == Receivable.expense_id).scalar_subquery()
+    settled = [to_base(amount, rate) for amount, rate in db.session.execute(
+        stmt.values(is_paid=True).returning(Receivable.amount_minor, base_rate),
+        execution_options={'synchronize_session': False}
+    )]
+    if settled:
+        adjust_aggregates(user_id, owed_delta=-sum(settled))
+    return len(settled), sum(settled)
+
+def serialize_ledger_entry(entry):
+    return {
+        'person_name': entry['person_name'],
+        'outstanding': from_minor(entry['outstanding']),
+        'settled': from_minor(entry['settled']),
+        'splits': entry['splits'],
+        'open_splits': entry['open_splits'],
+        'oldest_unpaid': entry['oldest_unpaid'].isoformat() if entry['oldest_unpaid'] else None,
+        'last_split': entry['last_split'].isoformat() if entry['last_split'] else None,
+        'aged': {label: from_minor(amount) for label, amount in entry['aged'].items()},
+    }
+
+@bp.route('/ledger')
+@login_required
+def ledger():
+    user = db.session.get(User, session['user_id'])
+    if not user:
+        session.pop('user_id', None)
+        flash('Your session was invalid. Please log in again.', 'error')
+        return redirect(url_for('auth.login'))
+
+    entries = get_ledger(user.id)
+    return render_template('ledger.html',
+                           user=user.username,
+                           base_currency=user.base_currency,
+                           entries=entries,
+                           age_buckets=[label for label, _, _ in LEDGER_AGE_BUCKETS],
+                           total_outstanding=sum(entry['outstanding'] for entry in entries),
+                           people_owing=sum(1 for entry in entries if entry['outstanding']))
+
+@bp.route('/ledger/data')
+@login_required
+def ledger_data():
+    entries = get_ledger(session['user_id'])
+    return jsonify({
+        'people': [serialize_ledger_entry(entry) for entry in entries],
+        'total_outstanding': from_minor(sum(entry['outstanding'] for entry in entries)),
+        'currency': get_base_currency(session['user_id']),
+        'age_buckets': [label for label, _, _ in LEDGER_AGE_BUCKETS]
+    })
+
+@bp.route('/ledger/history')
+@login_required
+def ledger_history():
+    person_name = request.args.get('person', '')
+    if not person_name:
+        return jsonify({'error': 'Missing person'}), 400
+    try:
+        limit = min(int(request.args.get('limit', LEDGER_HISTORY_LIMIT)), LEDGER_HISTORY_LIMIT)
+        if limit <= 0:
+            raise ValueError('limit must be positive')
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    history = get_person_history(session['user_id'], person_name, limit)
+    return jsonify({
+        'person_name': person_name,
+        'history': [{
+            'id': receivable.id,
+            'expense_id': expense.id,
+            'date': expense.date.isoformat(),
+            'description': expense.description,
+            'tag': expense.tag,
+            'amount': from_minor(receivable.amount_minor),
+            'currency': expense.currency,
+            'is_paid': receivable.is_paid
+        } for receivable, expense in history]
+    })
+
+@bp.route('/ledger/settle', methods=['POST'])
+@login_required
+def ledger_settle():
+    """Settles every unpaid split of one person, or a list of receivable ids, in one statement."""
+    payload = request.get_json(silent=True) if request.is_json else None
+    wants_json = payload is not None or request.accept_mimetypes.best == 'application/json'
+    if payload is not None:
+        # {"person": name} and/or {"ids": [receivable id, ...]}; anything else is a 400
+        if not isinstance(payload, dict):
+            payload = {}
+        person_name = payload.get('person')
+        raw_ids = payload.get('ids', [])
+        if not (isinstance(person_name, (str, type(None))) and isinstance(raw_ids, list)
+                and all(type(raw_id) is int for raw_id in raw_ids)):
+            raw_ids = None
+    else:
+        person_name = request.form.get('person')
+        raw_ids = request.form.getlist('ids[]') or request.form.getlist('ids')
+    try:
+        receivable_ids = [int(raw_id) for raw_id in raw_ids]
+    except (TypeError, ValueError):
+        receivable_ids = None
+    if receivable_ids is None or (not person_name and not receivable_ids):
+        if wants_json:
+            return jsonify({'error': 'Give a person or a list of receivable ids'}), 400
+        flash('Nothing to settle.', 'error')
+        return redirect(url_for('expenses.ledger'))
+
+    count, amount = settle_receivables(session['user_id'], person_name or None, receivable_ids)
+    db.session.commit()
+    if count:
+        response_cache.invalidate_user(session['user_id'])
+
+    if wants_json:
+        return jsonify({'settled': count, 'amount': from_minor(amount)})
+    if count:
+        symbol = currency_symbol(get_base_currency(session['user_id']))
+        flash(f"Settled {count} split{'s' if count != 1 else ''} worth {symbol}{format_money(amount)}.", 'success')
+    else:
+        flash('Nothing was left to settle.', 'error')
+    return redirect(url_for('expenses.ledger'))
+
+# --- CSV Upload Route ---
+@bp.route('/upload', methods=['POST'])
+@login_required
+def upload_csv():
+    wants_json = request.accept_mimetypes.best == 'application/json'
+
+    def reject(message):
+        if wants_json:
+            return jsonify({'error': message}), 400
+        flash(message, 'error')
+        return redirect(url_for('expenses.dashboard'))
+
+    if 'csv_file' not in request.files:
+        return reject('No file part')
+    file = request.files['csv_file']
+    if file.filename == '':
+        return reject('No selected file')
+    if file and file.filename.endswith('.csv'):
+        # The import itself runs as a background job; the request only spools the file
+        path = spool_path(f'upload-{uuid.uuid4().hex}.csv')
+        file.save(path)
+        try:
+            job_id = job_queue.enqueue('import_csv', session['user_id'], {'path': path, 'filename': file.filename})
+        except JobLimitError as e:
+            os.remove(path)
+            if wants_json:
+                return jsonify({'error': str(e)}), 429
+            flash(str(e), 'error')
+            return redirect(url_for('expenses.dashboard'))
+
+        if wants_json:
+            return jsonify({'job_id': job_id, 'status_url': url_for('expenses.job_status', job_id=job_id)}), 202
+        flash('Your CSV is being imported in the background. Refresh in a moment to see the new expenses.', 'success')
+        return redirect(url_for('expenses.dashboard'))
+    else:
+        return reject('Invalid file type. Please upload a .csv file.')
+
+# --- Export Route ---
+@bp.route('/export')
+@login_required
+def export_expenses():
+    export_format = request.args.get('format', 'csv')
+    start_date = request.args.get('start')
+    end_date = request.args.get('end')
+    tags = [tag.strip().lower() for tag in request.args.getlist('tag') if tag.strip()]
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        start_date = date.fromisoformat(start_date) if start_date else None
+        end_date = date.fromisoformat(end_date) if end_date else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
+    if request.args.get('background') == '1':
+        # Written to a file by a job instead; poll the status URL for the download link
+        payload = {'format': export_format, 'tags': tags,
+                   'start': start_date.isoformat() if start_date else None,
+                   'end': end_date.isoformat() if end_date else None}
+        try:
+            job_id = job_queue.enqueue('export', session['user_id'], payload)
+        except JobLimitError as e:
+            return jsonify({'error': str(e)}), 429
+        return jsonify({'job_id': job_id, 'status_url': url_for('expenses.job_status', job_id=job_id)}), 202
+
+    from csv_io import iter_export_rows, export_lines, export_filename # loaded on first use, see csv_io.py
+    rows = iter_export_rows(session['user_id'], start_date, end_date, tags)
+    lines, mimetype, extension = export_lines(rows, export_format)
+    return Response(stream_with_context(lines), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{export_filename(extension)}"'})
+
+# --- Job Status Routes ---
+def iso_timestamp(value):
+    return datetime.fromtimestamp(value, timezone.utc).isoformat() if value else None
+
+def serialize_job(job):
+    result = dict(job['result'] or {})
+    result.pop('file', None) # server path, not for clients
+    data = {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'processed': job['processed'],
+        'total': job['total'],
+        'cancel_requested': job['cancel_requested'],
+        'result': result or None,
+        'error': job['error'],
+        'created_at': iso_timestamp(job['created_at']),
+        'started_at': iso_timestamp(job['started_at']),
+        'finished_at': iso_timestamp(job['finished_at']),
+        'status_url': url_for('expenses.job_status', job_id=job['id']),
+    }
+    if job['kind'] == 'export' and job['status'] == SUCCEEDED:
+        data['download_url'] = url_for('expenses.job_download', job_id=job['id'])
+    return data
+
+def get_user_job(job_id):
+    """The job if it belongs to the logged-in user, else None."""
+    job = job_queue.get(job_id)
+    if job is None or job['user_id'] != session['user_id']:
+        return None
+    return job
+
+@bp.route('/jobs')
+@login_required
+def list_jobs():
+    return jsonify({'jobs': [serialize_job(job) for job in job_queue.list_for_user(session['user_id'])]})
+
+@bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    job = get_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(serialize_job(job))
+
+@bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    if get_user_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(serialize_job(job_queue.cancel(job_id)))
+
+@bp.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    job = get_user_job(job_id)
+    if job is None or job['kind'] != 'export':
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != SUCCEEDED:
+        return jsonify({'error': f"Export is {job['status']}"}), 409
+    result = job['result']
+    if not os.path.exists(result['file']):
+        return jsonify({'error': 'Export file has expired'}), 410
+    return send_file(result['file'], mimetype=result['mimetype'], as_attachment=True, download_name=result['filename'])
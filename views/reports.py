@@ -0,0 +1,252 @@
+"""The reports page, spend series and comparisons, and the summary and chart APIs."""
+from datetime import date, timedelta
+
+from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, session, url_for
+
+from extensions import job_queue, response_cache
+from jobs import JobLimitError
+from models import db, User, DailyTagTotal
+from services import (login_required, utc_today, from_minor, get_base_currency, get_budget_data, get_budget_history, get_user_totals,
+                      get_tag_totals, load_user_tags, conditional_json)
+
+bp = Blueprint('reports', __name__)
+
+# --- Reports Page ---
+@bp.route('/reports')
+@login_required
+def reports():
+    user = db.session.get(User, session['user_id'])
+    if not user:
+        session.pop('user_id', None)
+        flash('Your session was invalid. Please log in again.', 'error')
+        return redirect(url_for('auth.login'))
+
+    def build_report():
+        # Calculate budget overview data
+        budget_data = get_budget_data(user)
+        del budget_data['budget_obj']
+        budget_history = [
+            {'period': p.period, 'start_date': p.start_date.isoformat(), 'end_date': p.end_date.isoformat(),
+             'budget_minor': p.budget_minor, 'spent_minor': p.spent_minor}
+            for p in get_budget_history(user.id)
+        ]
+        return {'budget_data': budget_data, 'budget_history': budget_history}
+
+    # The budget window moves with the calendar, so the day is part of the key
+    today = utc_today().isoformat()
+    report = response_cache.get_or_compute('reports', user.id, {'today': today}, build_report)
+    budget_data = dict(report['budget_data'], budget_obj=user.budget)
+
+    # The breakdown chart fetches its data from /api/v1/chart after the page loads
+    return render_template('reports.html', 
+                           user=user.username, 
+                           base_currency=user.base_currency,
+                           budget_data=budget_data,
+                           budget_history=report['budget_history'])
+
+# --- Comparison API Route ---
+SERIES_GRANULARITIES = ('day', 'week', 'month', 'year')
+
+def period_bucket(granularity, column):
+    """SQL expression labelling a date with its day/week/month/year bucket ('YYYY-MM-DD', 'YYYY-MM' or 'YYYY').
+
+    Weeks are labelled by their Monday.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        formats = {'day': 'YYYY-MM-DD', 'week': 'YYYY-MM-DD', 'month': 'YYYY-MM', 'year': 'YYYY'}
+        return db.func.to_char(db.func.date_trunc(granularity, column), formats[granularity])
+    if granularity == 'week':
+        return db.func.date(column, 'weekday 0', '-6 days')
+    formats = {'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}
+    return db.func.strftime(formats[granularity], column)
+
+def bucket_start(granularity, day):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+def shift_bucket(granularity, day, steps):
+    """Moves a bucket start by a number of buckets (negative steps go back)."""
+    if granularity == 'day':
+        return day + timedelta(days=steps)
+    if granularity == 'week':
+        return day + timedelta(weeks=steps)
+    if granularity == 'month':
+        month_index = day.year * 12 + day.month - 1 + steps
+        return day.replace(year=month_index // 12, month=month_index % 12 + 1)
+    return day.replace(year=day.year + steps)
+
+def bucket_label(granularity, day):
+    return day.strftime({'month': '%Y-%m', 'year': '%Y'}.get(granularity, '%Y-%m-%d'))
+
+def build_series(labels, rows):
+    """Turns (position, tag, amount_minor) rows into chart-ready series aligned with labels."""
+    series, totals = {}, [0] * len(labels)
+    for i, tag, amount in rows:
+        if i is None or not 0 <= i < len(labels):
+            continue
+        series.setdefault(tag, [0] * len(labels))[i] += amount
+        totals[i] += amount
+    return {
+        'labels': labels,
+        'tags': sorted(series),
+        'series': {tag: [from_minor(amount) for amount in amounts] for tag, amounts in sorted(series.items())},
+        'totals': [from_minor(amount) for amount in totals]
+    }
+
+def get_periods_series(user_id, periods):
+    """Per-tag spend for N arbitrary (start, end) periods, answered by one UNION ALL of grouped scans.
+
+    Periods may overlap or repeat; each is labelled 'start/end', and each branch carries its
+    period's position so repeated periods keep their own column.
+    """
+    labels = [f'{start.isoformat()}/{end.isoformat()}' for start, end in periods]
+    selects = [
+        db.select(db.literal(i).label('bucket'), DailyTagTotal.tag, db.func.sum(DailyTagTotal.amount_minor))
+        .where(DailyTagTotal.user_id == user_id, DailyTagTotal.day >= start, DailyTagTotal.day <= end)
+        .group_by(DailyTagTotal.tag)
+        for i, (start, end) in enumerate(periods)
+    ]
+    rows = db.session.execute(db.union_all(*selects)).all() if selects else []
+    return build_series(labels, rows)
+
+def get_rolling_series(user_id, granularity, start, end):
+    """Per-tag spend bucketed by day/week/month/year between start and end, from one GROUP BY query."""
+    bucket = period_bucket(granularity, DailyTagTotal.day).label('bucket')
+    rows = db.session.query(bucket, DailyTagTotal.tag, db.func.sum(DailyTagTotal.amount_minor)).filter(
+        DailyTagTotal.user_id == user_id,
+        DailyTagTotal.day >= start,
+        DailyTagTotal.day <= end
+    ).group_by(bucket, DailyTagTotal.tag).all()
+
+    labels, current = [], bucket_start(granularity, start)
+    while current <= end:
+        labels.append(bucket_label(granularity, current))
+        current = shift_bucket(granularity, current, 1)
+    positions = {label: i for i, label in enumerate(labels)}
+    return build_series(labels, [(positions.get(label), tag, amount) for label, tag, amount in rows])
+
+def get_period_data(series, index):
+    """Picks one period out of a series as {'total', 'by_tag'}."""
+    return {
+        'total': series['totals'][index],
+        'by_tag': {tag: amounts[index] for tag, amounts in series['series'].items() if amounts[index]}
+    }
+
+@bp.route('/get_series_data')
+@login_required
+def get_series_data():
+    """Chart-ready spend series, either for explicit periods (?period=start/end, repeatable)
+    or rolling buckets (?granularity=day|week|month|year[&start=...&end=...])."""
+    user_id = session['user_id']
+    raw_periods = request.args.getlist('period')
+    granularity = request.args.get('granularity')
+    max_buckets = current_app.config['SERIES_MAX_BUCKETS']
+
+    try:
+        if raw_periods:
+            periods = []
+            for raw in raw_periods:
+                start, end = (date.fromisoformat(part) for part in raw.split('/'))
+                if start > end:
+                    raise ValueError('Period start is after its end')
+                periods.append((start, end))
+        elif granularity in SERIES_GRANULARITIES:
+            end = date.fromisoformat(request.args['end']) if request.args.get('end') else utc_today()
+            default_start = shift_bucket(granularity, bucket_start(granularity, end), -(current_app.config['SERIES_DEFAULT_BUCKETS'] - 1))
+            start = date.fromisoformat(request.args['start']) if request.args.get('start') else default_start
+            if start > end:
+                raise ValueError('start is after end')
+        else:
+            return jsonify({'error': 'Pass period=start/end or granularity=day|week|month|year'}), 400
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD and periods start/end'}), 400
+
+    if raw_periods:
+        if len(periods) > max_buckets:
+            return jsonify({'error': f'At most {max_buckets} periods per request'}), 400
+        params = {'periods': periods}
+        compute = lambda: get_periods_series(user_id, periods)
+    else:
+        if shift_bucket(granularity, bucket_start(granularity, start), max_buckets) <= end:
+            return jsonify({'error': f'At most {max_buckets} buckets per request'}), 400
+        params = {'granularity': granularity, 'start': start, 'end': end}
+        compute = lambda: get_rolling_series(user_id, granularity, start, end)
+    return jsonify(response_cache.get_or_compute('series', user_id, params, compute))
+
+@bp.route('/get_comparison_data')
+@login_required
+def get_comparison_data():
+    user_id = session['user_id']
+    
+    p1_start = request.args.get('p1_start')
+    p1_end = request.args.get('p1_end')
+    p2_start = request.args.get('p2_start')
+    p2_end = request.args.get('p2_end')
+
+    if not all([p1_start, p1_end, p2_start, p2_end]):
+        return jsonify({'error': 'Missing date parameters'}), 400
+    try:
+        p1_start, p1_end, p2_start, p2_end = (date.fromisoformat(d) for d in (p1_start, p1_end, p2_start, p2_end))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
+    periods = [(p1_start, p1_end), (p2_start, p2_end)]
+    series = response_cache.get_or_compute('series', user_id, {'periods': periods},
+                                           lambda: get_periods_series(user_id, periods))
+    return jsonify({
+        'period1': get_period_data(series, 0),
+        'period2': get_period_data(series, 1)
+    })
+
+@bp.route('/cache/stats')
+@login_required
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+# --- JSON API ---
+@bp.route('/api/v1/summary')
+@login_required
+def api_summary():
+    user_id = session['user_id']
+
+    def build():
+        total_spent, outstanding = get_user_totals(user_id)
+        tags = load_user_tags(user_id)
+        return {
+            'currency': get_base_currency(user_id),
+            'total_spent': from_minor(total_spent),
+            'outstanding': from_minor(outstanding),
+            'expense_count': sum(tags.values()),
+            'tags': tags,
+        }
+    return conditional_json(user_id, build)
+
+@bp.route('/api/v1/chart')
+@login_required
+def api_chart():
+    """Own spend per tag, optionally between start and end (YYYY-MM-DD, inclusive)."""
+    user_id = session['user_id']
+    try:
+        start, end = (date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                      for name in ('start', 'end'))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    return conditional_json(user_id, lambda: {
+        'currency': get_base_currency(user_id),
+        'totals': {tag: from_minor(amount) for tag, amount in get_tag_totals(user_id, start, end).items()}
+    })
+
+# --- Background Rebuild ---
+@bp.route('/aggregates/rebuild', methods=['POST'])
+@login_required
+def rebuild_aggregates_job():
+    try:
+        job_id = job_queue.enqueue('rebuild_aggregates', session['user_id'])
+    except JobLimitError as e:
+        return jsonify({'error': str(e)}), 429
+    return jsonify({'job_id': job_id, 'status_url': url_for('expenses.job_status', job_id=job_id)}), 202
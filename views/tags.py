@@ -0,0 +1,53 @@
+"""Adding and deleting a user's tags."""
+from flask import Blueprint, jsonify, request, session
+from sqlalchemy.exc import IntegrityError
+
+from extensions import response_cache
+from models import db, Tag, DailyTagTotal
+from services import login_required, touch_user, get_user_tags, tags_response
+
+bp = Blueprint('tags', __name__)
+
+# --- Tag Management API Routes ---
+@bp.route('/tags/add', methods=['POST'])
+@login_required
+def add_tag():
+    tag_name = request.json.get('tag_name', '').strip().lower()
+    user_id = session['user_id']
+    if not tag_name: return jsonify({'success': False, 'message': 'Tag name cannot be empty.'})
+    if tag_name in get_user_tags(user_id): return jsonify({'success': False, 'message': f"Tag '{tag_name}' already exists."})
+    # Normally 0; counts expenses left behind with this tag by older versions
+    in_use = db.session.query(db.func.sum(DailyTagTotal.expense_count)).filter(
+        DailyTagTotal.user_id == user_id, DailyTagTotal.tag == tag_name
+    ).scalar() or 0
+    db.session.add(Tag(name=tag_name, user_id=user_id, expense_count=in_use))
+    touch_user(user_id)
+    try:
+        db.session.commit()
+    except IntegrityError: # added by a concurrent request
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f"Tag '{tag_name}' already exists."})
+    response_cache.invalidate_user(user_id)
+    return tags_response(user_id, f"Tag '{tag_name}' added.")
+
+@bp.route('/tags/delete', methods=['POST'])
+@login_required
+def delete_tag():
+    tag_name = request.json.get('tag_name', '').strip().lower()
+    user_id = session['user_id']
+    tags = get_user_tags(user_id)
+
+    if tag_name not in tags:
+        return jsonify({'success': False, 'message': 'Tag not found.'})
+    if tags[tag_name]:
+        return jsonify({'success': False, 'message': f"Cannot delete tag '{tag_name}' as it's currently in use."})
+
+    # The count is checked again in SQL, in case an expense took the tag since the registry loaded
+    deleted = Tag.query.filter(Tag.user_id == user_id, Tag.name == tag_name, Tag.expense_count == 0).delete()
+    if deleted:
+        touch_user(user_id)
+    db.session.commit()
+    response_cache.invalidate_user(user_id)
+    if not deleted:
+        return jsonify({'success': False, 'message': f"Cannot delete tag '{tag_name}' as it's currently in use."})
+    return tags_response(user_id, f"Tag '{tag_name}' deleted.")